@@ -0,0 +1,311 @@
+import math
+import os
+import random
+import struct
+import sys
+import threading
+import time
+from array import array
+from collections import Counter
+from itertools import compress
+
+DEFAULT_HISTORY_PATH = "data/cache/answers.bin"
+RECORD = struct.Struct("<dIIBf")  # answered at, species id, xc id number, correct, response time in seconds
+ANSWERED_AT, SPECIES_ID, CORRECT, RESPONSE_SECONDS = 0, 8, 16, 17  # byte offsets of the RECORD fields
+INCORRECT = bytes([1] + [0] * 255)  # translation table from a correct byte to 1 for a wrong answer
+RECENCY_SCALE = 24 * 60 * 60  # seconds after which a species has mostly recovered its weight after being asked
+REWEIGHT_INTERVAL = 60 * 60  # recency weights of unchanged species are recomputed at most this often
+MIN_WEIGHT = 0.02  # well-known, just-asked species still come up now and then
+
+
+def species_names_path(history_path: str) -> str:
+    return os.path.splitext(history_path)[0] + ".species.txt"
+
+
+def record_column(data: bytes, offset: int, typecode: str) -> array:
+    """
+    :param data: whole RECORDs
+    :param offset: byte offset of a field in RECORD
+    :param typecode: array typecode of the field
+    :return column: the field of every record
+    """
+    column = array(typecode)
+    width = column.itemsize
+    values = bytearray(len(data) // RECORD.size * width)
+    for byte in range(width):
+        values[byte::width] = data[offset + byte::RECORD.size]
+    column.frombytes(values)
+    if sys.byteorder == "big":  # records are little-endian
+        column.byteswap()
+    return column
+
+
+class AnswerHistory:
+    """
+    Append-only log of quiz answers. Every answer is one fixed size record in a binary file, and
+    species are stored as ids into a separate append-only file of scientific names. Per-species
+    aggregates (attempts, errors, last answer time, total response time) are kept in parallel
+    arrays. When the log is first read every field is sliced out of the records as one column, so
+    most of the work is done in C, and after that the aggregates are updated in O(1) per answer.
+    """
+
+    def __init__(self, path: str = DEFAULT_HISTORY_PATH):
+        self.path = path
+        self.species_ids = {}
+        self.species_names = []
+        self.attempts = array("I")
+        self.errors = array("I")
+        self.last_answered = array("d")
+        self.response_seconds = array("d")
+        self.answer_log = array("I")  # species id of every answer, in order
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            with open(species_names_path(self.path), "r", encoding="utf-8") as f:
+                for name in f.read().splitlines():
+                    self._add_species(name)
+            with open(self.path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return
+        data = data[:len(data) - len(data) % RECORD.size]  # ignore a record cut short by a crash
+        self._aggregate_columns(data)
+
+    def _aggregate_columns(self, data: bytes):
+        """Computes the aggregates of all records in data at once, the same as _aggregate() on each of them."""
+        species_ids = record_column(data, SPECIES_ID, "I")
+        incorrect = data[CORRECT::RECORD.size].translate(INCORRECT)
+        answered_at = record_column(data, ANSWERED_AT, "d")
+        response_seconds = record_column(data, RESPONSE_SECONDS, "f")
+        if species_ids and max(species_ids) >= len(self.species_names):  # names file lost its last lines
+            valid = [species_id < len(self.species_names) for species_id in species_ids]
+            species_ids = array("I", compress(species_ids, valid))
+            incorrect = bytes(compress(incorrect, valid))
+            answered_at = compress(answered_at, valid)
+            response_seconds = compress(response_seconds, valid)
+        for species_id, count in Counter(species_ids).items():
+            self.attempts[species_id] = count
+        for species_id, count in Counter(compress(species_ids, incorrect)).items():
+            self.errors[species_id] = count
+        last_answered, total_seconds = self.last_answered, self.response_seconds
+        for species_id, at, seconds in zip(species_ids, answered_at, response_seconds):
+            total_seconds[species_id] += seconds
+            if at > last_answered[species_id]:
+                last_answered[species_id] = at
+        self.answer_log = species_ids
+
+    def _add_species(self, name: str) -> int:
+        species_id = len(self.species_names)
+        self.species_ids[name] = species_id
+        self.species_names.append(name)
+        self.attempts.append(0)
+        self.errors.append(0)
+        self.last_answered.append(0.0)
+        self.response_seconds.append(0.0)
+        return species_id
+
+    def _aggregate(self, answered_at: float, species_id: int, correct: bool, response_seconds: float):
+        self.attempts[species_id] += 1
+        self.errors[species_id] += not correct
+        self.last_answered[species_id] = max(self.last_answered[species_id], answered_at)
+        self.response_seconds[species_id] += response_seconds
+        self.answer_log.append(species_id)
+
+    def __len__(self):
+        with self._lock:
+            self._load()
+            return len(self.answer_log)
+
+    def record(self, species: str, xc_id: str, correct: bool, response_seconds: float,
+               answered_at: float | None = None):
+        """
+        :param species: scientific name of the species asked
+        :param xc_id: Xeno-Canto id of the recording played, e.g. "XC12345"
+        :param correct: whether the answer was accepted
+        :param response_seconds: time from the clip becoming playable to the answer
+        :param answered_at: time of the answer, now if not given
+        """
+        answered_at = time.time() if answered_at is None else answered_at
+        xc_number = int(xc_id[2:]) if xc_id and xc_id[2:].isdigit() else 0
+        with self._lock:
+            self._load()
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            species_id = self.species_ids.get(species)
+            if species_id is None:
+                species_id = self._add_species(species)
+                with open(species_names_path(self.path), "a", encoding="utf-8") as f:
+                    f.write(species + "\n")
+            with open(self.path, "ab") as f:
+                f.write(RECORD.pack(answered_at, species_id, xc_number, bool(correct), response_seconds))
+            self._aggregate(answered_at, species_id, correct, response_seconds)
+
+    def stats(self, species: str) -> dict | None:
+        """
+        :param species: scientific name of a species
+        :return stats: number of attempts and errors, time of the last answer and mean response time,
+                       None if never asked
+        """
+        with self._lock:
+            self._load()
+            species_id = self.species_ids.get(species)
+            if species_id is None:
+                return None
+            attempts = self.attempts[species_id]
+            return {"attempts": attempts, "errors": self.errors[species_id],
+                    "last_answered": self.last_answered[species_id],
+                    "mean_response_seconds": self.response_seconds[species_id] / attempts if attempts else 0.0}
+
+    def weight(self, species: str, now: float) -> float:
+        """
+        Sampling weight of a species: its smoothed error rate, lowered for species answered recently.
+        Species never asked get the weight of a species with a 50 % error rate asked long ago.
+        """
+        species_id = self.species_ids.get(species)
+        if species_id is None:
+            return 0.5
+        error_rate = (self.errors[species_id] + 1) / (self.attempts[species_id] + 2)
+        recency = 1 - math.exp(-max(now - self.last_answered[species_id], 0) / RECENCY_SCALE)
+        return max(error_rate * recency, MIN_WEIGHT)
+
+    def weights(self, species: list[str], now: float) -> list[float]:
+        """
+        :param species: scientific names of species
+        :return weights: weight() of every species, computed from one consistent state of the log
+        """
+        with self._lock:
+            self._load()
+            return [self.weight(name, now) for name in species]
+
+    def answered_since(self, answer_count: int) -> tuple[set[str], int]:
+        """
+        :param answer_count: number of answers already seen, e.g. returned by an earlier call
+        :return answered: scientific names of the species answered after the first answer_count answers,
+                          and the number of answers in the log now
+        """
+        with self._lock:
+            self._load()
+            species_ids = set(self.answer_log[answer_count:])
+            return {self.species_names[species_id] for species_id in species_ids}, len(self.answer_log)
+
+
+class AliasTable:
+    """Walker's alias method: O(n) to build, O(1) per weighted draw."""
+
+    __slots__ = ("probability", "alias")
+
+    def __init__(self, weights: list[float]):
+        n = len(weights)
+        total = sum(weights)
+        self.probability = [0.0] * n
+        self.alias = [0] * n
+        if n == 0 or total <= 0:
+            return
+        scaled = [w * n / total for w in weights]
+        small = [i for i, p in enumerate(scaled) if p < 1]
+        large = [i for i, p in enumerate(scaled) if p >= 1]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self.probability[less] = scaled[less]
+            self.alias[less] = more
+            scaled[more] -= 1 - scaled[less]
+            (small if scaled[more] < 1 else large).append(more)
+        for i in small + large:
+            self.probability[i] = 1.0
+
+    def __len__(self):
+        return len(self.probability)
+
+    def draw(self, rng=random) -> int:
+        i = rng.randrange(len(self.probability))
+        return i if rng.random() < self.probability[i] else self.alias[i]
+
+
+class HistorySampler:
+    """
+    Weighted sampling of quiz species from an AnswerHistory. Weights of all indexed species and an
+    alias table are kept between quizzes, and only the weights of species answered since the last
+    draw are recomputed.
+
+    The table is built over upper bounds of the weights, and a drawn species is kept with
+    probability weight / bound, so draws follow the current weights. Answering a species lowers
+    its weight, because it was just asked, so after a quiz the table is usually still valid. It is
+    rebuilt in O(n) only when a weight rises above its bound, when more than half of the draws
+    would be thrown away, and at the periodic reweight.
+    """
+
+    def __init__(self, species_index, history: AnswerHistory):
+        self.species_index = species_index
+        self.history = history
+        self.keys = [species.correct_answers["sciName"] for species in species_index.species]
+        self.positions = {}
+        for i, key in enumerate(self.keys):
+            self.positions.setdefault(key, []).append(i)
+        self.weights = None
+        self.bounds = None  # weights the table was built from
+        self.total_weight = 0.0
+        self.total_bound = 0.0
+        self.table = None
+        self._seen_answers = 0
+        self._weighted_at = 0.0
+
+    def _refresh(self):
+        now = time.time()
+        answered, answer_count = self.history.answered_since(self._seen_answers)
+        if self.weights is None or now - self._weighted_at > REWEIGHT_INTERVAL:
+            self.weights = self.history.weights(self.keys, now)  # answers recorded meanwhile are redone next time
+            self._weighted_at = now
+            self.table = None
+        else:
+            changed = [i for name in answered for i in self.positions.get(name, ())]
+            for i, weight in zip(changed, self.history.weights([self.keys[i] for i in changed], now)):
+                self.total_weight += weight - self.weights[i]
+                self.weights[i] = weight
+                if weight > self.bounds[i]:
+                    self.table = None
+            if self.total_weight * 2 < self.total_bound:
+                self.table = None
+        self._seen_answers = answer_count
+        if self.table is None:
+            self.bounds = list(self.weights)
+            self.table = AliasTable(self.bounds)
+            self.total_weight = self.total_bound = sum(self.weights)
+
+    def sample(self, pool: list[int], k: int, rng=random) -> list[int]:
+        """
+        Draws k distinct species from the pool, species with a high weight first more often.
+
+        :param pool: positions of the candidate species in the index
+        :param k: number of species to draw
+        :return positions: drawn positions in draw order
+        """
+        k = min(k, len(pool))
+        self._refresh()
+        pool_weight = sum(self.weights[i] for i in pool)
+        if pool_weight * 2 < self.total_bound:  # most draws from the shared table would miss the pool or be thinned
+            table, lookup = AliasTable([self.weights[i] for i in pool]), pool
+        else:
+            table, lookup = self.table, None
+        in_pool = set(pool)
+
+        drawn, chosen = [], set()
+        for _ in range(k * 20):
+            if len(drawn) == k:
+                break
+            i = table.draw(rng)
+            if lookup is not None:
+                i = lookup[i]
+            elif rng.random() * self.bounds[i] >= self.weights[i]:
+                continue  # drawn by its bound, not by its current weight
+            if i in in_pool and i not in chosen:
+                chosen.add(i)
+                drawn.append(i)
+        if len(drawn) < k:  # the heaviest species are taken, draw the rest by weighted keys
+            rest = sorted((i for i in pool if i not in chosen),
+                          key=lambda i: rng.random() ** (1 / self.weights[i]), reverse=True)
+            drawn.extend(rest[:k - len(drawn)])
+        return drawn
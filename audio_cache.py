@@ -0,0 +1,124 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024  # about 25 stereo 15 second clips at 44.1 kHz
+
+
+def segment_size(sound) -> int:
+    """
+    :param sound: decoded PcmClip or AudioSegment
+    :return size: size of the decoded sample data in bytes
+    """
+    return len(sound.raw_data)
+
+
+class DecodedAudioCache:
+    """
+    Thread-safe least recently used cache of decoded sounds keyed by Xeno-Canto id.
+    The total size of the cached sample data is kept under max_bytes by evicting
+    the least recently used sounds first.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, sizeof=segment_size):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._loading = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, xc_id):
+        with self._lock:
+            return xc_id in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, xc_id):
+        with self._lock:
+            entry = self._entries.get(xc_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(xc_id)
+            self.hits += 1
+            return entry[0]
+
+    def get_or_load(self, xc_id, loader):
+        """
+        Returns the cached sound, or loads it with loader() and caches it. Concurrent callers asking
+        for the same missing sound wait for the one load in progress instead of loading it again.
+
+        :param xc_id: Xeno-Canto id of the recording
+        :param loader: function returning the decoded sound, its exceptions are raised to every waiting caller
+        :return sound: the decoded sound
+        """
+        sound = self.get(xc_id)
+        if sound is not None:
+            return sound
+        with self._lock:
+            future = self._loading.get(xc_id)
+            owner = future is None
+            if owner:
+                future = self._loading[xc_id] = Future()
+        if not owner:
+            return future.result()
+        try:
+            sound = loader()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            self.put(xc_id, sound)
+            future.set_result(sound)
+            return sound
+        finally:
+            with self._lock:
+                self._loading.pop(xc_id, None)
+
+    def put(self, xc_id, sound):
+        size = self.sizeof(sound)
+        with self._lock:
+            old_entry = self._entries.pop(xc_id, None)
+            if old_entry is not None:
+                self.current_bytes -= old_entry[1]
+            if size > self.max_bytes:
+                return  # would evict everything else and still not fit
+            self._entries[xc_id] = (sound, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+
+    def resize(self, max_bytes: int):
+        with self._lock:
+            self.max_bytes = max_bytes
+            while self.current_bytes > self.max_bytes and self._entries:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+decoded_audio_cache = DecodedAudioCache()
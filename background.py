@@ -0,0 +1,60 @@
+import queue
+from concurrent.futures import ThreadPoolExecutor
+
+
+class BackgroundWorker:
+    """
+    Runs blocking jobs (network, decoding) on a thread pool and hands their results back to the
+    Tk thread. Finished jobs put their callback into a queue that is drained with widget.after(),
+    so callbacks always run on the Tk thread and the main loop is never blocked by a job.
+    """
+
+    def __init__(self, widget, max_workers: int = 4, poll_interval_ms: int = 30):
+        self.widget = widget
+        self.poll_interval_ms = poll_interval_ms
+        self._results = queue.SimpleQueue()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ui-worker")
+        self._poll_id = None
+        self._closed = False
+        self._poll()
+
+    def submit(self, func, *args, on_done=None, on_error=None):
+        """
+        Runs func(*args) on a worker thread.
+
+        :param func: blocking function to run
+        :param on_done: called on the Tk thread with the return value of func
+        :param on_error: called on the Tk thread with the exception raised by func, printed if not given
+        """
+        def job():
+            try:
+                result = func(*args)
+            except Exception as e:
+                self._results.put((on_error, e, True))
+            else:
+                self._results.put((on_done, result, False))
+
+        if not self._closed:
+            self._executor.submit(job)
+
+    def _poll(self):
+        try:
+            while True:
+                try:
+                    callback, value, failed = self._results.get_nowait()
+                except queue.Empty:
+                    break
+                if callback is not None:
+                    callback(value)
+                elif failed:
+                    print(f"Background job failed: {value!r}")
+        finally:
+            if not self._closed:
+                self._poll_id = self.widget.after(self.poll_interval_ms, self._poll)
+
+    def shutdown(self):
+        self._closed = True
+        if self._poll_id is not None:
+            self.widget.after_cancel(self._poll_id)
+            self._poll_id = None
+        self._executor.shutdown(wait=False, cancel_futures=True)
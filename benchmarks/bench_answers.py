@@ -0,0 +1,82 @@
+"""
+Measures the per-keystroke cost of type-ahead suggestions and the cost of grading a misspelled
+answer against SpeciesIndex, with synthetic species whose Finnish, English and scientific names
+look like real ones. Every prefix of every test answer is queried, as typing would.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_answers --species 3000 --tolerance 2
+"""
+import argparse
+import os
+import random
+import statistics
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from species_index import SpeciesIndex  # noqa: E402
+
+
+class FakeSpecies:
+    __slots__ = ("correct_answers", "square_count")
+
+    def __init__(self, names: dict, square_count: int):
+        self.correct_answers = names
+        self.square_count = square_count
+
+
+def random_word(rng: random.Random, syllables: int) -> str:
+    return "".join(rng.choice("kltsrmnpvhj") + rng.choice("aeiouyäö") for _ in range(syllables))
+
+
+def make_species(count: int, seed: int) -> list[FakeSpecies]:
+    rng = random.Random(seed)
+    return [FakeSpecies({"comNameFI": random_word(rng, 3) + rng.choice(["tiainen", "kerttu", "sirkku", "haukka"]),
+                         "comNameEN": f"{random_word(rng, 2)} {rng.choice(['warbler', 'tit', 'bunting', 'hawk'])}",
+                         "sciName": f"{random_word(rng, 3)} {random_word(rng, 3)}"},
+                        rng.randint(1, 4000)) for _ in range(count)]
+
+
+def misspell(name: str, rng: random.Random) -> str:
+    position = rng.randrange(len(name))
+    return name[:position] + rng.choice(string.ascii_lowercase) + name[position + 1:]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--species", type=int, default=3000)
+    parser.add_argument("--answers", type=int, default=200)
+    parser.add_argument("--tolerance", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    species = make_species(args.species, args.seed)
+    start = time.perf_counter()
+    index = SpeciesIndex(species)
+    build_seconds = time.perf_counter() - start
+
+    rng = random.Random(args.seed)
+    answers = [rng.choice(list(rng.choice(species).correct_answers.values())) for _ in range(args.answers)]
+    keystrokes = []
+    for answer in answers:
+        for end in range(1, len(answer) + 1):
+            start = time.perf_counter()
+            index.suggest(answer[:end])
+            keystrokes.append(time.perf_counter() - start)
+
+    grading = []
+    for answer in answers:
+        start = time.perf_counter()
+        index.closest_species(misspell(answer, rng), args.tolerance)
+        grading.append(time.perf_counter() - start)
+
+    print(f"index build          {build_seconds * 1000:10.1f} ms for {len(index.names)} names")
+    for name, times in (("keystroke suggest", keystrokes), ("misspelled grading", grading)):
+        print(f"{name:20s} median {statistics.median(times) * 1e6:8.1f} us   max {max(times) * 1e6:8.1f} us")
+
+
+if __name__ == "__main__":
+    main()
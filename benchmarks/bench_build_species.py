@@ -0,0 +1,130 @@
+"""
+Construction time and retained memory of the SpeciesList on the path the quiz loads it, from a
+synthetic recording table, compared with the previous per-species implementation that created
+one BirdSound object per recording:
+
+    before              -> per-species dataframe filter and one BirdSound per recording
+    build from rows     -> catalog rows grouped into one RecordingTable (catalog._build_species)
+    load from the cache -> the same from a catalog shard on disk (CatalogCache.load), a warm start
+
+Run from the repository root:
+
+    python -m benchmarks.bench_build_species --species 250 --recordings 40000
+"""
+import argparse
+import gc
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalog import CatalogCache, _build_species, _catalog_rows  # noqa: E402
+from species_data import extract_license_type  # noqa: E402
+
+
+class LegacyBirdSound:
+    def __init__(self, xc_id, url, download_url, recordist, country, location, sound_type, license_type):
+        self.xc_id = f"XC{xc_id}"
+        self.url = url
+        self.download_url = download_url
+        self.recordist = recordist
+        self.country = country
+        self.location = location
+        self.sound_type = sound_type
+        self.license_type = license_type
+        self.sound = None
+        self.playback = None
+
+
+class LegacyMysterySpecies:
+    def __init__(self, common_name_FI, common_name_EN, scientific_name, sounds, square_count):
+        self.correct_answers = {
+            "comNameFI": common_name_FI.lower().strip(),
+            "comNameEN": common_name_EN.lower().strip(),
+            "sciName": scientific_name.lower().strip()
+        }
+        self.square_count = square_count
+        self.sounds = sounds
+        self.current_sound = None
+
+
+def legacy_reformat_recordings(recording_df):
+    recording_df["lic"] = recording_df["lic"].map(extract_license_type)
+    species_list = []
+    for species in recording_df["sciName"].unique():
+        subdf = recording_df.loc[recording_df["sciName"] == species]
+        species_sounds = [LegacyBirdSound(*values)
+                          for values in subdf[["id", "url", "file", "rec", "cnt", "loc", "type", "lic"]].values]
+        species_list.append(LegacyMysterySpecies(common_name_FI=subdf["comName"].values[0],
+                                                 common_name_EN=subdf["en"].values[0],
+                                                 scientific_name=species,
+                                                 sounds=species_sounds,
+                                                 square_count=subdf["atlasSquareCount"].values[0]))
+    return species_list
+
+
+def make_recording_df(species_count: int, recording_count: int, seed: int = 0) -> pd.DataFrame:
+    rng = random.Random(seed)
+    species = [(f"Genus{i} species{i}", f"lintu{i}", f"bird {i}", rng.randint(1, 4000)) for i in range(species_count)]
+    countries = ["Finland", "Sweden", "Norway", "Denmark", "Estonia"]
+    rows = []
+    for xc_id in range(recording_count):
+        sci_name, com_name, en_name, square_count = rng.choice(species)
+        rows.append({
+            "id": str(100000 + xc_id),
+            "url": f"//xeno-canto.org/{100000 + xc_id}",
+            "file": f"https://xeno-canto.org/{100000 + xc_id}/download",
+            "rec": f"Recordist {rng.randint(1, 500)}",
+            "cnt": rng.choice(countries),
+            "loc": f"Location {rng.randint(1, 2000)}",
+            "type": rng.choice(["song", "call", "alarm call"]),
+            "lic": "//creativecommons.org/licenses/by-nc-sa/4.0/",
+            "sciName": sci_name,
+            "comName": com_name,
+            "en": en_name,
+            "atlasSquareCount": square_count,
+        })
+    return pd.DataFrame(rows)
+
+
+def measure(build, argument) -> dict:
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build(argument)
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return {"seconds": elapsed, "retained_mb": retained / 2 ** 20, "peak_mb": peak / 2 ** 20}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--species", type=int, default=250)
+    parser.add_argument("--recordings", type=int, default=40000)
+    args = parser.parse_args()
+
+    recording_df = make_recording_df(args.species, args.recordings)
+    rows = sorted(_catalog_rows(recording_df), key=lambda row: row[8])
+    print(f"{args.species} species, {args.recordings} recordings")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache = CatalogCache(tmp_dir, countries=["finland"])
+        cache.shard("finland").save(recording_df)
+        for name, build, argument in [("before", legacy_reformat_recordings, recording_df.copy()),
+                                      ("build from rows", _build_species, rows),
+                                      ("load from the cache", lambda _: cache.load(), None)]:
+            result = measure(build, argument)
+            print(f"{name:20s} {result['seconds']:8.3f} s  retained {result['retained_mb']:7.1f} MB  "
+                  f"peak {result['peak_mb']:7.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
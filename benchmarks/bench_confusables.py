@@ -0,0 +1,108 @@
+"""
+Measures the confusable species table: the batch cost of clip features and of the neighbor
+search, and the quiz-time cost of loading the table and picking the options of a question.
+
+Synthetic species come in families that share a song frequency and trill rate, the species of a
+family differ slightly, and every recording adds noise, so the share of neighbors from the same
+family shows whether the features group similar songs:
+
+    features    -> per 15 second clip
+    neighbors   -> nearest neighbors of --species species with random features
+    load        -> reading the table at quiz start
+    options     -> multiple-choice options of one question
+
+Run from the repository root:
+
+    python -m benchmarks.bench_confusables --species 3000 --clips 120
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_answers import make_species  # noqa: E402
+from confusables import ConfusableTable, build_table, clip_features  # noqa: E402
+from playback import PcmClip  # noqa: E402
+from quiz import Quiz  # noqa: E402
+
+
+def make_song(frequency: float, trill_rate: float, seconds: float, frame_rate: int,
+              rng: np.random.Generator) -> PcmClip:
+    t = np.arange(int(seconds * frame_rate)) / frame_rate
+    phrase = (np.sin(2 * np.pi * trill_rate * t) > 0) * (np.sin(2 * np.pi * 0.3 * t + rng.uniform(0, 6)) > -0.3)
+    sweep = frequency * (1 + 0.1 * np.sin(2 * np.pi * trill_rate * t))
+    song = phrase * np.sin(2 * np.pi * np.cumsum(sweep) / frame_rate)
+    samples = 6000 * song * rng.uniform(0.3, 1) + rng.normal(0, 300, len(t))
+    return PcmClip(samples.astype("<i2").tobytes(), 1, 2, frame_rate)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--species", type=int, default=3000)
+    parser.add_argument("--clips", type=int, default=120, help="synthetic clips for the feature timing")
+    parser.add_argument("--families", type=int, default=6)
+    parser.add_argument("--neighbors", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    families = [(rng.uniform(1500, 7000), rng.uniform(2, 20)) for _ in range(args.families)]
+    species_per_family = max(2, args.clips // args.families // 3)
+    species_features, family_of = {}, {}
+    feature_times = []
+    for family, (frequency, trill_rate) in enumerate(families):
+        for i in range(species_per_family):
+            name = f"family{family} species{i}"
+            family_of[name] = family
+            species_frequency = frequency * rng.uniform(0.95, 1.05)
+            species_trill = trill_rate * rng.uniform(0.9, 1.1)
+            for _ in range(3):
+                clip = make_song(species_frequency, species_trill, 15.0, 22050, rng)
+                start = time.perf_counter()
+                species_features.setdefault(name, []).append(clip_features(clip))
+                feature_times.append(time.perf_counter() - start)
+    table = build_table(species_features, min(args.neighbors, species_per_family - 1))
+    same_family = statistics.mean(family_of[neighbor] == family_of[name]
+                                  for name in table.names for neighbor in table.neighbors(name))
+
+    species = make_species(args.species, args.seed)
+    names = [sp.correct_answers["sciName"] for sp in species]
+    vectors = rng.normal(size=(args.species, 60)).astype(np.float32)
+    start = time.perf_counter()
+    large_table = build_table({name: [vector] for name, vector in zip(names, vectors)}, args.neighbors)
+    neighbor_seconds = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "confusables.bin")
+        large_table.save(path)
+        start = time.perf_counter()
+        large_table = ConfusableTable.load(path)
+        load_seconds = time.perf_counter() - start
+        table_kb = os.path.getsize(path) / 1024
+
+    quiz = Quiz(prefetch_depth=0, confusables=large_table)
+    quiz.set_species_list(species)
+    lookups = []
+    for current in random.Random(args.seed).sample(species, min(500, len(species))):
+        quiz.current_species = current
+        start = time.perf_counter()
+        quiz.answer_options(4)
+        lookups.append(time.perf_counter() - start)
+
+    print(f"features    median {statistics.median(feature_times) * 1000:8.2f} ms per clip "
+          f"({len(feature_times)} clips)")
+    print(f"neighbors   {neighbor_seconds * 1000:15.1f} ms for {args.species} species, k={args.neighbors}")
+    print(f"load        {load_seconds * 1000:15.2f} ms ({table_kb:.0f} kB)")
+    print(f"options     median {statistics.median(lookups) * 1e6:8.1f} us   max {max(lookups) * 1e6:8.1f} us")
+    print(f"same-family neighbors of synthetic songs: {same_family * 100:.0f} %")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Measures how quiz setup scales with the answer history: loading and aggregating a log of
+--answers synthetic answers, the first weighted draw (weights and alias table built) and later
+draws after a few new answers (only their species reweighted).
+
+Run from the repository root:
+
+    python -m benchmarks.bench_history --answers 50000 --species 3000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from answer_history import AnswerHistory, HistorySampler, RECORD, species_names_path  # noqa: E402
+from benchmarks.bench_answers import make_species  # noqa: E402
+from species_index import SpeciesIndex  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--answers", type=int, default=50000)
+    parser.add_argument("--species", type=int, default=3000)
+    parser.add_argument("--length", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    index = SpeciesIndex(make_species(args.species, args.seed))
+    names = [species.correct_answers["sciName"] for species in index.species]
+    now = time.time()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "answers.bin")
+        with open(species_names_path(path), "w", encoding="utf-8") as f:
+            f.write("".join(name + "\n" for name in names))
+        with open(path, "wb") as f:
+            f.write(b"".join(RECORD.pack(now - rng.uniform(0, 90 * 24 * 60 * 60), rng.randrange(len(names)),
+                                         rng.randrange(1, 10 ** 6), rng.random() < 0.7, rng.uniform(1, 20))
+                             for _ in range(args.answers)))
+
+        history = AnswerHistory(path)
+        start = time.perf_counter()
+        len(history)
+        load_seconds = time.perf_counter() - start
+
+        sampler = HistorySampler(index, history)
+        pool = list(range(len(names)))
+        start = time.perf_counter()
+        sampler.sample(pool, args.length, rng)
+        first_seconds = time.perf_counter() - start
+
+        for species in rng.sample(names, args.length):
+            history.record(species, "XC1", rng.random() < 0.7, 5.0)
+        start = time.perf_counter()
+        sampler.sample(pool, args.length, rng)
+        next_seconds = time.perf_counter() - start
+
+    print(f"load and aggregate   {load_seconds * 1000:8.2f} ms for {args.answers} answers")
+    print(f"first draw           {first_seconds * 1000:8.2f} ms for {args.species} species")
+    print(f"draw after a quiz    {next_seconds * 1000:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Measures the latency of starting, resuming and seeking a 15 second clip on the playback engine,
+compared with copying the sample data on every press as pydub's _play_with_simpleaudio did.
+Uses the null backend by default, so it runs on a headless machine; pass --backend simpleaudio
+to include the sound card.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_playback --presses 200
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from playback import PcmClip, PlaybackEngine, NullBackend, SimpleaudioBackend  # noqa: E402
+
+
+def measure(func, presses: int) -> list[float]:
+    times = []
+    for _ in range(presses):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--presses", type=int, default=200)
+    parser.add_argument("--backend", choices=["null", "simpleaudio"], default="null")
+    args = parser.parse_args()
+
+    backend = NullBackend() if args.backend == "null" else SimpleaudioBackend()
+    engine = PlaybackEngine(backend)
+    clip = PcmClip(bytes(15 * 44100 * 2 * 2), channels=2, sample_width=2, frame_rate=44100)
+    playback = engine.play(clip)
+    playback.stop()
+
+    def copy_and_play():
+        engine.play(PcmClip(bytes(clip.raw_data), clip.channels, clip.sample_width, clip.frame_rate)).stop()
+
+    def pause_and_resume():
+        playback.pause()
+        playback.resume()
+
+    scenarios = {
+        "copy per press": copy_and_play,
+        "play": lambda: engine.play(clip).stop(),
+        "pause + resume": pause_and_resume,
+        "seek": lambda: playback.seek(7500),
+    }
+    playback.play()
+    print(f"{'scenario':16s} {'median ms':>10s} {'max ms':>10s}")
+    for name, func in scenarios.items():
+        times = measure(func, args.presses)
+        print(f"{name:16s} {statistics.median(times) * 1000:10.3f} {max(times) * 1000:10.3f}")
+    playback.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Measures the per-clip cost of the spectrogram shown on the quiz page, on synthetic 15 second
+clips of chirps in noise in the format of decoded recordings:
+
+    compute     -> STFT, pooling and scaling to levels (loading thread)
+    color       -> color map and PPM encoding (loading thread)
+    render      -> PPM to Tk PhotoImage (UI thread), skipped without a display
+    cached      -> lookup of an already rendered clip in the spectrogram cache (UI thread)
+
+Run from the repository root:
+
+    python -m benchmarks.bench_spectrogram --clips 50 --frame-rate 44100 --channels 2
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from playback import PcmClip  # noqa: E402
+from spectrogram import compute_spectrogram, render_ppm, spectrogram_cache  # noqa: E402
+
+
+def make_clip(seconds: float, frame_rate: int, channels: int, rng: np.random.Generator) -> PcmClip:
+    t = np.arange(int(seconds * frame_rate)) / frame_rate
+    frequency = rng.uniform(1500, 4000) + rng.uniform(500, 3000) * np.abs(np.sin(2 * np.pi * rng.uniform(0.5, 3) * t))
+    samples = 8000 * np.sin(2 * np.pi * np.cumsum(frequency) / frame_rate) + rng.normal(0, 500, len(t))
+    frames = np.repeat(samples[:, None], channels, axis=1)
+    return PcmClip(frames.astype("<i2").tobytes(), channels, 2, frame_rate)
+
+
+def tk_root():
+    try:
+        import tkinter as tk
+        root = tk.Tk()
+        root.withdraw()
+        return root
+    except Exception:  # no display or no Tk
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clips", type=int, default=50)
+    parser.add_argument("--seconds", type=float, default=15.0)
+    parser.add_argument("--frame-rate", type=int, default=44100)
+    parser.add_argument("--channels", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    clips = [make_clip(args.seconds, args.frame_rate, args.channels, rng) for _ in range(args.clips)]
+    root = tk_root()
+    timings = {"compute": [], "color": [], "render": [], "cached": []}
+
+    for i, clip in enumerate(clips):
+        start = time.perf_counter()
+        levels = compute_spectrogram(clip)
+        timings["compute"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        image_data = render_ppm(levels)
+        timings["color"].append(time.perf_counter() - start)
+        spectrogram_cache.put(f"XC{i}", image_data)
+
+        start = time.perf_counter()
+        cached = spectrogram_cache.get(f"XC{i}")
+        timings["cached"].append(time.perf_counter() - start)
+
+        if root is not None:
+            import tkinter as tk
+            start = time.perf_counter()
+            tk.PhotoImage(master=root, data=cached, format="PPM")
+            timings["render"].append(time.perf_counter() - start)
+
+    print(f"{args.clips} clips of {args.seconds:.0f} s, {args.frame_rate} Hz, {args.channels} channel(s), "
+          f"image {levels.shape[1]}x{levels.shape[0]}")
+    for name, times in timings.items():
+        if not times:
+            print(f"{name:8s} skipped, no display")
+            continue
+        print(f"{name:8s} median {statistics.median(times) * 1000:8.2f} ms   max {max(times) * 1000:8.2f} ms")
+    if root is not None:
+        root.destroy()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Compares the import time and resident memory of starting the quiz with everything imported up
+front (as main.py used to do) with the fast-start path, which builds the SpeciesList from the
+catalog cache using only the standard library and defers pandas, requests and pydub.
+Each scenario runs in a fresh interpreter, repeated --runs times.
+
+Run from the repository root, after the catalog cache has been built once by main.py:
+
+    python -m benchmarks.bench_startup --runs 5
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIOS = {
+    "eager imports": (
+        "import pandas, yaml, requests, pydub, pydub.playback, simpleaudio, tkinter\n"
+        "import species_data, catalog, quiz, ui\n"
+        "species_list = catalog.load_species_list()\n"
+    ),
+    "fast start": (
+        "import catalog, quiz, ui\n"
+        "species_list = catalog.load_species_list()\n"
+        "import sys\n"
+        "assert 'pandas' not in sys.modules, 'pandas was imported on the fast-start path'\n"
+    ),
+}
+
+
+def run_scenario(code: str) -> tuple[float, float]:
+    """
+    :param code: Python code run in a fresh interpreter from the repository root
+    :return result: wall time in seconds and max RSS of the interpreter in MB
+    """
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "-c", code], cwd=REPO_DIR)
+    _, status, rusage = os.wait4(process.pid, 0)
+    elapsed = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode != 0:
+        raise RuntimeError(f"Scenario failed with exit code {process.returncode}")
+    return elapsed, rusage.ru_maxrss / 1024  # kilobytes on Linux
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'scenario':16s} {'median s':>10s} {'min s':>10s} {'max RSS MB':>12s}")
+    for name, code in SCENARIOS.items():
+        results = [run_scenario(code) for _ in range(args.runs)]
+        times = [elapsed for elapsed, _ in results]
+        rss = max(max_rss for _, max_rss in results)
+        print(f"{name:16s} {statistics.median(times):10.3f} {min(times):10.3f} {rss:12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Compares a full catalog refresh with incremental syncs against the local stub APIs, counting
+the requests and measuring the wall time of each:
+
+    full refresh      -> every page of every country
+    no changes        -> counts and "since:" queries only
+    new recordings    -> --new recordings uploaded today, merged into the catalog
+    removed recording -> one recording removed, its country is fetched again in full
+
+Run from the repository root:
+
+    python -m benchmarks.bench_sync --latency 0.05
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.stub_server import StubData, StubApiServer  # noqa: E402
+from catalog import CatalogCache, refresh_catalog, sync_catalog  # noqa: E402
+
+
+def measure(server: StubApiServer, func) -> tuple[int, float, object]:
+    """
+    :return result: number of requests sent, wall time in seconds and the return value of func
+    """
+    requests_before = server.request_count
+    start = time.perf_counter()
+    value = func()
+    return server.request_count - requests_before, time.perf_counter() - start, value
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--species", type=int, default=200)
+    parser.add_argument("--recordings-per-species", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.05, help="stub server delay per request in seconds")
+    parser.add_argument("--new", type=int, default=25, help="recordings added before the second sync")
+    args = parser.parse_args()
+
+    data = StubData(args.species, args.recordings_per_species)
+    with tempfile.TemporaryDirectory() as tmp_dir, StubApiServer(data, args.latency) as server:
+        atlas_path = os.path.join(tmp_dir, "atlasdata.csv")
+        data.write_atlas_csv(atlas_path)
+        cache = CatalogCache(os.path.join(tmp_dir, "cache"))
+        species_options = {"ebird_base_url": server.ebird_base_url, "atlas_path": atlas_path, "api_key": "stub"}
+        recording_options = {"endpoint": server.xc_endpoint}
+
+        def sync():
+            return sync_catalog(cache, species_options, recording_options)
+
+        scenarios = [("full refresh", lambda: refresh_catalog(cache, species_options, recording_options)),
+                     ("no changes", sync)]
+        today = time.strftime("%Y-%m-%d", time.gmtime())
+        scenarios.append(("new recordings", lambda: (data.add_recordings("finland", args.new, today), sync())[1]))
+        scenarios.append(("removed recording", lambda: (data.remove_recordings([data.recordings["sweden"][0]["id"]]),
+                                                        sync())[1]))
+
+        print(f"{'scenario':18s} {'requests':>9s} {'seconds':>9s} {'species updated':>16s}")
+        for name, func in scenarios:
+            request_count, elapsed, affected = measure(server, func)
+            print(f"{name:18s} {request_count:9d} {elapsed:9.3f} {len(affected):16d}")
+
+
+if __name__ == "__main__":
+    main()
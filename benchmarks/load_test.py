@@ -0,0 +1,167 @@
+"""
+Load test of the quiz server. The server runs in a child process with a SpeciesList built from
+the stub data and downloads its clips from the stub APIs served by this process, so the CPU time
+it reports is the quiz server's own. --clients simulated players each run quizzes back to back:
+next question, clip download, a few suggestions as if typing, answer, and --think seconds of
+listening in between.
+
+Reported per run:
+
+    questions/s         -> questions served to all clients per wall-clock second
+    server CPU          -> user and system time of the server process
+    sessions per core   -> concurrent players the server could sustain at 100 % of one core
+    question latency    -> from requesting the next question until its clip is received, p50 and p95
+
+Run from the repository root:
+
+    python -m benchmarks.load_test --clients 30 --duration 20 --think 2
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.run_benchmarks import percentile  # noqa: E402
+from benchmarks.stub_server import StubData, StubApiServer  # noqa: E402
+
+PORT_TAG = "load_test port: "
+CPU_TAG = "load_test cpu seconds: "
+
+
+async def request(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, method: str, path: str,
+                  content: dict | None = None) -> tuple[int, bytes]:
+    body = json.dumps(content).encode() if content is not None else b""
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(body)}\r\n\r\n".encode()
+                 + body)
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while (line := await reader.readline()) not in (b"\r\n", b""):
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.strip().lower() == "content-length":
+            length = int(value)
+    return status, await reader.readexactly(length)
+
+
+async def player(port: int, args, seed: int, deadline: float, latencies: list[float]) -> int:
+    rng = random.Random(seed)
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    questions = 0
+    try:
+        while time.monotonic() < deadline:
+            _, body = await request(reader, writer, "POST", "/sessions",
+                                    {"difficulty": args.difficulty, "length": args.length})
+            session = f"/sessions/{json.loads(body)['session_id']}"
+            more = True
+            while more and time.monotonic() < deadline:
+                start = time.perf_counter()
+                status, _ = await request(reader, writer, "POST", f"{session}/next")
+                if status != 200:
+                    break
+                await request(reader, writer, "GET", f"{session}/clip")
+                latencies.append(time.perf_counter() - start)
+                questions += 1
+                await asyncio.sleep(rng.uniform(0.5, 1.5) * args.think)
+                for prefix in ("l", "li", "lin"):
+                    await request(reader, writer, "GET", f"{session}/suggest?prefix={prefix}")
+                _, body = await request(reader, writer, "POST", f"{session}/answer",
+                                        {"answer": f"lintu{rng.randrange(args.species)}"})
+                more = json.loads(body)["more_questions"]
+            await request(reader, writer, "DELETE", session)
+    finally:
+        writer.close()
+    return questions
+
+
+async def run_clients(port: int, args) -> tuple[int, float, list[float]]:
+    latencies = []
+    start = time.monotonic()
+    deadline = start + args.duration
+    counts = await asyncio.gather(*(player(port, args, args.seed + i, deadline, latencies)
+                                    for i in range(args.clients)))
+    return sum(counts), time.monotonic() - start, latencies
+
+
+def read_tagged(stream, tag: str) -> str:
+    """
+    :return value: rest of the first line of the child's output starting with tag, other output is skipped
+    """
+    for line in stream:
+        if line.startswith(tag):
+            return line[len(tag):].strip()
+    raise RuntimeError(f"The server process exited without reporting {tag.strip()}")
+
+
+def serve(args):
+    """
+    Child process: the quiz server, until stdin is closed. Reports its port, then its CPU seconds, on
+    tagged lines, so that anything else the server prints doesn't get in the way.
+    """
+    from catalog import species_list_from_rows
+    from server import QuizServer
+
+    data = StubData(args.species, args.recordings_per_species, audio_variants=0, seed=args.seed)
+    species_list = species_list_from_rows(data.catalog_rows(args.stub_url))
+
+    async def main():
+        server = await QuizServer(species_list, max_workers=args.workers).start("127.0.0.1", 0)
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        print(f"{PORT_TAG}{server.port}", flush=True)
+        await asyncio.get_running_loop().run_in_executor(None, sys.stdin.read)
+        after = resource.getrusage(resource.RUSAGE_SELF)
+        print(f"{CPU_TAG}{after.ru_utime + after.ru_stime - usage.ru_utime - usage.ru_stime}", flush=True)
+        await server.close()
+
+    asyncio.run(main())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=30)
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds the clients keep playing")
+    parser.add_argument("--think", type=float, default=2.0, help="mean seconds a player listens before answering")
+    parser.add_argument("--species", type=int, default=200)
+    parser.add_argument("--recordings-per-species", type=int, default=20)
+    parser.add_argument("--audio-seconds", type=float, default=5.0)
+    parser.add_argument("--latency", type=float, default=0.05, help="stub server delay per request in seconds")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--difficulty", type=int, default=5)
+    parser.add_argument("--length", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--stub-url", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        return serve(args)
+
+    data = StubData(args.species, args.recordings_per_species, audio_seconds=args.audio_seconds, seed=args.seed)
+    with StubApiServer(data, args.latency) as stub:
+        child = subprocess.Popen([sys.executable, "-m", "benchmarks.load_test", *sys.argv[1:],
+                                  "--serve", "--stub-url", stub.base_url],
+                                 stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+        try:
+            port = int(read_tagged(child.stdout, PORT_TAG))
+            questions, elapsed, latencies = asyncio.run(run_clients(port, args))
+        finally:
+            child.stdin.close()
+        cpu_seconds = float(read_tagged(child.stdout, CPU_TAG))
+        child.wait()
+    cpu_per_session = cpu_seconds / (args.clients * elapsed)
+
+    print(f"clients              {args.clients:10d}")
+    print(f"questions/s          {questions / elapsed:10.1f}  ({questions} in {elapsed:.1f} s)")
+    print(f"server CPU           {cpu_seconds:10.2f} s   ({cpu_seconds / elapsed * 100:.0f} % of one core)")
+    print(f"sessions per core    {1 / cpu_per_session if cpu_per_session else float('inf'):10.0f}")
+    print(f"question latency     p50 {percentile(latencies, 0.5) * 1000:8.1f} ms"
+          f"   p95 {percentile(latencies, 0.95) * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Reproducible performance benchmark of what a player waits on, run headlessly against the
+local stub APIs in benchmarks/stub_server.py:
+
+    catalog cold load   -> fetching everything from the APIs and writing the catalog cache
+    catalog warm load   -> building the SpeciesList from the catalog cache
+    quiz setup          -> filters and prefetch start of a quiz
+    time-to-playable    -> per question, until the clip is downloaded and decoded
+    peak memory         -> Python allocations (tracemalloc) and process max RSS
+
+Results are saved as JSON under benchmarks/results/ and compared with the previous run.
+Run from the repository root:
+
+    python -m benchmarks.run_benchmarks --latency 0.05 --sessions 3
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_cache import decoded_audio_cache  # noqa: E402
+from benchmarks.stub_server import StubData, StubApiServer  # noqa: E402
+from catalog import load_species_list  # noqa: E402
+from headless import HeadlessQuizSession, make_random_answer_strategy  # noqa: E402
+from quiz import Quiz  # noqa: E402
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run(args) -> dict:
+    data = StubData(args.species, args.recordings_per_species, seed=args.seed)
+    results = {
+        "revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "parameters": vars(args),
+    }
+
+    tracemalloc.start()
+    with tempfile.TemporaryDirectory() as tmp_dir, StubApiServer(data, args.latency) as server:
+        atlas_path = os.path.join(tmp_dir, "atlasdata.csv")
+        data.write_atlas_csv(atlas_path)
+        cache_dir = os.path.join(tmp_dir, "cache")
+        species_options = {"ebird_base_url": server.ebird_base_url, "atlas_path": atlas_path, "api_key": "stub"}
+        recording_options = {"endpoint": server.xc_endpoint}
+
+        start = time.perf_counter()
+        load_species_list(cache_dir, force_refresh=True, species_options=species_options,
+                          recording_options=recording_options)
+        results["catalog_cold_seconds"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        species_list = load_species_list(cache_dir)
+        results["catalog_warm_seconds"] = time.perf_counter() - start
+
+        setup_times = []
+        time_to_playable = []
+        for session_no in range(args.sessions):
+            decoded_audio_cache.clear()
+            session = HeadlessQuizSession(Quiz(prefetch_depth=args.prefetch_depth), species_list,
+                                          difficulty=args.difficulty, length=args.length, wildcard=args.wildcard,
+                                          answer_strategy=make_random_answer_strategy(seed=args.seed + session_no),
+                                          answer_delay=args.answer_delay)
+            session_result = session.run()
+            setup_times.append(session_result["setup_seconds"])
+            time_to_playable.extend(session_result["time_to_playable"])
+        results["request_count"] = server.request_count
+
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    results["quiz_setup_seconds"] = statistics.mean(setup_times)
+    results["time_to_playable"] = {
+        "first": time_to_playable[0] if time_to_playable else float("nan"),
+        "p50": percentile(time_to_playable, 0.5),
+        "p95": percentile(time_to_playable, 0.95),
+        "max": max(time_to_playable, default=float("nan")),
+    }
+    results["peak_traced_mb"] = peak / 2 ** 20
+    results["max_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # kilobytes on Linux
+    return results
+
+
+def flatten(results: dict, prefix: str = "") -> dict:
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict) and key != "parameters":
+            flat.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def compare(results: dict, previous: dict | None):
+    current = flatten(results)
+    before = flatten(previous) if previous else {}
+    label = f"vs {previous['revision']}" if previous else ""
+    print(f"{'metric':28s} {'value':>12s} {label:>20s}")
+    for key, value in current.items():
+        line = f"{key:28s} {value:12.4f}"
+        if key in before and before[key]:
+            line += f" {(value - before[key]) / before[key] * 100:+19.1f}%"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--species", type=int, default=200)
+    parser.add_argument("--recordings-per-species", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.05, help="stub server delay per request in seconds")
+    parser.add_argument("--sessions", type=int, default=3)
+    parser.add_argument("--difficulty", type=int, default=3)
+    parser.add_argument("--length", type=int, default=10)
+    parser.add_argument("--wildcard", default=None)
+    parser.add_argument("--prefetch-depth", type=int, default=2)
+    parser.add_argument("--answer-delay", type=float, default=1.0, help="simulated seconds spent per question")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-save", action="store_true", help="don't write the results file")
+    args = parser.parse_args()
+
+    results = run(args)
+    previous_files = sorted(glob.glob(os.path.join(RESULTS_DIR, "*.json")))
+    previous = None
+    if previous_files:
+        with open(previous_files[-1]) as f:
+            previous = json.load(f)
+    compare(results, previous)
+
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{results['revision']}.json")
+        with open(path, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved results to {path}")
+
+
+if __name__ == "__main__":
+    main()
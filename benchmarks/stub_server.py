@@ -0,0 +1,257 @@
+"""
+Local stand-in for the eBird and Xeno-Canto APIs. Serves canned species, taxonomy and
+recording JSON and generated WAV audio with a configurable delay per request, so catalog
+loading and quiz sessions can be measured without the network.
+"""
+import csv
+import io
+import json
+import math
+import os
+import random
+import struct
+import threading
+import time
+import wave
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+COUNTRIES = ["finland", "sweden", "norway", "denmark", "estonia"]
+
+
+def make_wav(seconds: float, frequency: float, sample_rate: int = 22050) -> bytes:
+    frames = int(seconds * sample_rate)
+    samples = (int(12000 * math.sin(2 * math.pi * frequency * t / sample_rate)) for t in range(frames))
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(b"".join(struct.pack("<h", sample) for sample in samples))
+    return buffer.getvalue()
+
+
+class StubData:
+    """Canned API content: species with eBird codes and Atlas square counts, and their recordings."""
+
+    def __init__(self, species_count: int = 200, recordings_per_species: int = 20, page_size: int = 500,
+                 audio_seconds: float = 20.0, audio_variants: int = 8, seed: int = 0):
+        rng = random.Random(seed)
+        self.page_size = page_size
+        self.species = [{
+            "speciesCode": f"sp{i:04d}",
+            "sciName": f"Genus{i} species{i}",
+            "comName": f"lintu{i}",
+            "en": f"Bird {i}",
+            "atlasSquareCount": rng.randint(1, 4000),
+        } for i in range(species_count)]
+
+        self.recordings = {country: [] for country in COUNTRIES}
+        xc_id = 100000
+        for sp in self.species:
+            for _ in range(recordings_per_species):
+                country = rng.choice(COUNTRIES)
+                genus, epithet = sp["sciName"].split(" ")
+                self.recordings[country].append({
+                    "id": str(xc_id),
+                    "gen": genus,
+                    "sp": epithet,
+                    "en": sp["en"],
+                    "rec": f"Recordist {rng.randint(1, 300)}",
+                    "cnt": country.capitalize(),
+                    "loc": f"Location {rng.randint(1, 1000)}",
+                    "type": rng.choice(["song", "call"]),
+                    "lic": "//creativecommons.org/licenses/by-nc-sa/4.0/",
+                    "url": f"//xeno-canto.org/{xc_id}",
+                    "file": f"/audio/{xc_id}.wav",
+                    "q": "A",
+                    "uploaded": "2020-01-01",
+                })
+                xc_id += 1
+
+        self.next_id = xc_id
+        self.audio = [make_wav(audio_seconds, 440 + 110 * i) for i in range(audio_variants)]
+
+    def write_atlas_csv(self, path: str):
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["comName", "atlasSquareCount"])
+            for sp in self.species:
+                writer.writerow([sp["comName"], sp["atlasSquareCount"]])
+
+    def add_recordings(self, country: str, count: int, uploaded: str, seed: int = 0) -> list[str]:
+        """
+        Adds new recordings of random species, as if they had been uploaded on the given date.
+
+        :return ids: Xeno-Canto ids of the added recordings
+        """
+        rng = random.Random(seed)
+        ids = []
+        for _ in range(count):
+            sp = rng.choice(self.species)
+            genus, epithet = sp["sciName"].split(" ")
+            xc_id = str(self.next_id)
+            self.next_id += 1
+            self.recordings[country].append({
+                "id": xc_id, "gen": genus, "sp": epithet, "en": sp["en"], "rec": f"Recordist {rng.randint(1, 300)}",
+                "cnt": country.capitalize(), "loc": f"Location {rng.randint(1, 1000)}", "type": "song",
+                "lic": "//creativecommons.org/licenses/by-nc-sa/4.0/", "url": f"//xeno-canto.org/{xc_id}",
+                "file": f"/audio/{xc_id}.wav", "q": "A", "uploaded": uploaded,
+            })
+            ids.append(xc_id)
+        return ids
+
+    def remove_recordings(self, ids) -> None:
+        ids = set(ids)
+        for country in COUNTRIES:
+            self.recordings[country] = [r for r in self.recordings[country] if r["id"] not in ids]
+
+    def catalog_rows(self, base_url: str = "") -> list[tuple]:
+        """
+        :param base_url: base URL of the server the audio is downloaded from
+        :return rows: all recordings as catalog rows in CATALOG_COLUMNS order, for building a SpeciesList
+                      without pandas or a catalog refresh
+        """
+        species = {sp["sciName"]: sp for sp in self.species}
+        rows = []
+        for country in COUNTRIES:
+            for r in self.recordings[country]:
+                sp = species[f"{r['gen']} {r['sp']}"]
+                rows.append((r["id"], r["url"], base_url + r["file"], r["rec"], r["cnt"], r["loc"], r["type"],
+                             "CC BY-NC-SA 4.0", sp["sciName"], sp["comName"], sp["en"], sp["atlasSquareCount"]))
+        return rows
+
+    def recording_page(self, country: str, page: int, base_url: str = "", since: str | None = None) -> dict:
+        recordings = self.recordings.get(country, [])
+        if since:
+            recordings = [r for r in recordings if r["uploaded"] >= since]
+        num_pages = max(1, math.ceil(len(recordings) / self.page_size))
+        start = (page - 1) * self.page_size
+        return {
+            "numRecordings": str(len(recordings)),
+            "numSpecies": str(len({(r["gen"], r["sp"]) for r in recordings})),
+            "page": page,
+            "numPages": num_pages,
+            "recordings": [dict(r, file=base_url + r["file"]) for r in recordings[start:start + self.page_size]],
+        }
+
+
+class StubApiServer:
+    """
+    Threaded HTTP server serving StubData on localhost.
+
+        /v2/product/spplist/FI    -> eBird species codes
+        /v2/ref/taxonomy/ebird    -> eBird taxonomy of the requested codes
+        /api/2/recordings         -> paged Xeno-Canto recordings, "cnt:<country>" in the query selects the country
+                                     and "since:<YYYY-MM-DD>" only returns recordings uploaded since then
+        /audio/<id>.wav           -> audio of a recording
+    """
+
+    def __init__(self, data: StubData, latency: float = 0.0, audio_latency: float | None = None, port: int = 0):
+        self.data = data
+        self.latency = latency
+        self.audio_latency = latency if audio_latency is None else audio_latency
+        self.request_count = 0
+        self._count_lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def ebird_base_url(self) -> str:
+        return f"{self.base_url}/v2"
+
+    @property
+    def xc_endpoint(self) -> str:
+        return f"{self.base_url}/api/2/recordings"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="stub-api", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def _make_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def send_body(self, body: bytes, content_type: str):
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                try:
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # clients may close the connection once they have read enough audio
+
+            def send_json(self, content):
+                self.send_body(json.dumps(content).encode(), "application/json")
+
+            def do_GET(self):
+                with stub._count_lock:
+                    stub.request_count += 1
+                url = urlparse(self.path)
+                query = parse_qs(url.query)
+                data = stub.data
+
+                if url.path.startswith("/audio/"):
+                    time.sleep(stub.audio_latency)
+                    xc_id = int(os.path.splitext(os.path.basename(url.path))[0])
+                    return self.send_body(data.audio[xc_id % len(data.audio)], "audio/wav")
+
+                time.sleep(stub.latency)
+                if url.path == "/v2/product/spplist/FI":
+                    return self.send_json([sp["speciesCode"] for sp in data.species])
+                if url.path == "/v2/ref/taxonomy/ebird":
+                    codes = set(query.get("species", [""])[0].split(","))
+                    return self.send_json([{"speciesCode": sp["speciesCode"], "sciName": sp["sciName"],
+                                            "comName": sp["comName"]}
+                                           for sp in data.species if sp["speciesCode"] in codes])
+                if url.path == "/api/2/recordings":
+                    terms = dict(term.split(":", 1) for term in query.get("query", [""])[0].split() if ":" in term)
+                    page = int(query.get("page", ["1"])[0])
+                    return self.send_json(data.recording_page(terms.get("cnt", ""), page, stub.base_url,
+                                                                  terms.get("since")))
+
+                self.send_error(404)
+
+        return Handler
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.05, help="delay of every request in seconds")
+    parser.add_argument("--species", type=int, default=200)
+    parser.add_argument("--recordings-per-species", type=int, default=20)
+    args = parser.parse_args()
+
+    with StubApiServer(StubData(args.species, args.recordings_per_species), args.latency, port=args.port) as server:
+        print(f"Serving stub APIs at {server.base_url}, press Ctrl+C to stop")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,423 @@
+import os
+import sqlite3
+import time
+from itertools import groupby
+from quiz import MysterySpecies, SpeciesList
+from recording_table import RecordingTable
+
+CATALOG_VERSION = 3
+DEFAULT_CACHE_DIR = "data/cache"
+DEFAULT_TTL = 7 * 24 * 60 * 60  # one week, in seconds
+FULL_SYNC_INTERVAL = 30 * 24 * 60 * 60  # "since:" queries only report uploads, so crawl everything once a month
+DEFAULT_COUNTRIES = ["finland", "sweden", "norway", "denmark", "estonia"]
+COUNTRIES_ENV_VAR = "BIRDQUIZ_COUNTRIES"
+REFRESH_ENV_VAR = "BIRDQUIZ_REFRESH"
+
+CATALOG_COLUMNS = ["id", "url", "file", "rec", "cnt", "loc", "type", "lic",
+                   "sciName", "comName", "en", "atlasSquareCount"]
+
+
+def selected_countries() -> list[str]:
+    """
+    :return countries: countries of the regional edition, a comma-separated list in BIRDQUIZ_COUNTRIES
+                       or DEFAULT_COUNTRIES if it isn't set
+    """
+    countries = os.environ.get(COUNTRIES_ENV_VAR)
+    if not countries:
+        return list(DEFAULT_COUNTRIES)
+    return [country.strip().lower() for country in countries.split(",") if country.strip()]
+
+
+def refresh_requested() -> bool:
+    """
+    :return force_refresh: True if BIRDQUIZ_REFRESH is set to 1, true or yes, to refresh the catalog in full
+    """
+    return os.environ.get(REFRESH_ENV_VAR, "").strip().lower() in ("1", "true", "yes")
+
+
+def _catalog_rows(recording_df) -> list[tuple]:
+    """
+    :param recording_df: dataframe of bird sound recordings returned by get_recordings()
+    :return rows: plain Python tuples in CATALOG_COLUMNS order, with license URLs converted to display names
+    """
+    from species_data import extract_license_types  # pulls in pandas, only needed when refreshing
+
+    catalog_df = recording_df[CATALOG_COLUMNS].copy()
+    catalog_df["lic"] = extract_license_types(catalog_df["lic"])
+    return list(zip(*[catalog_df[column].tolist() for column in CATALOG_COLUMNS]))
+
+
+def _since_date(timestamp: float) -> str:
+    """
+    :param timestamp: time the sync started
+    :return date: the day before in the "YYYY-MM-DD" form of Xeno-Canto "since:" queries, so that
+                  recordings uploaded around midnight or around the sync itself are not missed
+    """
+    return time.strftime("%Y-%m-%d", time.gmtime(timestamp - 24 * 60 * 60))
+
+
+def _build_species(rows: list[tuple]) -> list[MysterySpecies]:
+    """
+    :param rows: catalog rows in CATALOG_COLUMNS order, sorted by scientific name
+    :return species: one MysterySpecies per scientific name, sharing one RecordingTable of the rows
+    """
+    recording_table = RecordingTable.from_rows(row[:8] for row in rows)
+    species = []
+    start = 0
+    for sci_name, species_rows in groupby(rows, key=lambda row: row[8]):
+        first = next(species_rows)
+        stop = start + 1 + sum(1 for _ in species_rows)
+        mystery_species = MysterySpecies(common_name_FI=first[9],
+                                         common_name_EN=first[10],
+                                         scientific_name=sci_name,
+                                         recording_table=recording_table,
+                                         recording_range=range(start, stop),
+                                         square_count=first[11])
+        species.append(mystery_species)
+        start = stop
+    return species
+
+
+def species_list_from_rows(rows) -> SpeciesList:
+    """
+    :param rows: catalog rows in CATALOG_COLUMNS order from any source, e.g. a test fixture
+    :return species_list: SpeciesList of the rows
+    """
+    return SpeciesList(_build_species(sorted(rows, key=lambda row: row[8])))
+
+
+class CatalogShard:
+    """
+    On-disk SQLite store of the recordings of one country, in the merged species/recording form
+    produced by get_recordings(). The store is stamped with CATALOG_VERSION and the time it was
+    written, so stale or incompatible shards can be detected without touching the network.
+
+    Next to the recordings, the store keeps its sync point and the ids of all recordings
+    Xeno-Canto returned for the country, filtered out ones included, so sync_catalog() can fetch
+    only what was uploaded since and notice when recordings have disappeared.
+    """
+
+    def __init__(self, cache_dir: str, country: str, ttl: float = DEFAULT_TTL):
+        self.cache_dir = cache_dir
+        self.country = country
+        self.ttl = ttl
+        self.path = os.path.join(cache_dir, f"catalog-{country}.sqlite")
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path) and self.read_meta() is not None
+
+    def read_meta(self) -> dict | None:
+        """
+        :return meta: dictionary with "version", "created_at", "full_sync_at", "species_digest" and "since" keys,
+                      or None if the store is missing or unreadable
+        """
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with sqlite3.connect(self.path) as con:
+                rows = con.execute("SELECT key, value FROM meta").fetchall()
+        except sqlite3.DatabaseError:
+            return None
+        meta = dict(rows)
+        if "version" not in meta or "created_at" not in meta:
+            return None
+        return {"version": int(meta["version"]), "created_at": float(meta["created_at"]),
+                "full_sync_at": float(meta.get("full_sync_at", meta["created_at"])),
+                "species_digest": meta.get("species_digest", ""), "since": meta.get("since")}
+
+    def is_usable(self) -> bool:
+        meta = self.read_meta()
+        return meta is not None and meta["version"] == CATALOG_VERSION
+
+    def is_fresh(self) -> bool:
+        meta = self.read_meta()
+        if meta is None or meta["version"] != CATALOG_VERSION:
+            return False
+        return time.time() - meta["created_at"] < self.ttl
+
+    def read_seen_ids(self) -> set[str]:
+        """
+        :return seen_ids: ids of all recordings Xeno-Canto returned for the country so far
+        """
+        with sqlite3.connect(self.path) as con:
+            return {row[0] for row in con.execute("SELECT id FROM seen")}
+
+    def read_species_names(self) -> set[str]:
+        if not self.is_usable():
+            return set()
+        with sqlite3.connect(self.path) as con:
+            return {row[0] for row in con.execute("SELECT DISTINCT sciName FROM recordings")}
+
+    def read_rows(self, sci_names=None) -> list[tuple]:
+        """
+        :param sci_names: scientific names of the species to read, all species if None
+        :return rows: catalog rows in CATALOG_COLUMNS order, sorted by scientific name
+        """
+        if not os.path.exists(self.path):
+            return []
+        query = f"SELECT {', '.join(CATALOG_COLUMNS)} FROM recordings"
+        params = []
+        if sci_names is not None:
+            params = list(sci_names)
+            query += f" WHERE sciName IN ({', '.join('?' * len(params))})"
+        with sqlite3.connect(self.path) as con:
+            return con.execute(query + " ORDER BY sciName, rowid", params).fetchall()
+
+    def save(self, recording_df, seen_ids: set | None = None, species_digest: str = "") -> None:
+        """
+        Writes the merged recording dataframe to the store, replacing any previous recordings of the country.
+        License URLs are converted to display names before writing, so loading needs no reformatting.
+
+        :param recording_df: dataframe of the country's bird sound recordings returned by get_recordings()
+        :param seen_ids: ids of all fetched recordings of the country, needed for incremental syncs
+        :param species_digest: species_digest() of the species the recordings were filtered with
+        """
+        rows = _catalog_rows(recording_df)
+        now = time.time()
+        meta = [("version", str(CATALOG_VERSION)), ("created_at", str(now)), ("full_sync_at", str(now)),
+                ("species_digest", species_digest)]
+        if seen_ids is not None:
+            meta.append(("since", _since_date(now)))
+
+        tmp_path = self.path + ".tmp"
+        os.makedirs(self.cache_dir, exist_ok=True)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        with sqlite3.connect(tmp_path) as con:
+            con.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+            con.execute(f"CREATE TABLE recordings ({', '.join(CATALOG_COLUMNS)})")
+            con.execute("CREATE INDEX recordings_sci_name ON recordings (sciName)")
+            con.execute("CREATE INDEX recordings_id ON recordings (id)")
+            con.execute("CREATE TABLE seen (id TEXT PRIMARY KEY) WITHOUT ROWID")
+            con.executemany(f"INSERT INTO recordings VALUES ({', '.join('?' * len(CATALOG_COLUMNS))})", rows)
+            con.executemany("INSERT OR IGNORE INTO seen VALUES (?)", [(xc_id,) for xc_id in seen_ids or ()])
+            con.executemany("INSERT INTO meta VALUES (?, ?)", meta)
+        os.replace(tmp_path, self.path)  # swap atomically so a crash never leaves a half-written shard
+
+    def apply_sync(self, replaced_ids: set, recording_df, seen_ids: set, started_at: float) -> set[str]:
+        """
+        Updates the store in place in one transaction. The stored recordings with the given ids are
+        deleted and the rows of recording_df are inserted in their place. Recordings that were
+        changed to fail the get_recordings() filters are thereby dropped.
+
+        :param replaced_ids: ids of the re-fetched recordings
+        :param recording_df: filtered and merged dataframe of the re-fetched recordings
+        :param seen_ids: ids of all re-fetched recordings, filtered out ones included
+        :param started_at: time the sync started, the next sync starts from it
+        :return affected: scientific names of the species whose recordings were added, changed or removed
+        """
+        rows = _catalog_rows(recording_df)
+        affected = {row[8] for row in rows}
+        with sqlite3.connect(self.path) as con:
+            for xc_id in replaced_ids:
+                affected.update(row[0] for row in con.execute("SELECT sciName FROM recordings WHERE id = ?", (xc_id,)))
+            con.executemany("DELETE FROM recordings WHERE id = ?", [(xc_id,) for xc_id in replaced_ids])
+            con.executemany(f"INSERT INTO recordings VALUES ({', '.join('?' * len(CATALOG_COLUMNS))})", rows)
+            con.executemany("INSERT OR IGNORE INTO seen VALUES (?)", [(xc_id,) for xc_id in seen_ids])
+            con.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                            [("since", _since_date(started_at)), ("created_at", str(time.time()))])
+        return affected
+
+
+class CatalogCache:
+    """
+    The catalog of a regional edition: one CatalogShard per selected country. Shards are stored
+    and refreshed independently, and only the shards of the selected countries are ever opened,
+    so loading time and memory depend on the region rather than on every country fetched so far.
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, ttl: float = DEFAULT_TTL,
+                 countries: list[str] | None = None):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.countries = list(countries) if countries is not None else selected_countries()
+        self._shards = {}
+
+    def shard(self, country: str) -> CatalogShard:
+        if country not in self._shards:
+            self._shards[country] = CatalogShard(self.cache_dir, country, self.ttl)
+        return self._shards[country]
+
+    def stale_countries(self) -> list[str]:
+        return [country for country in self.countries if not self.shard(country).is_fresh()]
+
+    def is_fresh(self) -> bool:
+        return not self.stale_countries()
+
+    def is_usable(self) -> bool:
+        return all(self.shard(country).is_usable() for country in self.countries)
+
+    def load(self) -> SpeciesList:
+        """
+        Builds a SpeciesList from the shards of the selected countries straight from the stores using
+        only the standard library, so a warm start never imports pandas, requests or pydub.
+
+        :return species_list: SpeciesList object containing all nesting species in Finland.
+        """
+        return SpeciesList(self.load_species())
+
+    def load_species(self, sci_names=None) -> list[MysterySpecies]:
+        """
+        :param sci_names: scientific names of the species to load, all species if None
+        :return species: MysterySpecies of those of the species that have recordings in the selected shards
+        """
+        if sci_names is not None:
+            sci_names = list(sci_names)
+            if not sci_names:
+                return []
+        rows = []
+        for country in self.countries:
+            rows.extend(self.shard(country).read_rows(sci_names))
+        rows.sort(key=lambda row: row[8])  # stable, keeps each shard's row order within a species
+        return _build_species(rows)
+
+
+def _sync_shards(cache: CatalogCache, countries: list[str], species_df, recording_options: dict,
+                 full_sync_interval: float | None) -> set[str]:
+    from species_data import fetch_all_recordings, fetch_recording_counts, recordings_to_dataframe, species_digest
+
+    digest = species_digest(species_df)
+    full_countries, delta_countries = [], []
+    for country in countries:
+        meta = cache.shard(country).read_meta()
+        if (full_sync_interval is None or meta is None or meta["version"] != CATALOG_VERSION
+                or meta["species_digest"] != digest or meta["since"] is None
+                or time.time() - meta["full_sync_at"] > full_sync_interval):
+            full_countries.append(country)
+        else:
+            delta_countries.append(country)
+
+    affected = set()
+    started_at = time.time()
+    if delta_countries:
+        counts = fetch_recording_counts(delta_countries, **recording_options)
+        since = {country: cache.shard(country).read_meta()["since"] for country in delta_countries}
+        new_recordings = {country: [] for country in delta_countries}
+        for since_date, same_since in groupby(sorted(delta_countries, key=since.get), key=since.get):
+            for recording in fetch_all_recordings(list(same_since), extra_query=f"since:{since_date}",
+                                                  **recording_options):
+                new_recordings[recording["query_country"]].append(recording)
+
+        for country in delta_countries:
+            shard = cache.shard(country)
+            new_ids = {recording["id"] for recording in new_recordings[country]}
+            if len(shard.read_seen_ids() | new_ids) != counts[country]:
+                full_countries.append(country)  # recordings were removed or lost their quality A rating
+                continue
+            recording_df = recordings_to_dataframe(new_recordings[country], species_df)
+            affected |= shard.apply_sync(new_ids, recording_df, new_ids, started_at)
+
+    if full_countries:
+        all_recordings = {country: [] for country in full_countries}
+        for recording in fetch_all_recordings(full_countries, **recording_options):
+            all_recordings[recording["query_country"]].append(recording)
+        for country in full_countries:
+            shard = cache.shard(country)
+            affected |= shard.read_species_names()
+            recording_df = recordings_to_dataframe(all_recordings[country], species_df)
+            shard.save(recording_df, {recording["id"] for recording in all_recordings[country]}, digest)
+            affected |= set(recording_df["sciName"])
+
+    return affected
+
+
+def refresh_catalog(cache: CatalogCache, species_options: dict | None = None,
+                    recording_options: dict | None = None, countries: list[str] | None = None) -> set[str]:
+    """
+    Fetches the species and recording data from eBird and Xeno-Canto and rewrites the shards in full.
+
+    :param cache: catalog cache to write to
+    :param species_options: keyword arguments passed to get_species()
+    :param recording_options: keyword arguments passed to the Xeno-Canto fetches, i.e. endpoint and max_workers
+    :param countries: countries whose shards are refreshed, all selected countries of the cache if None
+    :return affected: scientific names of the species whose recordings may have changed
+    """
+    from species_data import get_species  # pandas is only needed for the refresh
+
+    species_df = get_species(**(species_options or {}))
+    return _sync_shards(cache, countries or cache.countries, species_df, recording_options or {}, None)
+
+
+def sync_catalog(cache: CatalogCache, species_options: dict | None = None, recording_options: dict | None = None,
+                 countries: list[str] | None = None, full_sync_interval: float = FULL_SYNC_INTERVAL) -> set[str]:
+    """
+    Brings the shards up to date with a few requests instead of a full crawl. The total recording
+    count of every country and the recordings uploaded since its shard's sync point are fetched.
+    If the stored ids of a country plus the new ones add up to its total, only the new and
+    re-uploaded recordings are merged in. Otherwise recordings have been removed or lost their
+    quality A rating, and that shard alone is fetched in full and replaced.
+
+    A shard is also fetched in full if it has no sync point, was written by an incompatible
+    version, was filtered with a different species list, or was last fully synced longer than
+    full_sync_interval ago.
+
+    :param cache: catalog cache to update
+    :param species_options: keyword arguments passed to get_species()
+    :param recording_options: keyword arguments passed to the Xeno-Canto fetches, i.e. endpoint and max_workers
+    :param countries: countries whose shards are synced, all selected countries of the cache if None
+    :param full_sync_interval: maximum time in seconds between full crawls
+    :return affected: scientific names of the species whose recordings were added, changed or removed
+    """
+    from species_data import get_species
+
+    species_df = get_species(**(species_options or {}))
+    return _sync_shards(cache, countries or cache.countries, species_df, recording_options or {},
+                        full_sync_interval)
+
+
+def update_species_list(species_list: SpeciesList, cache: CatalogCache, affected) -> SpeciesList:
+    """
+    Rebuilds only the MysterySpecies whose recordings changed in a sync. The other species are
+    kept as they are, together with their recording tables and failed recordings.
+
+    :param species_list: SpeciesList loaded from the cache before the sync
+    :param cache: catalog cache after the sync
+    :param affected: scientific names returned by sync_catalog()
+    :return species_list: SpeciesList with the affected species reloaded from the cache
+    """
+    affected = set(affected)
+    affected_keys = {sci_name.lower().strip() for sci_name in affected}
+    kept = [species for species in species_list.full_species_list
+            if species.correct_answers["sciName"] not in affected_keys]
+    species = sorted(kept + cache.load_species(affected), key=lambda sp: sp.correct_answers["sciName"])
+    return SpeciesList(species)
+
+
+def load_species_list(cache_dir: str = DEFAULT_CACHE_DIR, ttl: float = DEFAULT_TTL,
+                      force_refresh: bool | None = None, incremental: bool = True, countries: list[str] | None = None,
+                      species_options: dict | None = None, recording_options: dict | None = None) -> SpeciesList:
+    """
+    Loads the quiz species from the shards of the selected countries, refreshing the shards that are
+    missing, older than the TTL or written by an incompatible version from the APIs first, or all of
+    them if a refresh is forced. Outdated shards are brought up to date with an incremental sync
+    unless incremental is False. If the refresh fails because the network is unavailable, stale
+    shards are used instead.
+
+    :param cache_dir: directory holding the catalog shards
+    :param ttl: maximum age of a shard in seconds before it is refreshed
+    :param force_refresh: refresh every shard in full even if it is still fresh, BIRDQUIZ_REFRESH if None
+    :param incremental: fetch only the recordings uploaded since the last sync when a shard is outdated
+    :param countries: countries of the regional edition, BIRDQUIZ_COUNTRIES or DEFAULT_COUNTRIES if None
+    :param species_options: keyword arguments passed to get_species(), e.g. a stub server URL
+    :param recording_options: keyword arguments passed to the Xeno-Canto fetches, e.g. a stub server endpoint
+    :return species_list: SpeciesList object containing all nesting species in Finland.
+    """
+
+    if force_refresh is None:
+        force_refresh = refresh_requested()
+    cache = CatalogCache(cache_dir, ttl, countries)
+    stale_countries = cache.countries if force_refresh else cache.stale_countries()
+    if stale_countries:
+        import requests
+
+        try:
+            if incremental and not force_refresh:
+                sync_catalog(cache, species_options, recording_options, stale_countries)
+            else:
+                refresh_catalog(cache, species_options, recording_options, stale_countries)
+        except requests.exceptions.RequestException as e:
+            if not cache.is_usable():
+                raise
+            print(f"Catalog refresh failed ({e}), using cached catalog")
+
+    return cache.load()
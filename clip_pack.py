@@ -0,0 +1,279 @@
+import json
+import mmap
+import os
+from playback import PcmClip
+
+PACK_MAGIC = b"BQCLIPS1"
+PACK_VERSION = 1
+DEFAULT_PACK_PATH = "data/clips.pack"
+DEFAULT_SAMPLE_RATE = 22050
+CHANNELS = 1
+SAMPLE_WIDTH = 2  # bytes, signed 16-bit samples
+
+
+def index_path(pack_path: str) -> str:
+    return os.path.splitext(pack_path)[0] + ".index.json"
+
+
+def checkpoint_path(pack_path: str) -> str:
+    return os.path.splitext(pack_path)[0] + ".checkpoint.jsonl"
+
+
+class ClipPackWriter:
+    """
+    Writes a clip pack: one binary file of pre-decoded mono int16 PCM clips stored back to back
+    after an 8 byte magic header, and a JSON index keyed by Xeno-Canto id with the byte offset,
+    length and metadata of every clip.
+
+    With resume=True, the writer appends to an existing pack: the clips of its index and of its
+    checkpoint are kept, and new clips are written after the last of them. Every added clip is also
+    appended to a checkpoint file, so an interrupted run continues after the last checkpointed clip.
+    The checkpoint is removed once the writer is closed without an error.
+
+    Without resume, the new pack is written to a temporary file that replaces the pack on close,
+    so processes reading the old pack never see it truncated.
+    """
+
+    def __init__(self, path: str = DEFAULT_PACK_PATH, sample_rate: int = DEFAULT_SAMPLE_RATE, resume: bool = False):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.clips = {}
+        self._checkpoint = None
+        self._write_path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        has_index = os.path.exists(index_path(path))
+        has_checkpoint = os.path.exists(checkpoint_path(path))
+        if resume and os.path.exists(path) and (has_index or has_checkpoint):
+            if has_index:
+                self.clips = self._read_index()
+            if has_checkpoint:
+                self.clips.update(self._read_checkpoint())
+            end = max((clip["offset"] + clip["length"] for clip in self.clips.values()), default=len(PACK_MAGIC))
+            self._file = open(path, "r+b")
+            self._file.truncate(end)  # drops the data of a clip that was being written when the run stopped
+            self._file.seek(end)
+            self._checkpoint = open(checkpoint_path(path), "a")
+            if not has_checkpoint:
+                self._write_checkpoint({"sample_rate": sample_rate})
+        else:
+            if not resume:
+                self._write_path = path + ".tmp"
+            self._file = open(self._write_path, "wb")
+            self._file.write(PACK_MAGIC)
+            if resume:
+                self._checkpoint = open(checkpoint_path(path), "w")
+                self._write_checkpoint({"sample_rate": sample_rate})
+
+    def _read_index(self) -> dict:
+        with open(index_path(self.path), "r") as f:
+            index = json.load(f)
+        if index.get("version") != PACK_VERSION:
+            raise ValueError(f"Unsupported clip pack version: {index.get('version')}")
+        if index.get("sample_rate") != self.sample_rate:
+            raise ValueError(f"{self.path} has sample rate {index.get('sample_rate')}")
+        return index["clips"]
+
+    def _read_checkpoint(self) -> dict:
+        clips = {}
+        with open(checkpoint_path(self.path), "r") as f:
+            for line_no, line in enumerate(f):
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break  # the last line was cut short
+                if line_no == 0:
+                    if entry.get("sample_rate") != self.sample_rate:
+                        raise ValueError(f"{self.path} was started with sample rate {entry.get('sample_rate')}")
+                    continue
+                clips[entry.pop("xc_id")] = entry
+        return clips
+
+    def _write_checkpoint(self, entry: dict):
+        self._checkpoint.write(json.dumps(entry) + "\n")
+        self._checkpoint.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(complete=exc_type is None)
+
+    def __contains__(self, xc_id):
+        return xc_id in self.clips
+
+    def add_pcm(self, xc_id: str, pcm_data: bytes, metadata: dict | None = None):
+        """
+        Appends already converted mono int16 PCM data at the pack's sample rate.
+
+        :param xc_id: Xeno-Canto id of the recording, e.g. "XC12345"
+        :param pcm_data: raw sample data
+        :param metadata: JSON serializable information stored in the index with the clip
+        """
+        offset = self._file.tell()
+        self._file.write(pcm_data)
+        self.clips[xc_id] = {
+            "offset": offset,
+            "length": len(pcm_data),
+            "duration_ms": len(pcm_data) * 1000 // (self.sample_rate * SAMPLE_WIDTH * CHANNELS),
+            "metadata": metadata or {},
+        }
+        if self._checkpoint is not None:
+            self._file.flush()  # the clip data must be on disk before the checkpoint refers to it
+            self._write_checkpoint({"xc_id": xc_id, **self.clips[xc_id]})
+
+    def add(self, xc_id: str, sound, metadata: dict | None = None):
+        """
+        Converts a decoded clip to the pack format and appends it.
+
+        :param xc_id: Xeno-Canto id of the recording, e.g. "XC12345"
+        :param sound: decoded AudioSegment or PcmClip
+        :param metadata: JSON serializable information stored in the index with the clip
+        """
+        if (sound.channels, sound.sample_width, sound.frame_rate) == (CHANNELS, SAMPLE_WIDTH, self.sample_rate):
+            self.add_pcm(xc_id, sound.raw_data, metadata)
+            return
+        if isinstance(sound, PcmClip):
+            sound = sound.to_segment()
+        sound = sound.set_channels(CHANNELS).set_frame_rate(self.sample_rate).set_sample_width(SAMPLE_WIDTH)
+        self.add_pcm(xc_id, sound.raw_data, metadata)
+
+    def close(self, complete: bool = True):
+        """
+        Writes the index. The pack can be opened afterwards even if it is incomplete.
+
+        :param complete: whether all clips have been added, the checkpoint is kept for resuming otherwise
+        """
+        if self._file.closed:
+            return
+        self._file.close()
+        if self._write_path != self.path:
+            os.replace(self._write_path, self.path)
+        index = {
+            "magic": PACK_MAGIC.decode(),
+            "version": PACK_VERSION,
+            "sample_rate": self.sample_rate,
+            "channels": CHANNELS,
+            "sample_width": SAMPLE_WIDTH,
+            "clips": self.clips,
+        }
+        tmp_path = index_path(self.path) + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, index_path(self.path))
+        if self._checkpoint is not None:
+            self._checkpoint.close()
+            if complete:
+                os.remove(checkpoint_path(self.path))
+
+
+class ClipPack:
+    """
+    Read-only, memory-mapped view of a clip pack. Clips are handed out as memoryview slices of
+    the mapping, so playing a clip needs no copy and no decode, and processes opening the same
+    pack share its pages through the OS page cache.
+    """
+
+    def __init__(self, path: str = DEFAULT_PACK_PATH):
+        self.path = path
+        with open(index_path(path), "r") as f:
+            index = json.load(f)
+        if index.get("version") != PACK_VERSION:
+            raise ValueError(f"Unsupported clip pack version: {index.get('version')}")
+        self.sample_rate = index["sample_rate"]
+        self.channels = index["channels"]
+        self.sample_width = index["sample_width"]
+        self.clips = index["clips"]
+
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(PACK_MAGIC)] != PACK_MAGIC:
+            self._mmap.close()
+            raise ValueError(f"{path} is not a clip pack")
+        self._view = memoryview(self._mmap)
+
+    def __contains__(self, xc_id):
+        return xc_id in self.clips
+
+    def __len__(self):
+        return len(self.clips)
+
+    def get_buffer(self, xc_id: str) -> memoryview:
+        """
+        :param xc_id: Xeno-Canto id of the recording
+        :return buffer: zero-copy view of the clip's PCM data
+        """
+        clip = self.clips[xc_id]
+        return self._view[clip["offset"]:clip["offset"] + clip["length"]]
+
+    def get_metadata(self, xc_id: str) -> dict:
+        return self.clips[xc_id]["metadata"]
+
+    def get_clip(self, xc_id: str) -> PcmClip:
+        """
+        :param xc_id: Xeno-Canto id of the recording
+        :return clip: ready-to-play clip backed by the mapping, without a copy
+        """
+        return PcmClip(self.get_buffer(xc_id), self.channels, self.sample_width, self.sample_rate)
+
+    def get_segment(self, xc_id: str):
+        """
+        :param xc_id: Xeno-Canto id of the recording
+        :return sound: copy of the clip as an AudioSegment, for code that needs pydub
+        """
+        return self.get_clip(xc_id).to_segment()
+
+    def close(self):
+        self._view.release()
+        self._mmap.close()
+
+
+active_clip_pack = None
+
+
+def set_active_clip_pack(pack: ClipPack | None):
+    """Sets the clip pack that BirdSound objects play from when their recording is in it."""
+    global active_clip_pack
+    active_clip_pack = pack
+
+
+def get_active_clip_pack() -> ClipPack | None:
+    return active_clip_pack
+
+
+def load_default_clip_pack(path: str = DEFAULT_PACK_PATH) -> ClipPack | None:
+    """
+    Opens the clip pack at path and makes it the active pack if it exists.
+
+    :param path: path of the pack file
+    :return pack: the opened pack, or None if there is no pack at path
+    """
+    if not (os.path.exists(path) and os.path.exists(index_path(path))):
+        return None
+    pack = ClipPack(path)
+    set_active_clip_pack(pack)
+    return pack
+
+
+def build_clip_pack(sounds, path: str = DEFAULT_PACK_PATH, sample_rate: int = DEFAULT_SAMPLE_RATE):
+    """
+    Downloads the given recordings and writes them into a new clip pack.
+    Recordings that fail to download or decode are skipped.
+
+    :param sounds: iterable of BirdSound objects
+    :param path: path of the pack file
+    :param sample_rate: sample rate of the clips in the pack
+    """
+    with ClipPackWriter(path, sample_rate) as writer:
+        for sound in sounds:
+            try:
+                sound_file = sound.download_sound_file()
+            except Exception as e:
+                print(f"Skipping {sound.xc_id}: {e}")
+                continue
+            writer.add(sound.xc_id, sound_file, {
+                "recordist": sound.recordist,
+                "country": sound.country,
+                "location": sound.location,
+                "sound_type": sound.sound_type,
+                "license_type": sound.license_type,
+            })
@@ -0,0 +1,260 @@
+"""
+Batch job building the table of confusable species used by the multiple-choice quiz. A feature
+vector is computed from every selected clip with NumPy, from the log band energies of its loudest
+frames on a mel-like frequency scale:
+
+    - mean spectral shape per band, loudness removed, so quiet and loud recordings compare
+    - spread of every band over time
+    - mean frame-to-frame change of every band, which separates trills from whistles
+
+The vectors are averaged per MysterySpecies, standardized, and the k nearest species of every
+species by Euclidean distance are written to a small binary table. Reading the table needs only
+the standard library, and the distractors of a question are a lookup in it.
+
+Clips come from the clip pack when it has them, so running after ingest needs little or no
+network; --packed-only skips all other recordings.
+
+Run from the repository root:
+
+    python -m confusables --per-species 5 --neighbors 8
+"""
+import argparse
+import os
+import struct
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+TABLE_MAGIC = b"BQCONF01"
+HEADER = struct.Struct("<8sIII")  # magic, number of species, neighbors per species, bytes of the name block
+DEFAULT_TABLE_PATH = "data/confusables.bin"
+DEFAULT_NEIGHBORS = 8
+NO_NEIGHBOR = 0xFFFFFFFF
+
+N_FFT = 512
+N_BANDS = 20
+MIN_FREQUENCY = 500  # Hz, below this is mostly wind and traffic
+MAX_FREQUENCY = 11025  # Hz
+
+
+class ConfusableTable:
+    """
+    The k most similar sounding species of every species with features, nearest first. Species are
+    stored as ids into one list of scientific names, neighbors as one flat array of ids.
+    """
+
+    def __init__(self, names: list[str], neighbors: array, k: int):
+        """
+        :param names: scientific names of the species in the table
+        :param neighbors: k ids into names per species, in the order of names, NO_NEIGHBOR for padding
+        :param k: neighbors per species
+        """
+        self.names = names
+        self.neighbor_ids = neighbors
+        self.k = k
+        self.ids = {name: i for i, name in enumerate(names)}
+
+    def __contains__(self, sci_name):
+        return sci_name in self.ids
+
+    def __len__(self):
+        return len(self.names)
+
+    def neighbors(self, sci_name: str) -> list[str]:
+        """
+        :param sci_name: scientific name of a species
+        :return names: scientific names of the most similar sounding species, nearest first, empty if the
+                       species has no features
+        """
+        species_id = self.ids.get(sci_name)
+        if species_id is None:
+            return []
+        start = species_id * self.k
+        return [self.names[i] for i in self.neighbor_ids[start:start + self.k] if i != NO_NEIGHBOR]
+
+    def save(self, path: str = DEFAULT_TABLE_PATH):
+        """Writes the table to a temporary file first, so readers never see a half-written table."""
+        name_block = "\n".join(self.names).encode("utf-8")
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(HEADER.pack(TABLE_MAGIC, len(self.names), self.k, len(name_block)))
+            f.write(name_block)
+            f.write(self.neighbor_ids.tobytes())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_TABLE_PATH) -> "ConfusableTable":
+        with open(path, "rb") as f:
+            data = f.read()
+        magic, count, k, name_bytes = HEADER.unpack_from(data)
+        if magic != TABLE_MAGIC:
+            raise ValueError(f"{path} is not a confusable species table")
+        names = data[HEADER.size:HEADER.size + name_bytes].decode("utf-8").split("\n") if count else []
+        neighbors = array("I")
+        block = data[HEADER.size + name_bytes:HEADER.size + name_bytes + count * k * neighbors.itemsize]
+        neighbors.frombytes(block[:len(block) - len(block) % neighbors.itemsize])  # a cut entry is caught below
+        if len(names) != count or len(neighbors) != count * k:
+            raise ValueError(f"{path} is truncated")
+        return cls(names, neighbors, k)
+
+
+def load_default_confusables(path: str = DEFAULT_TABLE_PATH) -> ConfusableTable | None:
+    """
+    :return table: the table at path, or None if the batch job hasn't been run
+    """
+    if not os.path.exists(path):
+        return None
+    return ConfusableTable.load(path)
+
+
+def band_edges(frame_rate: int, n_fft: int = N_FFT, n_bands: int = N_BANDS):
+    """
+    :return edges: n_bands + 1 FFT bin indices of band edges spaced evenly on the mel scale
+                   between MIN_FREQUENCY and MAX_FREQUENCY, or the Nyquist frequency if it is lower
+    """
+    import numpy as np
+
+    top = min(MAX_FREQUENCY, frame_rate / 2)
+    mels = np.linspace(2595 * np.log10(1 + MIN_FREQUENCY / 700), 2595 * np.log10(1 + top / 700), n_bands + 1)
+    frequencies = 700 * (10 ** (mels / 2595) - 1)
+    edges = np.round(frequencies * n_fft / frame_rate).astype(int)
+    return np.maximum(edges, np.arange(n_bands + 1) + edges[0])  # at least one bin per band
+
+
+def clip_features(clip, n_fft: int = N_FFT, n_bands: int = N_BANDS):
+    """
+    :param clip: PcmClip of a recording
+    :return features: float32 vector of 3 * n_bands values, see the module docstring, computed from the
+                      louder half of the frames, where the bird is rather than the background
+    """
+    import numpy as np
+    from spectrogram import pcm_samples
+
+    samples = pcm_samples(clip)
+    if len(samples) < n_fft * 2:
+        raise ValueError("Clip is too short for features")
+    windows = np.lib.stride_tricks.sliding_window_view(samples, n_fft, axis=0)[::n_fft // 2]
+    frames = windows.mean(axis=1, dtype=np.float32)
+    if clip.sample_width == 1:
+        frames -= 128
+    power = np.abs(np.fft.rfft(frames * np.hanning(n_fft).astype(np.float32), axis=1)) ** 2
+
+    edges = np.minimum(band_edges(clip.frame_rate, n_fft, n_bands), power.shape[1])
+    bands = np.add.reduceat(power[:, :edges[-1]], edges[:-1], axis=1) / np.maximum(np.diff(edges), 1)
+    decibels = 10 * np.log10(np.maximum(bands, 1e-10))
+
+    loudness = decibels.max(axis=1)
+    decibels = decibels[loudness >= np.median(loudness)]
+    shape = decibels - decibels.mean(axis=1, keepdims=True)
+    change = np.abs(np.diff(shape, axis=0)).mean(axis=0) if len(shape) > 1 else np.zeros(n_bands)
+    return np.concatenate([shape.mean(axis=0), shape.std(axis=0), change]).astype(np.float32)
+
+
+def nearest_neighbors(vectors, k: int, chunk_size: int = 512):
+    """
+    :param vectors: array of shape (species, features)
+    :param k: neighbors per species
+    :return neighbors: int array of shape (species, min(k, species - 1)), row indices of the nearest other
+                       rows by Euclidean distance of the standardized features, nearest first
+    """
+    import numpy as np
+
+    vectors = np.asarray(vectors, dtype=np.float64)
+    spread = vectors.std(axis=0)
+    vectors = (vectors - vectors.mean(axis=0)) / np.where(spread > 0, spread, 1)
+    k = min(k, len(vectors) - 1)
+    squared = (vectors ** 2).sum(axis=1)
+    neighbors = np.empty((len(vectors), max(k, 0)), dtype=np.int64)
+    if k <= 0:
+        return neighbors
+    for start in range(0, len(vectors), chunk_size):  # distance rows of one chunk at a time
+        stop = min(start + chunk_size, len(vectors))
+        distances = squared[start:stop, None] + squared[None, :] - 2 * vectors[start:stop] @ vectors.T
+        distances[np.arange(stop - start), np.arange(start, stop)] = np.inf
+        nearest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        order = np.argsort(np.take_along_axis(distances, nearest, axis=1), axis=1)
+        neighbors[start:stop] = np.take_along_axis(nearest, order, axis=1)
+    return neighbors
+
+
+def build_table(species_features: dict, k: int = DEFAULT_NEIGHBORS) -> ConfusableTable:
+    """
+    :param species_features: feature vectors of the recordings of every species, by scientific name
+    :param k: neighbors per species
+    :return table: table of the species that have at least one vector
+    """
+    import numpy as np
+
+    names = sorted(name for name, vectors in species_features.items() if vectors)
+    if not names:
+        return ConfusableTable([], array("I"), k)
+    means = np.stack([np.mean(species_features[name], axis=0) for name in names])
+    neighbors = nearest_neighbors(means, k)
+    padded = np.full((len(names), k), NO_NEIGHBOR, dtype=np.uint32)
+    padded[:, :neighbors.shape[1]] = neighbors
+    return ConfusableTable(names, array("I", padded.ravel().tolist()), k)
+
+
+def select_sounds(species, per_species: int, packed_only: bool = False) -> list:
+    """
+    :return sounds: up to per_species BirdSound objects of the species, packed recordings first
+    """
+    sounds = species.sounds
+    packed = [sound for sound in sounds if sound.is_packed()]
+    other = [] if packed_only else [sound for sound in sounds if not sound.is_packed()]
+    return (packed + other)[:per_species]
+
+
+def extract_features(species_list, per_species: int = 5, workers: int = 8, packed_only: bool = False) -> dict:
+    """
+    Computes the feature vectors of up to per_species recordings of every species. Recordings that
+    can't be loaded are skipped.
+
+    :return species_features: lists of feature vectors by scientific name
+    """
+    def features(sound):
+        try:
+            return clip_features(sound.download_sound_file())
+        except Exception as e:
+            print(f"Skipping {sound.xc_id}: {e}")
+            return None
+
+    species_features = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:  # NumPy releases the GIL in the FFTs
+        jobs = [(species.correct_answers["sciName"], executor.submit(features, sound))
+                for species in species_list for sound in select_sounds(species, per_species, packed_only)]
+        for sci_name, future in jobs:
+            vector = future.result()
+            vectors = species_features.setdefault(sci_name, [])
+            if vector is not None:
+                vectors.append(vector)
+    return species_features
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--table", default=DEFAULT_TABLE_PATH, help="path of the table to write")
+    parser.add_argument("--per-species", type=int, default=5, help="recordings per species to average")
+    parser.add_argument("--neighbors", type=int, default=DEFAULT_NEIGHBORS)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--packed-only", action="store_true", help="only use recordings in the clip pack")
+    args = parser.parse_args()
+
+    from catalog import load_species_list
+    from clip_pack import load_default_clip_pack
+
+    species_list = load_species_list()
+    load_default_clip_pack()
+    start = time.perf_counter()
+    species_features = extract_features(species_list.full_species_list, args.per_species, args.workers,
+                                        args.packed_only)
+    table = build_table(species_features, args.neighbors)
+    table.save(args.table)
+    clips = sum(len(vectors) for vectors in species_features.values())
+    print(f"Wrote neighbors of {len(table)} of {len(species_list)} species from {clips} clips "
+          f"to {args.table} ({os.path.getsize(args.table) / 1024:.0f} kB) in {time.perf_counter() - start:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
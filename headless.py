@@ -0,0 +1,82 @@
+import random
+import time
+from quiz import Quiz
+
+
+def correct_answer_strategy(species) -> str:
+    return species.correct_answers["comNameFI"]
+
+
+def make_random_answer_strategy(accuracy: float = 0.7, seed: int | None = None):
+    """
+    :param accuracy: probability of answering correctly
+    :param seed: seed of the random generator, for reproducible sessions
+    :return answer_strategy: function returning the answer of a simulated player for a species
+    """
+    rng = random.Random(seed)
+
+    def answer_strategy(species) -> str:
+        if rng.random() < accuracy:
+            return species.correct_answers["comNameFI"]
+        return "en tiedä"
+
+    return answer_strategy
+
+
+class HeadlessQuizSession:
+    """
+    Runs a full quiz the same way QuizPage does, but without Tk and without playing any sound,
+    and records how long each step takes. A question counts as playable when next_species()
+    has returned, i.e. its clip has been downloaded and decoded.
+    """
+
+    def __init__(self, quiz: Quiz, species_list, difficulty: int = 1, length: int = 10,
+                 wildcard: str | None = None, answer_strategy=correct_answer_strategy, answer_delay: float = 0.0):
+        self.quiz = quiz
+        self.species_list = species_list
+        self.difficulty = difficulty
+        self.length = length
+        self.wildcard = wildcard
+        self.answer_strategy = answer_strategy
+        self.answer_delay = answer_delay  # simulated listening and typing time before each answer
+
+    def setup(self) -> float:
+        """Applies the options and filters and starts prefetching. Returns the time it took in seconds."""
+        start = time.perf_counter()
+        self.quiz.set_difficulty_level(self.difficulty)
+        self.quiz.set_quiz_length(self.length)
+        self.quiz.set_wildcard_filter(self.wildcard)
+        self.quiz.set_species_list(self.species_list)
+        self.quiz.difficulty_filter()
+        self.quiz.wildcard_filter()
+        self.quiz.length_filter()
+        self.quiz.start_prefetch()
+        return time.perf_counter() - start
+
+    def run(self) -> dict:
+        """
+        Plays the whole quiz.
+
+        :return result: setup time, per-question time-to-playable in seconds, and the score
+        """
+        setup_seconds = self.setup()
+        time_to_playable = []
+        try:
+            while self.quiz.has_more_species():
+                start = time.perf_counter()
+                self.quiz.next_species()
+                time_to_playable.append(time.perf_counter() - start)
+                if self.answer_delay:
+                    time.sleep(self.answer_delay)
+                self.quiz.check_answer(self.answer_strategy(self.quiz.current_species))
+        finally:
+            self.quiz.stop_prefetch()
+
+        correct, wrong, score_percent = self.quiz.get_score()
+        return {
+            "setup_seconds": setup_seconds,
+            "time_to_playable": time_to_playable,
+            "correct": correct,
+            "wrong": wrong,
+            "score_percent": score_percent,
+        }
@@ -0,0 +1,192 @@
+"""
+Offline ingest of quiz clips into a clip pack, so that the quiz never decodes anything live.
+Every selected recording of get_recordings() is downloaded, decoded, trimmed to the clip length,
+converted to the pack format and loudness-normalized in a pool of worker processes, and the
+main process appends the results to the pack.
+
+    - the pack is checkpointed after every clip, an interrupted run continues where it stopped
+    - at most --per-host downloads run against the same host at a time
+    - a throughput report in clips per second is printed at the end
+
+Run from the repository root:
+
+    python -m ingest --processes 8 --per-host 4 --per-species 10
+"""
+import argparse
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urlparse
+from clip_pack import ClipPackWriter, DEFAULT_PACK_PATH, DEFAULT_SAMPLE_RATE, CHANNELS, SAMPLE_WIDTH
+from recording_health import DOWNLOAD_DEADLINE, DOWNLOAD_TIMEOUT
+from sound_download import CLIP_LENGTH_MS
+
+TARGET_DBFS = -20.0  # RMS loudness every clip is normalized to
+PEAK_LIMIT = 0.99  # highest allowed peak after normalization, as a fraction of full scale
+
+_worker_session = None
+
+
+def normalize_loudness(pcm_data: bytes, target_dbfs: float = TARGET_DBFS) -> bytes:
+    """
+    Scales signed 16-bit PCM data to the target RMS level. The gain is lowered if the loudest
+    sample would clip, so quiet recordings with sharp peaks end up below the target.
+
+    :param pcm_data: signed 16-bit PCM data
+    :param target_dbfs: target RMS level in dB relative to full scale
+    :return pcm_data: normalized PCM data of the same length
+    """
+    import numpy as np
+
+    samples = np.frombuffer(pcm_data, dtype=np.int16).astype(np.float32) / 32768
+    if samples.size == 0:
+        return pcm_data
+    rms = np.sqrt(np.mean(np.square(samples)))
+    peak = np.max(np.abs(samples))
+    if rms == 0 or peak == 0:
+        return pcm_data
+    gain = min(10 ** (target_dbfs / 20) / rms, PEAK_LIMIT / peak)
+    return np.clip(samples * gain * 32768, -32768, 32767).astype(np.int16).tobytes()
+
+
+def _init_worker():
+    global _worker_session
+    import requests
+
+    _worker_session = requests.Session()
+
+
+def process_recording(xc_id: str, url: str, sample_rate: int = DEFAULT_SAMPLE_RATE,
+                      clip_length_ms: int = CLIP_LENGTH_MS, target_dbfs: float = TARGET_DBFS) -> tuple:
+    """
+    Runs in a worker process.
+
+    :return result: xc_id, the clip as normalized PCM data in the pack format or None, and the error message if it failed
+    """
+    from sound_download import download_clip
+
+    try:
+        sound = download_clip(url, clip_length_ms, session=_worker_session, timeout=DOWNLOAD_TIMEOUT,
+                              max_seconds=DOWNLOAD_DEADLINE)
+        sound = sound[:clip_length_ms].set_channels(CHANNELS).set_frame_rate(sample_rate)
+        sound = sound.set_sample_width(SAMPLE_WIDTH)
+        return xc_id, normalize_loudness(sound.raw_data, target_dbfs), None
+    except Exception as e:  # reported and retried on the next run, one bad recording shouldn't stop the ingest
+        return xc_id, None, repr(e)
+
+
+def select_recordings(recording_df, per_species: int | None = None, seed: int = 0) -> list[dict]:
+    """
+    :param recording_df: dataframe of bird sound recordings returned by get_recordings()
+    :param per_species: maximum number of recordings per species, all if None
+    :param seed: seed of the random choice of recordings when per_species is given
+    :return jobs: xc_id, download URL and clip pack metadata of every selected recording
+    """
+    from species_data import extract_license_types
+
+    if per_species is not None:
+        recording_df = recording_df.sample(frac=1, random_state=seed).groupby("sciName", sort=False).head(per_species)
+    license_types = extract_license_types(recording_df["lic"])
+    return [{
+        "xc_id": f"XC{xc_id}",
+        "url": url,
+        "metadata": {"recordist": rec, "country": cnt, "location": loc, "sound_type": sound_type,
+                     "license_type": license_type},
+    } for xc_id, url, rec, cnt, loc, sound_type, license_type in zip(
+        recording_df["id"], recording_df["file"], recording_df["rec"], recording_df["cnt"], recording_df["loc"],
+        recording_df["type"], license_types)]
+
+
+def ingest(jobs: list[dict], path: str = DEFAULT_PACK_PATH, processes: int = 4, per_host: int = 4,
+           sample_rate: int = DEFAULT_SAMPLE_RATE, target_dbfs: float = TARGET_DBFS) -> dict:
+    """
+    Processes the jobs in a process pool and appends the clips to the pack at path, resuming
+    from its checkpoint if an earlier run was interrupted. Downloads are submitted so that no
+    more than per_host of them are in flight for one host.
+
+    :param jobs: recordings returned by select_recordings()
+    :param path: path of the pack file
+    :param processes: number of worker processes
+    :param per_host: maximum number of concurrent downloads from one host
+    :param sample_rate: sample rate of the clips in the pack
+    :param target_dbfs: RMS level the clips are normalized to
+    :return report: numbers of added, already packed and failed clips, time taken and clips per second
+    """
+    report = {"added": 0, "already_packed": 0, "failed": 0, "bytes": 0}
+    start = time.perf_counter()
+    with ClipPackWriter(path, sample_rate, resume=True) as writer, \
+            ProcessPoolExecutor(max_workers=processes, initializer=_init_worker) as executor:
+        queues = {}  # pending jobs by host, the host parsed once per job
+        jobs_by_id = {}
+        for job in jobs:
+            if job["xc_id"] in writer:
+                report["already_packed"] += 1
+            else:
+                queues.setdefault(urlparse(job["url"]).netloc, deque()).append(job)
+                jobs_by_id[job["xc_id"]] = job
+
+        in_flight = {}
+        host_load = dict.fromkeys(queues, 0)
+        ready_hosts = deque(queues)  # hosts with pending jobs and fewer than per_host in flight, round-robin
+        ready = set(ready_hosts)
+
+        def submit_ready():
+            while ready_hosts and len(in_flight) < processes * 2:
+                host = ready_hosts.popleft()
+                job = queues[host].popleft()
+                future = executor.submit(process_recording, job["xc_id"], job["url"], sample_rate,
+                                         CLIP_LENGTH_MS, target_dbfs)
+                in_flight[future] = host
+                host_load[host] += 1
+                if queues[host] and host_load[host] < per_host:
+                    ready_hosts.append(host)
+                else:
+                    ready.discard(host)
+
+        submit_ready()
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                host = in_flight.pop(future)
+                host_load[host] -= 1
+                if queues[host] and host not in ready:
+                    ready.add(host)
+                    ready_hosts.append(host)
+                xc_id, pcm_data, error = future.result()
+                if pcm_data is None:
+                    print(f"Skipping {xc_id}: {error}")
+                    report["failed"] += 1
+                    continue
+                writer.add_pcm(xc_id, pcm_data, jobs_by_id[xc_id]["metadata"])
+                report["added"] += 1
+                report["bytes"] += len(pcm_data)
+            submit_ready()
+
+    report["seconds"] = time.perf_counter() - start
+    report["clips_per_second"] = report["added"] / report["seconds"] if report["seconds"] else 0.0
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pack", default=DEFAULT_PACK_PATH, help="path of the clip pack to write")
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--per-host", type=int, default=4, help="maximum concurrent downloads from one host")
+    parser.add_argument("--per-species", type=int, default=None, help="maximum recordings per species")
+    parser.add_argument("--sample-rate", type=int, default=DEFAULT_SAMPLE_RATE)
+    parser.add_argument("--target-dbfs", type=float, default=TARGET_DBFS)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    from species_data import get_species, get_recordings
+
+    recording_df = get_recordings(get_species())
+    jobs = select_recordings(recording_df, args.per_species, args.seed)
+    report = ingest(jobs, args.pack, args.processes, args.per_host, args.sample_rate, args.target_dbfs)
+    print(f"Added {report['added']} clips ({report['bytes'] / 2 ** 20:.1f} MB), "
+          f"{report['already_packed']} already packed, {report['failed']} failed, "
+          f"in {report['seconds']:.1f} s: {report['clips_per_second']:.2f} clips/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+Lightweight timers and counters for the hot paths of the quiz. Disabled by default, in which
+case timer() returns a shared no-op context manager and timed() wrappers only check a flag.
+When enabled, per-session summaries (count, total, p50, p95, max) can be appended to a JSON
+lines file with export_session(), one line per session, for aggregating across machines.
+
+Enable by setting BIRDQUIZ_METRICS to the path of the JSON lines file, or call enable().
+"""
+import functools
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+METRICS_ENV_VAR = "BIRDQUIZ_METRICS"
+
+_enabled = False
+_export_path = None
+_lock = threading.Lock()
+_timings = defaultdict(list)
+_counters = defaultdict(float)
+_session_id = None
+_session_start = None
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+class _Timer:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+NULL_TIMER = _NullTimer()
+
+
+def enable(export_path: str | None = None):
+    """
+    :param export_path: JSON lines file the session summaries are appended to
+    """
+    global _enabled, _export_path
+    _export_path = export_path
+    _enabled = True
+    reset()
+
+
+def enable_from_env():
+    """Enables instrumentation if BIRDQUIZ_METRICS is set, exporting to the path it contains."""
+    export_path = os.environ.get(METRICS_ENV_VAR)
+    if export_path:
+        enable(export_path)
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def reset():
+    global _session_id, _session_start
+    with _lock:
+        _timings.clear()
+        _counters.clear()
+        _session_id = uuid.uuid4().hex
+        _session_start = time.time()
+
+
+def timer(name: str):
+    """
+    Context manager measuring the wall time of its block under name.
+
+    :param name: metric name, e.g. "download.decode"
+    """
+    if not _enabled:
+        return NULL_TIMER
+    return _Timer(name)
+
+
+def timed(name: str):
+    """Decorator measuring the wall time of every call of the function under name."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def record(name: str, seconds: float):
+    if not _enabled:
+        return
+    with _lock:
+        _timings[name].append(seconds)
+
+
+def count(name: str, value: float = 1):
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] += value
+
+
+def _percentile(ordered: list[float], q: float) -> float:
+    position = (len(ordered) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summary() -> dict:
+    """
+    :return summary: timer statistics in seconds and counter totals of the current session
+    """
+    with _lock:
+        timings = {name: sorted(values) for name, values in _timings.items() if values}
+        counters = dict(_counters)
+    return {
+        "timers": {name: {
+            "count": len(values),
+            "total": sum(values),
+            "p50": _percentile(values, 0.5),
+            "p95": _percentile(values, 0.95),
+            "max": values[-1],
+        } for name, values in timings.items()},
+        "counters": counters,
+    }
+
+
+def export_session(path: str | None = None):
+    """
+    Appends the summary of the current session as one JSON line and starts a new session.
+
+    :param path: JSON lines file, the path given to enable() if not given
+    """
+    path = path or _export_path
+    if not _enabled or not path:
+        return
+    line = {
+        "session_id": _session_id,
+        "host": socket.gethostname(),
+        "started": _session_start,
+        "ended": time.time(),
+        **summary(),
+    }
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a") as f:
+        f.write(json.dumps(line) + "\n")
+    reset()
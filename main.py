@@ -1,13 +1,28 @@
-from species_data import get_species, get_recordings, reformat_recordings
+import sys
+import instrumentation
+from answer_history import AnswerHistory
+from catalog import load_species_list
+from clip_pack import load_default_clip_pack
+from confusables import load_default_confusables
+from playback import AudioBackendConfigError, backend_from_env, playback_engine
 from quiz import Quiz
+from spectrogram import sound_spectrogram
 from ui import QuizApp
-import pandas as pd
 
 
-species_df = get_species()
-recordings = get_recordings(species_df)
-quiz_species = reformat_recordings(recordings)
+def load_catalog():
+    with instrumentation.timer("catalog.load"):
+        quiz_species = load_species_list()
+    load_default_clip_pack()
+    return quiz_species
 
-quiz_brain = Quiz()
-quiz_app = QuizApp(quiz=quiz_brain, quiz_species=quiz_species)
+
+instrumentation.enable_from_env()
+try:
+    playback_engine.set_backend(backend_from_env())
+except AudioBackendConfigError as e:
+    sys.exit(str(e))
+
+quiz_brain = Quiz(history=AnswerHistory(), prepare_sound=sound_spectrogram, confusables=load_default_confusables())
+quiz_app = QuizApp(quiz=quiz_brain, catalog_loader=load_catalog)
 quiz_app.mainloop()
@@ -0,0 +1,272 @@
+"""
+Playback of quiz clips from ready-to-play PCM buffers. A clip is converted to a PcmClip once,
+when it is decoded or read from the clip pack, and every later play, resume or seek only hands
+a zero-copy slice of its buffer to the output backend.
+
+The output backend is chosen with BIRDQUIZ_AUDIO_BACKEND:
+
+    simpleaudio     -> sound card through simpleaudio (default)
+    null            -> no output, playback only advances with the clock
+    wav:<path>      -> every started stream is appended to a WAV file, for headless tests and benchmarks
+"""
+import os
+import threading
+import time
+import wave
+import instrumentation
+
+AUDIO_BACKEND_ENV_VAR = "BIRDQUIZ_AUDIO_BACKEND"
+SAMPLE_WIDTHS = (1, 2, 3, 4)
+
+
+class AudioBackendConfigError(Exception):
+    """Raised when BIRDQUIZ_AUDIO_BACKEND doesn't name an output backend."""
+
+
+class ClipFormatError(ValueError):
+    """Raised when the sample format of a clip can't be played, which will happen again on every attempt."""
+
+
+class PcmClip:
+    """Interleaved PCM sample data with its format, as played by the output backends."""
+
+    __slots__ = ("raw_data", "channels", "sample_width", "frame_rate")
+
+    def __init__(self, raw_data, channels: int, sample_width: int, frame_rate: int):
+        if channels < 1 or sample_width not in SAMPLE_WIDTHS or frame_rate < 1:
+            raise ClipFormatError(f"Unsupported clip format: {channels} channels, {sample_width} bytes per sample, "
+                                  f"{frame_rate} Hz")
+        self.raw_data = memoryview(raw_data).cast("B")
+        self.channels = channels
+        self.sample_width = sample_width
+        self.frame_rate = frame_rate
+
+    @classmethod
+    def from_segment(cls, sound) -> "PcmClip":
+        """
+        :param sound: decoded AudioSegment
+        :return clip: the sample data of the segment, without a copy
+        """
+        instrumentation.count("playback.conversions")
+        return cls(sound.raw_data, sound.channels, sound.sample_width, sound.frame_rate)
+
+    def to_segment(self):
+        """
+        :return sound: copy of the clip as an AudioSegment, for code that needs pydub
+        """
+        from pydub import AudioSegment
+        return AudioSegment(data=bytes(self.raw_data), sample_width=self.sample_width,
+                            frame_rate=self.frame_rate, channels=self.channels)
+
+    @property
+    def frame_size(self) -> int:
+        return self.channels * self.sample_width
+
+    def __len__(self):
+        """Length of the clip in milliseconds, like len() of an AudioSegment."""
+        return len(self.raw_data) * 1000 // (self.frame_size * self.frame_rate)
+
+    def offset(self, position_ms: float) -> int:
+        """
+        :param position_ms: position in the clip in milliseconds
+        :return offset: byte offset of the frame at the position, clamped to the clip
+        """
+        frame = int(position_ms * self.frame_rate / 1000)
+        return min(max(frame, 0) * self.frame_size, len(self.raw_data))
+
+
+class NullStream:
+    """Stream of a backend without output. It plays for as long as its buffer would take."""
+
+    def __init__(self, duration: float):
+        self.ends_at = time.monotonic() + duration
+        self._stopped = False
+
+    def stop(self):
+        self._stopped = True
+
+    def is_playing(self) -> bool:
+        return not self._stopped and time.monotonic() < self.ends_at
+
+
+class NullBackend:
+    """Discards the audio. Counts the started streams so tests can check what was played."""
+
+    def __init__(self):
+        self.started = 0
+        self.bytes_started = 0
+
+    def start(self, buffer: memoryview, channels: int, sample_width: int, frame_rate: int) -> NullStream:
+        self.started += 1
+        self.bytes_started += len(buffer)
+        return NullStream(len(buffer) / (channels * sample_width * frame_rate))
+
+
+class WavFileBackend(NullBackend):
+    """Appends every started stream to a WAV file, so playback can be checked by ear or by tools."""
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self._wav = None
+        self._lock = threading.Lock()
+
+    def start(self, buffer: memoryview, channels: int, sample_width: int, frame_rate: int) -> NullStream:
+        with self._lock:
+            if self._wav is None:
+                self._wav = wave.open(self.path, "wb")
+                self._wav.setnchannels(channels)
+                self._wav.setsampwidth(sample_width)
+                self._wav.setframerate(frame_rate)
+            if (channels, sample_width, frame_rate) == \
+                    (self._wav.getnchannels(), self._wav.getsampwidth(), self._wav.getframerate()):
+                self._wav.writeframes(buffer)
+        return super().start(buffer, channels, sample_width, frame_rate)
+
+    def close(self):
+        with self._lock:
+            if self._wav is not None:
+                self._wav.close()
+                self._wav = None
+
+
+class SimpleaudioBackend:
+    """Plays through simpleaudio. Each stream is a PlayObject that can be stopped on its own."""
+
+    def start(self, buffer: memoryview, channels: int, sample_width: int, frame_rate: int):
+        from simpleaudio import play_buffer  # imported on first play, so the quiz starts without it
+
+        try:
+            return play_buffer(buffer, channels, sample_width, frame_rate)
+        except ValueError as e:  # simpleaudio's only complaint about a buffer is its format
+            raise ClipFormatError(str(e)) from e
+
+
+def backend_from_env():
+    """
+    Called once at startup by the entry points, so a misspelled backend stops the program there
+    instead of failing every clip.
+
+    :return backend: output backend named by BIRDQUIZ_AUDIO_BACKEND, simpleaudio if it isn't set
+    :raises AudioBackendConfigError: if the variable names no backend
+    """
+    name = os.environ.get(AUDIO_BACKEND_ENV_VAR, "simpleaudio")
+    if name == "null":
+        return NullBackend()
+    if name.startswith("wav:"):
+        return WavFileBackend(name[len("wav:"):])
+    if name == "simpleaudio":
+        return SimpleaudioBackend()
+    raise AudioBackendConfigError(f"Unknown audio backend {name!r} in {AUDIO_BACKEND_ENV_VAR}, "
+                                  f"use simpleaudio, null or wav:<path>")
+
+
+class Playback:
+    """
+    Playback state of one clip. Pausing stops the backend stream and remembers the position, and
+    resuming or seeking starts a new stream from a slice of the same buffer, so nothing is converted
+    again. Stopping affects only this clip's stream.
+    """
+
+    def __init__(self, engine: "PlaybackEngine", clip: PcmClip):
+        self.engine = engine
+        self.clip = clip
+        self._stream = None
+        self._started_at = None
+        self._start_ms = 0.0
+        self._paused_ms = None
+        self._lock = threading.Lock()
+
+    def _start(self, position_ms: float):
+        offset = self.clip.offset(position_ms)
+        self._start_ms = offset // self.clip.frame_size * 1000 / self.clip.frame_rate
+        self._paused_ms = None
+        if offset >= len(self.clip.raw_data):
+            self._stream = None
+            return
+        self._stream = self.engine.backend.start(self.clip.raw_data[offset:], self.clip.channels,
+                                                 self.clip.sample_width, self.clip.frame_rate)
+        self._started_at = time.monotonic()
+
+    def _stop_stream(self):
+        if self._stream is not None:
+            self._stream.stop()
+            self._stream = None
+
+    def play(self, position_ms: float = 0):
+        with self._lock:
+            self._stop_stream()
+            self._start(position_ms)
+
+    def position_ms(self) -> float:
+        """Current position in the clip in milliseconds."""
+        with self._lock:
+            if self._paused_ms is not None:
+                return self._paused_ms
+            if self._stream is None or not self._stream.is_playing():
+                return float(len(self.clip)) if self._stream is not None else self._start_ms
+            return min(self._start_ms + (time.monotonic() - self._started_at) * 1000, float(len(self.clip)))
+
+    def pause(self):
+        position_ms = self.position_ms()
+        with self._lock:
+            if self._stream is not None:
+                self._stop_stream()
+                self._paused_ms = position_ms
+
+    def resume(self):
+        with self._lock:
+            if self._paused_ms is not None:
+                self._start(self._paused_ms)
+
+    def seek(self, position_ms: float):
+        """Moves to position_ms, keeps playing if the clip was playing and stays paused otherwise."""
+        with self._lock:
+            playing = self._stream is not None and self._stream.is_playing()
+            self._stop_stream()
+            if playing:
+                self._start(position_ms)
+            else:
+                self._paused_ms = max(0.0, min(float(position_ms), float(len(self.clip))))
+
+    def stop(self):
+        with self._lock:
+            self._stop_stream()
+            self._paused_ms = None
+            self._start_ms = 0.0
+
+    def is_paused(self) -> bool:
+        return self._paused_ms is not None
+
+    def is_playing(self) -> bool:
+        stream = self._stream
+        return stream is not None and stream.is_playing()
+
+
+class PlaybackEngine:
+    """Starts Playback objects on a pluggable output backend."""
+
+    def __init__(self, backend=None):
+        self._backend = backend
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            self._backend = backend_from_env()
+        return self._backend
+
+    def set_backend(self, backend):
+        self._backend = backend
+
+    def play(self, clip: PcmClip, position_ms: float = 0) -> Playback:
+        """
+        :param clip: clip to play
+        :param position_ms: position to start from in milliseconds
+        :return playback: handle for pausing, resuming, seeking and stopping the clip
+        """
+        playback = Playback(self, clip)
+        playback.play(position_ms)
+        return playback
+
+
+playback_engine = PlaybackEngine()
@@ -1,14 +1,24 @@
-import requests
-from io import BytesIO
-from pydub import AudioSegment
-from pydub.playback import _play_with_simpleaudio
-from simpleaudio import stop_all
 import random
-import re
-import requests
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, CancelledError
+from audio_cache import decoded_audio_cache
+from recording_health import recording_health, RecordingUnavailable, HostUnavailable
+from clip_pack import get_active_clip_pack
+from playback import ClipFormatError, PcmClip, playback_engine
+from recording_table import RecordingTable
+from species_index import SpeciesIndex
+from answer_history import HistorySampler
+import instrumentation
+
+
+MAX_SPECIES_SWAPS = 3  # unplayable species replaced per question before giving up
 
 
 class BirdSound:
+    __slots__ = ("xc_id", "url", "download_url", "recordist", "country", "location", "sound_type", "license_type",
+                 "playback")
+
     def __init__(self,
                  xc_id: int,
                  url: str,
@@ -26,20 +36,51 @@ class BirdSound:
         self.location = location
         self.sound_type = sound_type
         self.license_type = license_type
-        self.sound = None
         self.playback = None
 
-    def download_sound_file(self):
-        sound_data = requests.get(self.download_url).content
-        sound_file = AudioSegment.from_file(BytesIO(sound_data))[:15000]  # first 15 seconds of the file
-        self.sound = sound_file
+    @classmethod
+    def from_table(cls, recording_table: RecordingTable, idx: int):
+        """Creates a lightweight view of row idx of the recording table."""
+        return cls(*recording_table.row(idx))
+
+    @property
+    def sound(self):
+        """Ready-to-play clip of the recording from the shared cache, or None if it is not cached."""
+        return decoded_audio_cache.get(self.xc_id)
+
+    def is_packed(self):
+        clip_pack = get_active_clip_pack()
+        return clip_pack is not None and self.xc_id in clip_pack
 
+    def download_sound_file(self) -> PcmClip:
+        if self.is_packed():
+            return get_active_clip_pack().get_clip(self.xc_id)
+        return decoded_audio_cache.get_or_load(self.xc_id, self._load_clip)
+
+    def _load_clip(self) -> PcmClip:
+        sound = recording_health.download(self.xc_id, self.download_url)  # first 15 seconds of the file
+        return PcmClip.from_segment(sound)  # converted once, every later play reuses the buffer
+
+    @instrumentation.timed("playback.start")
     def play_sound(self):
-        self.playback = _play_with_simpleaudio(self.sound)
+        if self.playback and self.playback.is_paused():
+            self.playback.resume()
+            return
+        self.stop_sound()
+        sound_file = self.download_sound_file()  # downloads again only if the sound was evicted from the cache
+        self.playback = playback_engine.play(sound_file)
+
+    def pause_sound(self):
+        if self.playback:
+            self.playback.pause()
+
+    def seek_sound(self, position_ms: float):
+        if self.playback:
+            self.playback.seek(position_ms)
 
     def stop_sound(self):
         if self.playback:
-            stop_all()
+            self.playback.stop()
 
     def is_playing(self):
         if self.playback:
@@ -49,38 +90,91 @@ class BirdSound:
 
 
 class MysterySpecies:
-    def __init__(self, common_name_FI: str, common_name_EN: str, scientific_name: str, sounds: [], square_count: int):
+    max_download_attempts = 4  # recordings tried per question before giving up
+    max_play_attempts = 2
+
+    def __init__(self, common_name_FI: str, common_name_EN: str, scientific_name: str,
+                 recording_table: RecordingTable, recording_range: range, square_count: int):
         self.correct_answers = {
             "comNameFI": common_name_FI.lower().strip(),
             "comNameEN": common_name_EN.lower().strip(),
             "sciName": scientific_name.lower().strip()
         }
         self.square_count = square_count
-        self.sounds = sounds
+        self.recording_table = recording_table
+        self.recording_range = recording_range
+        self.failed_recordings = set()
         self.current_sound = None
 
-    def set_current_sound(self):
-        successful_download = False
-        while not successful_download:
-            random_sound_idx = random.choice(range(len(self.sounds)))
-            random_sound = self.sounds[random_sound_idx]
+    @property
+    def sounds(self):
+        """BirdSound views of all recordings of the species that haven't failed to download."""
+        return [BirdSound.from_table(self.recording_table, idx) for idx in self.recording_range
+                if idx not in self.failed_recordings]
+
+    def candidate_recordings(self) -> list[int]:
+        """
+        Rows of the recordings worth trying, in random order. Recordings that failed earlier in this
+        session or are in the persisted negative cache are left out, and recordings that are already
+        in the clip pack or the decoded audio cache come first because they need no download.
+        """
+        clip_pack = get_active_clip_pack()
+        ready, other = [], []
+        for idx in self.recording_range:
+            if idx in self.failed_recordings:
+                continue
+            xc_id = self.recording_table.xc_id(idx)
+            if recording_health.is_known_bad(xc_id):
+                self.failed_recordings.add(idx)
+            elif (clip_pack is not None and xc_id in clip_pack) or xc_id in decoded_audio_cache:
+                ready.append(idx)
+            else:
+                other.append(idx)
+        random.shuffle(ready)
+        random.shuffle(other)
+        return ready + other
+
+    def pick_sound(self) -> BirdSound:
+        """
+        Chooses a recording and loads its sound into the shared cache without touching current_sound,
+        so quizzes sharing this MysterySpecies can pick recordings independently.
+        """
+        candidates = self.candidate_recordings()
+        if not candidates:
+            raise RecordingUnavailable(f"No playable recordings of {self.correct_answers['sciName']}")
+        last_error = None
+        for random_sound_idx in candidates[:self.max_download_attempts]:
+            random_sound = BirdSound.from_table(self.recording_table, random_sound_idx)
             try:
-                random_sound.download_sound_file()
-            except requests.exceptions.MissingSchema:
-                print("Download failed...")
-                self.sounds.pop(random_sound_idx)
+                if not random_sound.is_packed():
+                    random_sound.download_sound_file()
+            except HostUnavailable:
+                raise
+            except RecordingUnavailable as e:
+                print("Download failed...", e)
+                self.failed_recordings.add(random_sound_idx)
+                last_error = e
                 continue
-            self.current_sound = random_sound
-            successful_download = True
+            return random_sound
+        raise RecordingUnavailable(f"No recording of {self.correct_answers['sciName']} could be loaded") from last_error
 
     def play_current_sound(self):
+        """
+        :raises RecordingUnavailable: if the clip's format can't be played, after marking the recording bad;
+                                      other errors, e.g. of the audio output, are raised as they are
+        """
+        if not self.current_sound:
+            return
+        try:
+            self.current_sound.play_sound()
+        except ClipFormatError as e:
+            print("Error playing sound")
+            recording_health.mark_bad(self.current_sound.xc_id, repr(e))
+            raise RecordingUnavailable(f"{self.current_sound.xc_id} can't be played") from e
+
+    def pause_current_sound(self):
         if self.current_sound:
-            try:
-                self.current_sound.play_sound()
-            except ValueError:
-                print("Error playing sound")
-                self.set_current_sound()
-                self.play_current_sound()
+            self.current_sound.pause_sound()
 
     def stop_current_sound(self):
         if self.current_sound:
@@ -92,6 +186,13 @@ class SpeciesList(object):
         self.full_species_list = full_species_list
         self.current_species_list = full_species_list
         self._data_len = len(self.current_species_list)
+        self._index = None
+
+    def get_index(self):
+        """SpeciesIndex over the full species list, built on first use and shared by all quizzes."""
+        if self._index is None:
+            self._index = SpeciesIndex(self.full_species_list)
+        return self._index
 
     def __iter__(self):
         for elem in self.current_species_list:
@@ -104,19 +205,113 @@ class SpeciesList(object):
         return self._data_len
 
 
+class SoundPrefetcher:
+    """
+    Downloads and decodes the sounds of upcoming quiz species in background threads,
+    keeping up to `depth` species ahead of the one currently being asked.
+    """
+
+    def __init__(self, species_list: [], depth: int = 2, max_workers: int = 2, executor=None, prepare=None):
+        """
+        :param executor: thread pool to load the sounds on, shared with other prefetchers; a pool of
+                         max_workers threads owned by this prefetcher is created if not given
+        :param prepare: function called with every loaded BirdSound on the loading thread
+        """
+        self.species_list = species_list
+        self.depth = depth
+        self.prepare = prepare
+        self._futures = {}
+        self._lock = threading.Lock()
+        self._cancelled = threading.Event()
+        self._own_executor = executor is None
+        self._executor = executor or ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+
+    def _load(self, species_idx: int):
+        if self._cancelled.is_set():
+            return None
+        return self._pick(species_idx)
+
+    def _pick(self, species_idx: int) -> BirdSound:
+        sound = self.species_list[species_idx].pick_sound()
+        if self.prepare:
+            self.prepare(sound)
+        return sound
+
+    def schedule(self, start_idx: int):
+        """Starts loading the sounds of species start_idx ... start_idx + depth - 1 that are not loading yet."""
+        with self._lock:
+            if self._cancelled.is_set():
+                return
+            for species_idx in range(start_idx, min(start_idx + max(self.depth, 1), len(self.species_list))):
+                if species_idx not in self._futures:
+                    self._futures[species_idx] = self._executor.submit(self._load, species_idx)
+
+    def get(self, species_idx: int):
+        """Waits until the sound of the species at species_idx is loaded and starts prefetching the ones after it."""
+        self.schedule(species_idx)
+        with self._lock:
+            future = self._futures.pop(species_idx)
+        try:
+            sound = future.result()
+        except CancelledError:
+            sound = None
+        if sound is None:
+            sound = self._pick(species_idx)
+        self.schedule(species_idx + 1)
+        return sound
+
+    def cancel(self):
+        self._cancelled.set()
+        with self._lock:
+            for future in self._futures.values():
+                future.cancel()
+            self._futures.clear()
+        if self._own_executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+
 class Quiz:
-    def __init__(self):
+    def __init__(self, prefetch_depth: int = 2, history=None, prefetch_executor=None, prepare_sound=None,
+                 confusables=None):
+        """
+        :param prefetch_depth: number of upcoming species whose sounds are loaded in the background
+        :param history: AnswerHistory the answers are logged to, and which weights the species drawn
+                        by length_filter() towards species answered wrong and not asked recently
+        :param prefetch_executor: thread pool the sounds are prefetched on, one per quiz if not given
+        :param prepare_sound: function called with the BirdSound of every question once its clip has been
+                              loaded, on the same thread, e.g. to render its spectrogram ahead of time
+        :param confusables: ConfusableTable the wrong options of multiple-choice questions are taken from
+        """
         self.mystery_species_list = None
         self.current_species = None
+        self.current_sound = None
         self.species_no = 0
         self.score = 0
         self.answers = []
         self.difficulty_level = 1
         self.quiz_length = 10
         self.wildcard_pattern = None
+        self.answer_tolerance = 0  # largest accepted edit distance of a misspelled answer
+        self.multiple_choice = False
+        self.confusables = confusables
+        self.prefetch_depth = prefetch_depth
+        self.prefetch_executor = prefetch_executor
+        self.prepare_sound = prepare_sound
+        self._prefetcher = None
+        self.species_index = None
+        self._pool = None
+        self._spare_pool = []  # filtered species left out by length_filter, swapped in for unplayable ones
+        self.history = history
+        self._sampler = None
+        self._asked_at = None
 
     def set_species_list(self, species_list):
         self.mystery_species_list = species_list
+        if isinstance(species_list, SpeciesList):
+            self.species_index = species_list.get_index()
+        else:
+            self.species_index = SpeciesIndex(species_list)
+        self._pool = list(range(len(self.species_index)))  # positions of the remaining species in the index
 
     def set_difficulty_level(self, level: int):
         self.difficulty_level = level
@@ -127,57 +322,186 @@ class Quiz:
     def set_wildcard_filter(self, pattern: str):
         self.wildcard_pattern = pattern
 
+    def set_answer_tolerance(self, max_distance: int):
+        self.answer_tolerance = max_distance
+
+    def set_multiple_choice(self, enabled: bool):
+        self.multiple_choice = enabled
+
+    def answer_options(self, count: int = 4, rng=random) -> list:
+        """
+        Options of a multiple-choice question: the current species and count - 1 wrong ones, shuffled.
+        The wrong options are the most similar sounding species in the confusable species table. Species
+        without features in the table get species of the same genus, and then random ones.
+
+        :return options: MysterySpecies objects of the options
+        """
+        index = self.species_index
+        sci_name = self.current_species.correct_answers["sciName"]
+        chosen = [index.by_sci_name[sci_name]]
+        candidates = []
+        if self.confusables is not None:
+            candidates.extend(index.by_sci_name.get(name) for name in self.confusables.neighbors(sci_name))
+        same_genus = list(index.by_genus.get(sci_name.split(" ")[0], ()))
+        rng.shuffle(same_genus)
+        candidates.extend(same_genus)
+        for position in candidates:
+            if len(chosen) == count:
+                break
+            if position is not None and position not in chosen:
+                chosen.append(position)
+        while len(chosen) < min(count, len(index)):
+            position = rng.randrange(len(index))
+            if position not in chosen:
+                chosen.append(position)
+        rng.shuffle(chosen)
+        return index.species_at(chosen)
+
+    def suggest_answers(self, prefix: str, limit: int = 8) -> list[str]:
+        """Names of all species in the catalog starting with prefix, not only of those in the quiz."""
+        if self.species_index is None:
+            return []
+        return self.species_index.suggest(prefix, limit)
+
+    def is_near_miss(self, user_answer: str) -> bool:
+        """
+        A misspelled answer is accepted if it is within answer_tolerance edits of a name of the current
+        species and no name of another species is closer, so that a real name of a different species
+        or an answer halfway between two species is never accepted.
+        """
+        if self.answer_tolerance <= 0 or self.species_index is None:
+            return False
+        match = self.species_index.closest_species(user_answer, self.answer_tolerance)
+        if match is None:
+            return False
+        _, positions = match
+        return len(positions) == 1 and self.species_index.species[positions.pop()] is self.current_species
+
+    @instrumentation.timed("quiz.wildcard_filter")
     def wildcard_filter(self):
         if self.wildcard_pattern:
-            regex_pattern = re.compile(rf'^{self.wildcard_pattern.replace("*", ".*")}$')
-            matched_species_list = [sp for sp in self.mystery_species_list
-                                    if regex_pattern.match(sp.correct_answers["comNameFI"])]
-            if len(matched_species_list) > 0:
-                self.mystery_species_list = matched_species_list
+            matches = self.species_index.wildcard_matches(self.wildcard_pattern)
+            matched_pool = [i for i in self._pool if i in matches]
+            if len(matched_pool) > 0:
+                self._pool = matched_pool
+                self.mystery_species_list = self.species_index.species_at(self._pool)
 
+    @instrumentation.timed("quiz.length_filter")
     def length_filter(self):
-        random_species = random.sample(self.mystery_species_list, min(len(self.mystery_species_list), self.quiz_length))
-        self.mystery_species_list = random_species
+        candidates = self._pool
+        if self.history is None:
+            self._pool = random.sample(self._pool, min(len(self._pool), self.quiz_length))
+        else:
+            if self._sampler is None or self._sampler.species_index is not self.species_index:
+                self._sampler = HistorySampler(self.species_index, self.history)
+            self._pool = self._sampler.sample(self._pool, self.quiz_length)
+        chosen = set(self._pool)
+        self._spare_pool = [i for i in candidates if i not in chosen]
+        random.shuffle(self._spare_pool)
+        self.mystery_species_list = self.species_index.species_at(self._pool)
 
+    @instrumentation.timed("quiz.difficulty_filter")
     def difficulty_filter(self):
         """
         Difficulty level determines how rare the species included in the quiz are.
-        The pool of possible quiz species is filtered by Atlas square count.
-
-            Level 1 -> Top 33.3% most common species by Atlas square count are included
-            Level 2 -> Top 66.6% most common
-            Level 3 -> All species
-            Level 4 -> Top 66.6% rarest
-            Level 5 -> Top 33.3% rarest
-        """
-        total_species_count = len(self.mystery_species_list)
-        min_square_count_ranks = {
-            1: int(total_species_count / 3),
-            2: int(total_species_count / 3 * 2),
-            3: int(total_species_count),
-            4: int(total_species_count / 3 * 2),
-            5: int(total_species_count / 3),
-        }
-        no_of_species = min_square_count_ranks[self.difficulty_level]
-        self.mystery_species_list = sorted(self.mystery_species_list, key=lambda x: x.square_count,
-                                           reverse=self.difficulty_level <= 3)[:no_of_species]
-        random.shuffle(self.mystery_species_list)
+        The pool of possible quiz species is filtered by Atlas square count, see SpeciesIndex.difficulty_slice.
+        """
+        self._pool = list(self.species_index.difficulty_slice(self.difficulty_level))
+        random.shuffle(self._pool)
+        self.mystery_species_list = self.species_index.species_at(self._pool)
+
+    def start_prefetch(self):
+        """Starts loading the sounds of the first species in the background. Call after the filters have been applied."""
+        self.stop_prefetch()
+        if self.prefetch_depth > 0:
+            self._prefetcher = SoundPrefetcher(self.mystery_species_list, depth=self.prefetch_depth,
+                                               executor=self.prefetch_executor, prepare=self.prepare_sound)
+            self._prefetcher.schedule(self.species_no)
+
+    def stop_prefetch(self):
+        if self._prefetcher:
+            self._prefetcher.cancel()
+            self._prefetcher = None
 
     def has_more_species(self):
         return self.species_no < len(self.mystery_species_list)
 
+    def _load_sound(self) -> BirdSound:
+        if self._prefetcher:
+            return self._prefetcher.get(self.species_no)
+        species_sound = self.current_species.pick_sound()
+        if self.prepare_sound:
+            self.prepare_sound(species_sound)
+        return species_sound
+
+    def replace_current_species(self) -> bool:
+        """
+        Swaps the species of the current question for a spare species of the filtered pool.
+
+        :return replaced: False if there are no spare species left
+        """
+        if not self._spare_pool:
+            return False
+        position = self._spare_pool.pop()
+        self._pool[self.species_no] = position
+        self.mystery_species_list[self.species_no] = self.species_index.species[position]
+        return True
+
+    @instrumentation.timed("quiz.next_species")
     def next_species(self):
-        self.current_species = self.mystery_species_list[self.species_no]
+        """
+        Loads the next question. A species none of whose recordings can be played is swapped for a spare
+        species, at most MAX_SPECIES_SWAPS times per question, so a question can't stall on one species.
+
+        :raises RecordingUnavailable: if no playable species was found, or a host is down
+        """
+        for swaps in range(MAX_SPECIES_SWAPS + 1):
+            self.current_species = self.mystery_species_list[self.species_no]
+            try:
+                species_sound = self._load_sound()
+                break
+            except HostUnavailable:
+                raise  # the recordings are fine, retrying later will work
+            except RecordingUnavailable as e:
+                print(f"Skipping {self.current_species.correct_answers['sciName']}: {e}")
+                if swaps == MAX_SPECIES_SWAPS or not self.replace_current_species():
+                    raise
+        self.current_species.current_sound = species_sound  # played by the desktop UI
+        self.current_sound = species_sound
         self.species_no += 1
-        self.current_species.set_current_sound()
-        species_sound = self.current_species.current_sound
-        print(species_sound.xc_id)
+        self._asked_at = time.monotonic()
 
         return species_sound
 
+    def play_current_sound(self) -> BirdSound:
+        """
+        Plays the clip of the current question. A clip that can't be played is replaced by another
+        recording of the same species, which becomes the current_sound of both the quiz and the species,
+        so the recording information and the answer log name the recording that was heard.
+
+        :return sound: the sound that is playing
+        :raises RecordingUnavailable: if no recording of the species could be played
+        """
+        species = self.current_species
+        for attempt in range(species.max_play_attempts):
+            try:
+                species.play_current_sound()
+                return species.current_sound
+            except HostUnavailable:
+                raise
+            except RecordingUnavailable:
+                if attempt == species.max_play_attempts - 1:
+                    raise
+            species_sound = species.pick_sound()
+            if self.prepare_sound:
+                self.prepare_sound(species_sound)
+            species.current_sound = species_sound
+            if species is self.current_species:  # the question may have changed while the clip was loading
+                self.current_sound = species_sound
+
     def check_answer(self, user_answer):
         correct_answers = list(self.current_species.correct_answers.values())
-        if user_answer in correct_answers:
+        if user_answer in correct_answers or self.is_near_miss(user_answer):
             self.score += 1
             correct = True
         else:
@@ -188,6 +512,10 @@ class Quiz:
              "answered_correctly": correct
              }
         )
+        if self.history is not None:
+            response_seconds = time.monotonic() - self._asked_at if self._asked_at is not None else 0.0
+            self.history.record(self.current_species.correct_answers["sciName"],
+                                self.current_sound.xc_id if self.current_sound else "", correct, response_seconds)
         return correct
 
     def get_score(self):
@@ -0,0 +1,196 @@
+import json
+import os
+import threading
+import time
+from functools import lru_cache
+from urllib.parse import urlparse
+import instrumentation
+
+DOWNLOAD_TIMEOUT = (3.05, 10)  # connect and read timeouts in seconds
+DOWNLOAD_DEADLINE = 30.0  # seconds one download attempt may take in total, however slowly the bytes arrive
+NEGATIVE_CACHE_PATH = "data/cache/bad_recordings.json"
+
+
+@lru_cache(maxsize=None)
+def download_errors() -> tuple[tuple, tuple]:
+    """
+    Imported on first download rather than at module load, so the quiz starts without requests and pydub.
+
+    :return errors: transient errors that say nothing about the recording itself, so the download is worth
+                    retrying, and permanent errors that will happen again on every attempt
+    """
+    import requests
+    from pydub.exceptions import CouldntDecodeError
+
+    transient_errors = (requests.exceptions.Timeout, requests.exceptions.ConnectionError,
+                        requests.exceptions.ChunkedEncodingError)
+    permanent_errors = (requests.exceptions.MissingSchema, requests.exceptions.InvalidSchema,
+                        requests.exceptions.InvalidURL, CouldntDecodeError)
+    return transient_errors, permanent_errors
+
+
+class RecordingUnavailable(Exception):
+    """Raised when a recording can't be downloaded or decoded."""
+
+
+class HostUnavailable(RecordingUnavailable):
+    """Raised without sending a request when the circuit breaker of the recording's host is open."""
+
+
+class RetryPolicy:
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.5, max_delay: float = 4.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int) -> float:
+        """
+        :param attempt: number of the failed attempt, starting from 0
+        :return delay: exponential backoff in seconds before the next attempt
+        """
+        return min(self.base_delay * 2 ** attempt, self.max_delay)
+
+
+class CircuitBreaker:
+    """
+    Stops sending requests to a host after failure_threshold consecutive transient failures.
+    After reset_timeout seconds one trial request is let through, and a success closes the
+    circuit again while a failure keeps it open for another reset_timeout.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = {}
+        self._opened_at = {}
+        self._lock = threading.Lock()
+
+    def allow(self, host: str) -> bool:
+        with self._lock:
+            opened_at = self._opened_at.get(host)
+            if opened_at is None:
+                return True
+            if time.monotonic() - opened_at >= self.reset_timeout:
+                self._opened_at[host] = time.monotonic()  # half-open: let this request through
+                return True
+            return False
+
+    def record_success(self, host: str):
+        with self._lock:
+            self._failures.pop(host, None)
+            self._opened_at.pop(host, None)
+
+    def record_failure(self, host: str):
+        with self._lock:
+            self._failures[host] = self._failures.get(host, 0) + 1
+            if self._failures[host] >= self.failure_threshold:
+                self._opened_at[host] = time.monotonic()
+
+
+class NegativeCache:
+    """Persisted set of Xeno-Canto ids of recordings that failed to download or decode."""
+
+    def __init__(self, path: str = NEGATIVE_CACHE_PATH):
+        self.path = path
+        self._entries = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> dict:
+        if self._entries is None:
+            try:
+                with open(self.path, "r") as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def __contains__(self, xc_id):
+        with self._lock:
+            return xc_id in self._load()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._load())
+
+    def add(self, xc_id: str, reason: str):
+        with self._lock:
+            entries = self._load()
+            entries[xc_id] = {"reason": reason, "time": time.time()}
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, self.path)
+
+
+class RecordingHealth:
+    """
+    Downloads recordings with timeouts, bounded retries with backoff and a per-host circuit breaker,
+    and remembers recordings that failed permanently so that they are never picked again.
+    The worst case time of one download is bounded by the retry policy and the deadline of each attempt.
+    """
+
+    def __init__(self, retry_policy: RetryPolicy | None = None, circuit_breaker: CircuitBreaker | None = None,
+                 negative_cache: NegativeCache | None = None, timeout=DOWNLOAD_TIMEOUT,
+                 deadline: float = DOWNLOAD_DEADLINE):
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        self.negative_cache = negative_cache or NegativeCache()
+        self.timeout = timeout
+        self.deadline = deadline
+
+    def is_known_bad(self, xc_id: str) -> bool:
+        return xc_id in self.negative_cache
+
+    def mark_bad(self, xc_id: str, reason: str):
+        instrumentation.count("recording_health.marked_bad")
+        self.negative_cache.add(xc_id, reason)
+
+    def download(self, xc_id: str, url: str):
+        """
+        :param xc_id: Xeno-Canto id of the recording
+        :param url: download URL of the recording
+        :return sound: decoded clip of the recording
+        :raises RecordingUnavailable: if the recording is known to be bad, fails permanently or runs out of retries
+        """
+        if self.is_known_bad(xc_id):
+            raise RecordingUnavailable(f"{xc_id} is in the negative cache")
+
+        import requests
+        from sound_download import download_clip
+
+        transient_errors, permanent_errors = download_errors()
+
+        host = urlparse(url).netloc
+        last_error = None
+        for attempt in range(self.retry_policy.max_attempts):
+            if not self.circuit_breaker.allow(host):
+                raise HostUnavailable(f"Too many failures from {host}, not downloading {xc_id}")
+            try:
+                sound = download_clip(url, timeout=self.timeout, max_seconds=self.deadline)
+            except permanent_errors as e:
+                self.mark_bad(xc_id, repr(e))
+                raise RecordingUnavailable(f"{xc_id} can't be downloaded or decoded") from e
+            except requests.exceptions.HTTPError as e:
+                status = e.response.status_code if e.response is not None else None
+                if status is not None and status < 500 and status != 429:
+                    self.circuit_breaker.record_success(host)  # the host is up, the recording is gone
+                    self.mark_bad(xc_id, repr(e))
+                    raise RecordingUnavailable(f"{xc_id} returned HTTP {status}") from e
+                last_error = e
+                self.circuit_breaker.record_failure(host)
+            except transient_errors as e:
+                last_error = e
+                self.circuit_breaker.record_failure(host)
+            else:
+                self.circuit_breaker.record_success(host)
+                return sound
+
+            instrumentation.count("recording_health.failed_attempts")
+            if attempt + 1 < self.retry_policy.max_attempts:
+                time.sleep(self.retry_policy.delay(attempt))
+
+        raise RecordingUnavailable(f"{xc_id} failed {self.retry_policy.max_attempts} times") from last_error
+
+
+recording_health = RecordingHealth()
@@ -0,0 +1,66 @@
+from array import array
+
+RECORDING_COLUMNS = ("id", "url", "file", "rec", "cnt", "loc", "type", "lic")
+SHARED_VALUE_COLUMNS = ("rec", "cnt", "loc", "type", "lic")  # columns with few distinct values
+
+
+def _share_values(values) -> tuple:
+    """Replaces equal values with one shared object, so repeated recordists, countries etc. are stored once."""
+    shared = {}
+    return tuple(shared.setdefault(value, value) for value in values)
+
+
+def _compact_ids(ids) -> array | list:
+    """Stores Xeno-Canto ids as a packed int64 array, or keeps them as given if any of them is not numeric."""
+    try:
+        return array("q", (int(xc_id) for xc_id in ids))
+    except (TypeError, ValueError):
+        return list(ids)
+
+
+class RecordingTable:
+    """
+    Column-oriented storage of bird sound recordings. Every column is a sequence with one value
+    per recording, and the recordings of one species occupy a contiguous range of rows, so a
+    MysterySpecies only needs to know its row range. BirdSound objects are created from rows
+    on demand instead of being stored for every recording.
+    """
+
+    __slots__ = ("columns", "_length")
+
+    def __init__(self, columns: dict):
+        lengths = {len(values) for values in columns.values()}
+        if len(lengths) > 1:
+            raise ValueError("All recording table columns must have the same length")
+        self.columns = {name: columns[name] for name in RECORDING_COLUMNS}
+        self.columns["id"] = _compact_ids(self.columns["id"])
+        for name in SHARED_VALUE_COLUMNS:
+            self.columns[name] = _share_values(self.columns[name])
+        self._length = lengths.pop() if lengths else 0
+
+    def __len__(self):
+        return self._length
+
+    def xc_id(self, idx: int) -> str:
+        """
+        :param idx: row number
+        :return xc_id: Xeno-Canto id of the recording in the same "XC12345" form as BirdSound.xc_id
+        """
+        return f"XC{self.columns['id'][idx]}"
+
+    def row(self, idx: int) -> tuple:
+        """
+        :param idx: row number
+        :return row: values of the row in RECORDING_COLUMNS order
+        """
+        return tuple(self.columns[name][idx] for name in RECORDING_COLUMNS)
+
+    @classmethod
+    def from_rows(cls, rows) -> "RecordingTable":
+        """
+        :param rows: sequence of tuples with values in RECORDING_COLUMNS order
+        :return table: recording table holding the rows
+        """
+        rows = list(rows)
+        columns = list(zip(*rows)) if rows else [() for _ in RECORDING_COLUMNS]
+        return cls(dict(zip(RECORDING_COLUMNS, columns)))
@@ -0,0 +1,379 @@
+"""
+Multi-player quiz server. One process holds one catalog, one decoded clip cache, one clip pack
+and one download pool, and serves any number of independent quiz sessions over a small JSON
+HTTP API built on asyncio streams. Blocking work (downloads and decoding) runs on thread pools,
+so the event loop only parses requests and writes responses. Given the catalog cache, the server
+syncs it once a day and swaps in a SpeciesList with the changed species reloaded, which new
+sessions then use.
+
+    GET    /health                        -> server status, session count and clip cache statistics
+    POST   /sessions                      -> new quiz, body {"difficulty", "length", "wildcard", "tolerance",
+                                             "multiple_choice"}
+    GET    /sessions/<id>                 -> score of the session
+    POST   /sessions/<id>/next            -> loads the next question, returns the recording information and
+                                             the answer options of a multiple-choice quiz
+    GET    /sessions/<id>/clip            -> clip of the current question as a WAV file
+    GET    /sessions/<id>/suggest?prefix= -> type-ahead answer suggestions
+    POST   /sessions/<id>/answer          -> checks the answer in body {"answer"}
+    DELETE /sessions/<id>                 -> ends the session
+
+Run from the repository root:
+
+    python -m server --port 8080
+"""
+import argparse
+import asyncio
+import json
+import struct
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse, parse_qs
+import instrumentation
+from audio_cache import decoded_audio_cache
+from quiz import Quiz
+
+SESSION_TTL = 60 * 60  # seconds of inactivity after which a session is dropped
+CATALOG_SYNC_INTERVAL = 24 * 60 * 60  # seconds between catalog syncs
+MAX_BODY_BYTES = 64 * 1024
+MAX_QUIZ_LENGTH = 1000
+MAX_ANSWER_TOLERANCE = 5
+
+
+class HttpError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def int_option(options: dict, name: str, default: int, valid: range) -> int:
+    """
+    :return value: integer value of options[name], default if it isn't given
+    :raises HttpError: 400 if the value isn't an integer in valid
+    """
+    value = options.get(name, default)
+    if isinstance(value, str) and value.strip().lstrip("-").isdigit():
+        value = int(value)
+    if isinstance(value, bool) or not isinstance(value, int) or value not in valid:
+        raise HttpError(400, f"{name} must be an integer from {valid.start} to {valid.stop - 1}")
+    return value
+
+
+def wav_header(data_length: int, channels: int, sample_width: int, frame_rate: int) -> bytes:
+    """
+    :return header: 44 byte header of a PCM WAV file whose sample data of data_length bytes follows it
+    """
+    byte_rate = frame_rate * channels * sample_width
+    return struct.pack("<4sI4s4sIHHIIHH4sI", b"RIFF", 36 + data_length, b"WAVE", b"fmt ", 16, 1, channels,
+                       frame_rate, byte_rate, channels * sample_width, sample_width * 8, b"data", data_length)
+
+
+class QuizSession:
+    __slots__ = ("session_id", "quiz", "lock", "last_seen")
+
+    def __init__(self, session_id: str, quiz: Quiz):
+        self.session_id = session_id
+        self.quiz = quiz
+        self.lock = asyncio.Lock()  # requests of one session are handled one at a time
+        self.last_seen = time.monotonic()
+
+
+class QuizServer:
+    """
+    Serves quiz sessions that share one SpeciesList. Every session has its own Quiz, and so its own
+    species pool, current question and score, while MysterySpecies, the species index and all
+    decoded sounds are shared. Sounds are prefetched for every session on one shared pool.
+
+    With a catalog_cache, the catalog is synced every catalog_sync_interval seconds. Running sessions
+    keep the SpeciesList they started with, new sessions get the updated one.
+    """
+
+    def __init__(self, species_list, max_workers: int = 16, prefetch_workers: int = 8, prefetch_depth: int = 1,
+                 session_ttl: float = SESSION_TTL, confusables=None, catalog_cache=None,
+                 catalog_sync_options: dict | None = None, catalog_sync_interval: float = CATALOG_SYNC_INTERVAL):
+        """
+        :param catalog_cache: CatalogCache species_list was loaded from, no syncs if None
+        :param catalog_sync_options: keyword arguments passed to sync_catalog(), e.g. stub server options
+        :param catalog_sync_interval: seconds between catalog syncs, no syncs if 0
+        """
+        self.species_list = species_list
+        self.confusables = confusables
+        self.species_list.get_index()  # built once here instead of racing in the first sessions
+        self.prefetch_depth = prefetch_depth
+        self.session_ttl = session_ttl
+        self.catalog_cache = catalog_cache
+        self.catalog_sync_options = catalog_sync_options or {}
+        self.catalog_sync_interval = catalog_sync_interval
+        self.sessions = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="quiz-server")
+        self._prefetch_executor = ThreadPoolExecutor(max_workers=prefetch_workers, thread_name_prefix="prefetch")
+        self._server = None
+        self._sweeper = None
+        self._syncer = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8080):
+        self._server = await asyncio.start_server(self._handle_connection, host, port)
+        self._sweeper = asyncio.create_task(self._sweep_sessions())
+        if self.catalog_cache is not None and self.catalog_sync_interval:
+            self._syncer = asyncio.create_task(self._sync_periodically())
+        return self
+
+    @property
+    def port(self) -> int:
+        return self._server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self):
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        for task in (self._sweeper, self._syncer):
+            if task:
+                task.cancel()
+        self._server.close()
+        await self._server.wait_closed()
+        for session in self.sessions.values():
+            session.quiz.stop_prefetch()
+        self.sessions.clear()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._prefetch_executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _sweep_sessions(self):
+        while True:
+            await asyncio.sleep(min(self.session_ttl, 60))
+            now = time.monotonic()
+            for session_id, session in list(self.sessions.items()):
+                if now - session.last_seen > self.session_ttl:
+                    session.quiz.stop_prefetch()
+                    del self.sessions[session_id]
+
+    async def _sync_periodically(self):
+        while True:
+            await asyncio.sleep(self.catalog_sync_interval)
+            try:
+                await self.sync_catalog()
+            except Exception as e:  # e.g. the network is down, the current catalog is kept
+                print(f"Catalog sync failed: {e!r}")
+
+    async def sync_catalog(self) -> set[str]:
+        """
+        Syncs the catalog cache and reloads only the species whose recordings changed.
+
+        :return affected: scientific names of the species whose recordings were added, changed or removed
+        """
+        from catalog import sync_catalog, update_species_list
+
+        start = time.perf_counter()
+        affected = await self._run(lambda: sync_catalog(self.catalog_cache, **self.catalog_sync_options))
+        if affected:
+            species_list = await self._run(update_species_list, self.species_list, self.catalog_cache, affected)
+            await self._run(species_list.get_index)
+            self.species_list = species_list
+        instrumentation.record("server.catalog_sync", time.perf_counter() - start)
+        return affected
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                if length > MAX_BODY_BYTES:
+                    await self._send_json(writer, 413, {"error": "Request body too large"})
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                start = time.perf_counter()
+                try:
+                    await self._dispatch(method, target, body, writer)
+                except HttpError as e:
+                    await self._send_json(writer, e.status, {"error": str(e)})
+                except Exception as e:
+                    await self._send_json(writer, 500, {"error": repr(e)})
+                instrumentation.record("server.request", time.perf_counter() - start)
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _send(self, writer: asyncio.StreamWriter, status: int, content_type: str, *parts):
+        length = sum(len(part) for part in parts)
+        writer.write(f"HTTP/1.1 {status} {'OK' if status < 400 else 'Error'}\r\n"
+                     f"Content-Type: {content_type}\r\nContent-Length: {length}\r\n\r\n".encode("latin-1"))
+        for part in parts:
+            writer.write(part)
+        await writer.drain()
+
+    async def _send_json(self, writer: asyncio.StreamWriter, status: int, content):
+        await self._send(writer, status, "application/json", json.dumps(content).encode())
+
+    def _session(self, session_id: str) -> QuizSession:
+        session = self.sessions.get(session_id)
+        if session is None:
+            raise HttpError(404, f"No session {session_id}")
+        session.last_seen = time.monotonic()
+        return session
+
+    async def _dispatch(self, method: str, target: str, body: bytes, writer: asyncio.StreamWriter):
+        url = urlparse(target)
+        parts = [part for part in url.path.split("/") if part]
+        try:
+            payload = json.loads(body) if body else {}
+        except ValueError:
+            raise HttpError(400, "Body is not valid JSON")
+
+        if parts == ["health"] and method == "GET":
+            return await self._send_json(writer, 200, {"sessions": len(self.sessions),
+                                                       "species": len(self.species_list),
+                                                       "clip_cache": decoded_audio_cache.stats()})
+        if parts == ["sessions"] and method == "POST":
+            return await self._send_json(writer, 200, await self.create_session(payload))
+        if len(parts) < 2 or parts[0] != "sessions":
+            raise HttpError(404, f"Unknown path {url.path}")
+
+        session = self._session(parts[1])
+        action = parts[2] if len(parts) > 2 else None
+        async with session.lock:
+            if action is None and method == "GET":
+                return await self._send_json(writer, 200, self.score(session))
+            if action is None and method == "DELETE":
+                session.quiz.stop_prefetch()
+                self.sessions.pop(session.session_id, None)
+                return await self._send_json(writer, 200, self.score(session))
+            if action == "next" and method == "POST":
+                return await self._send_json(writer, 200, await self.next_question(session))
+            if action == "clip" and method == "GET":
+                return await self.send_clip(session, writer)
+            if action == "suggest" and method == "GET":
+                prefix = parse_qs(url.query).get("prefix", [""])[0]
+                return await self._send_json(writer, 200, {"suggestions": session.quiz.suggest_answers(prefix)})
+            if action == "answer" and method == "POST":
+                return await self._send_json(writer, 200, self.answer(session, str(payload.get("answer", ""))))
+        raise HttpError(404, f"Unknown action {method} {url.path}")
+
+    async def create_session(self, options: dict) -> dict:
+        quiz = Quiz(prefetch_depth=self.prefetch_depth, prefetch_executor=self._prefetch_executor,
+                    confusables=self.confusables)
+        wildcard = options.get("wildcard") or None
+        if wildcard is not None and not isinstance(wildcard, str):
+            raise HttpError(400, "wildcard must be a string")
+        quiz.set_difficulty_level(int_option(options, "difficulty", 3, range(1, 6)))
+        quiz.set_quiz_length(int_option(options, "length", 10, range(1, MAX_QUIZ_LENGTH + 1)))
+        quiz.set_wildcard_filter(wildcard)
+        quiz.set_answer_tolerance(int_option(options, "tolerance", 1, range(0, MAX_ANSWER_TOLERANCE + 1)))
+        multiple_choice = options.get("multiple_choice", False)
+        if not isinstance(multiple_choice, bool):
+            raise HttpError(400, "multiple_choice must be true or false")
+        quiz.set_multiple_choice(multiple_choice)
+
+        def setup():
+            quiz.set_species_list(self.species_list)
+            quiz.difficulty_filter()
+            quiz.wildcard_filter()
+            quiz.length_filter()
+            quiz.start_prefetch()
+
+        await self._run(setup)
+        session = QuizSession(uuid.uuid4().hex, quiz)
+        self.sessions[session.session_id] = session
+        return {"session_id": session.session_id, "questions": len(quiz.mystery_species_list)}
+
+    async def next_question(self, session: QuizSession) -> dict:
+        quiz = session.quiz
+        if not quiz.has_more_species():
+            raise HttpError(409, "The quiz has no more questions")
+        start = time.perf_counter()
+        sound = await self._run(quiz.next_species)
+        instrumentation.record("server.next_question", time.perf_counter() - start)
+        question = {"question": quiz.species_no, "questions": len(quiz.mystery_species_list),
+                    "xc_id": sound.xc_id, "url": sound.url, "recordist": sound.recordist, "country": sound.country,
+                    "location": sound.location, "license_type": sound.license_type}
+        if quiz.multiple_choice:
+            question["options"] = [species.correct_answers["comNameFI"] for species in quiz.answer_options()]
+        return question
+
+    async def send_clip(self, session: QuizSession, writer: asyncio.StreamWriter):
+        sound = session.quiz.current_sound
+        if sound is None:
+            raise HttpError(409, "No question has been loaded yet")
+        clip = await self._run(sound.download_sound_file)  # cached, downloads again only if it was evicted
+        header = wav_header(len(clip.raw_data), clip.channels, clip.sample_width, clip.frame_rate)
+        await self._send(writer, 200, "audio/wav", header, clip.raw_data)
+
+    def answer(self, session: QuizSession, user_answer: str) -> dict:
+        quiz = session.quiz
+        if quiz.current_species is None:
+            raise HttpError(409, "No question has been loaded yet")
+        if len(quiz.answers) >= quiz.species_no:
+            raise HttpError(409, "The current question has been answered already")
+        correct = quiz.check_answer(user_answer.lower().strip())
+        return {"correct": correct, "correct_answers": quiz.answers[-1]["correct_answers"],
+                "more_questions": quiz.has_more_species(), **self.score(session)}
+
+    @staticmethod
+    def score(session: QuizSession) -> dict:
+        quiz = session.quiz
+        answered = len(quiz.answers)
+        return {"answered": answered, "score": quiz.score,
+                "score_percent": int(quiz.score / answered * 100) if answered else 0}
+
+
+async def serve(species_list, host: str, port: int, **options):
+    server = await QuizServer(species_list, **options).start(host, port)
+    print(f"Serving {len(species_list)} species at http://{host}:{server.port}")
+    try:
+        await server.serve_forever()
+    finally:
+        await server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=16, help="threads for downloads and quiz setup")
+    parser.add_argument("--sync-interval", type=float, default=CATALOG_SYNC_INTERVAL,
+                        help="seconds between catalog syncs, 0 to never sync")
+    parser.add_argument("--refresh", action="store_true",
+                        help="refresh the catalog in full before serving, like BIRDQUIZ_REFRESH=1")
+    args = parser.parse_args()
+
+    from playback import AudioBackendConfigError, backend_from_env, playback_engine
+    try:  # sessions don't play audio, but a typo in the shared environment should show up here too
+        playback_engine.set_backend(backend_from_env())
+    except AudioBackendConfigError as e:
+        parser.error(str(e))
+
+    from catalog import CatalogCache, load_species_list
+    from clip_pack import load_default_clip_pack
+    from confusables import load_default_confusables
+
+    instrumentation.enable_from_env()
+    species_list = load_species_list(force_refresh=args.refresh or None)
+    load_default_clip_pack()
+    try:
+        asyncio.run(serve(species_list, args.host, args.port, max_workers=args.workers,
+                          confusables=load_default_confusables(), catalog_cache=CatalogCache(),
+                          catalog_sync_interval=args.sync_interval))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        instrumentation.export_session()
+
+
+if __name__ == "__main__":
+    main()
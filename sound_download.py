@@ -0,0 +1,119 @@
+import time
+from io import BytesIO
+import requests
+from pydub import AudioSegment
+from pydub.exceptions import CouldntDecodeError
+import instrumentation
+
+CLIP_LENGTH_MS = 15000  # length of the quiz clip taken from the start of each recording
+CHUNK_SIZE = 64 * 1024
+TYPICAL_BITRATE_KBPS = 128  # most xeno-canto MP3s are 128 to 192 kbps, used to estimate how many bytes hold the clip
+HEADER_MARGIN = CHUNK_SIZE  # ID3 tags and cover art before the first frame
+
+
+def decode_sound(sound_data: bytes) -> AudioSegment:
+    with instrumentation.timer("download.decode"):
+        return AudioSegment.from_file(BytesIO(sound_data))
+
+
+def estimate_clip_bytes(clip_length_ms: int) -> int:
+    """
+    Estimates how many bytes of a compressed recording are needed to decode clip_length_ms of it.
+    Assumes a typical bitrate plus a margin for headers and cover art. Recordings of a higher
+    bitrate decode short on the first attempt, and stream_clip() then doubles the download.
+
+    :param clip_length_ms: length of the clip in milliseconds
+    :return clip_bytes: estimated number of bytes
+    """
+    return int(clip_length_ms * TYPICAL_BITRATE_KBPS / 8) + HEADER_MARGIN
+
+
+def check_deadline(url: str, deadline: float | None):
+    """
+    :param deadline: time.monotonic() by which the download must be done, no limit if None
+    :raises requests.exceptions.Timeout: if the deadline has passed, a transient error like any other timeout
+    """
+    if deadline is not None and time.monotonic() > deadline:
+        raise requests.exceptions.Timeout(f"Downloading {url} didn't finish in time")
+
+
+def stream_clip(url: str, clip_length_ms: int = CLIP_LENGTH_MS, session=None, timeout=None,
+                deadline: float | None = None) -> AudioSegment:
+    """
+    Downloads a recording incrementally and stops as soon as the downloaded part decodes to at
+    least clip_length_ms of sound. The connection is closed after that, so the rest of the file
+    is never transferred. Works with any server, whether or not it supports HTTP Range requests.
+
+    :param url: download URL of the recording
+    :param clip_length_ms: length of the clip in milliseconds
+    :param session: requests session to reuse, a plain request is sent if not given
+    :param timeout: connect and read timeouts passed to requests
+    :param deadline: time.monotonic() by which the download must be done, checked after every chunk because
+                     the read timeout only bounds the wait for one chunk
+    :return sound: first clip_length_ms of the recording
+    """
+
+    http = session or requests
+    sound_data = bytearray()
+    network_seconds = 0.0
+    try:
+        start = time.perf_counter()
+        with http.get(url, stream=True, timeout=timeout) as response:
+            network_seconds += time.perf_counter() - start
+            response.raise_for_status()
+            decode_threshold = estimate_clip_bytes(clip_length_ms)
+            chunks = response.iter_content(CHUNK_SIZE)
+            while True:
+                start = time.perf_counter()
+                chunk = next(chunks, None)
+                network_seconds += time.perf_counter() - start
+                if chunk is None:
+                    break
+                sound_data.extend(chunk)
+                check_deadline(url, deadline)
+                if len(sound_data) < decode_threshold:
+                    continue
+                try:
+                    sound = decode_sound(bytes(sound_data))
+                except CouldntDecodeError:
+                    sound = None
+                if sound is not None and len(sound) >= clip_length_ms:
+                    return sound[:clip_length_ms]
+                decode_threshold = len(sound_data) * 2
+    finally:
+        instrumentation.record("download.network", network_seconds)
+        instrumentation.count("download.bytes", len(sound_data))
+
+    # the whole file was shorter than the decode threshold or the clip
+    return decode_sound(bytes(sound_data))[:clip_length_ms]
+
+
+def download_clip(url: str, clip_length_ms: int = CLIP_LENGTH_MS, session=None, timeout=None,
+                  max_seconds: float | None = None) -> AudioSegment:
+    """
+    Downloads the first clip_length_ms of a recording, streaming only the needed part when
+    possible and falling back to downloading the whole file when a partial file can't be decoded.
+
+    :param url: download URL of the recording
+    :param clip_length_ms: length of the clip in milliseconds
+    :param session: requests session to reuse, a plain request is sent if not given
+    :param timeout: connect and read timeouts passed to requests
+    :param max_seconds: time the whole download may take, the fallback included, no limit if None
+    :return sound: first clip_length_ms of the recording
+    :raises requests.exceptions.Timeout: if a timeout or max_seconds runs out
+    """
+
+    deadline = time.monotonic() + max_seconds if max_seconds is not None else None
+    try:
+        return stream_clip(url, clip_length_ms, session, timeout, deadline)
+    except (CouldntDecodeError, requests.exceptions.ChunkedEncodingError):
+        http = session or requests
+        instrumentation.count("download.full_fallbacks")
+        sound_data = bytearray()
+        with instrumentation.timer("download.network"), http.get(url, stream=True, timeout=timeout) as response:
+            response.raise_for_status()
+            for chunk in response.iter_content(CHUNK_SIZE):
+                sound_data.extend(chunk)
+                check_deadline(url, deadline)
+        instrumentation.count("download.bytes", len(sound_data))
+        return decode_sound(bytes(sound_data))[:clip_length_ms]
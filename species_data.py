@@ -1,80 +1,201 @@
 import requests
+import requests.adapters
 import yaml
 import pandas as pd
-from quiz import BirdSound, MysterySpecies, SpeciesList
+from catalog import selected_countries
 import re
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+import instrumentation
 
+CONFIG_PATH = "utils/config.yaml"
+ATLAS_PATH = "data/atlasdata.csv"
+EBIRD_BASE_URL = "https://api.ebird.org/v2"
+XC_ENDPOINT = "https://xeno-canto.org/api/2/recordings"
+REQUEST_TIMEOUT = (5, 30)  # connect and read timeouts in seconds
+XC_RECORDING_FIELDS = ["id", "gen", "sp", "en", "rec", "cnt", "loc", "type", "lic", "url", "file", "query_country"]
 
-def get_species() -> pd.DataFrame:
+
+def get_species(ebird_base_url: str = EBIRD_BASE_URL, atlas_path: str = ATLAS_PATH,
+                api_key: str | None = None) -> pd.DataFrame:
     """
     Fetches the list of bird species observed in Finland from eBird API, and then fetches
     the scientific and common Finnish names of each species from the eBird API.
     Finally, the list of species are filtered to only include birds that nest in Finland
     using the nesting species information from Lintuatlas 3.
 
+    :param ebird_base_url: base URL of the eBird API, can be pointed to a local stub server
+    :param atlas_path: path to the Lintuatlas 3 nesting species CSV file
+    :param api_key: eBird API key, read from utils/config.yaml if not given
     :return species_df: dataframe containing bird species that nest in Finland
     """
 
-    with open("utils/config.yaml", "r") as f:
-        api_key = yaml.load(f, Loader=yaml.Loader).get("api_key")
+    if api_key is None:
+        with open(CONFIG_PATH, "r") as f:
+            api_key = yaml.load(f, Loader=yaml.Loader).get("api_key")
     headers = {"X-eBirdApiToken": api_key}
-    species_endpoint = "https://api.ebird.org/v2/product/spplist/FI"
-    species_response = requests.get(species_endpoint, headers=headers)
+    species_endpoint = f"{ebird_base_url}/product/spplist/FI"
+    with instrumentation.timer("ebird.species_list"):
+        species_response = requests.get(species_endpoint, headers=headers, timeout=REQUEST_TIMEOUT)
     species_list = species_response.json()
 
     species_list = [species for species in species_list if not species.startswith("x")]  # remove hybrid species
 
-    taxonomy_endpoint = "https://api.ebird.org/v2/ref/taxonomy/ebird"
+    taxonomy_endpoint = f"{ebird_base_url}/ref/taxonomy/ebird"
     taxonomy_params = \
         {
             "fmt": "json",
             "locale": "fi",
             "species": ",".join(species_list)
          }
-    taxonomy_response = requests.get(taxonomy_endpoint, headers=headers, params=taxonomy_params)
+    with instrumentation.timer("ebird.taxonomy"):
+        taxonomy_response = requests.get(taxonomy_endpoint, headers=headers, params=taxonomy_params,
+                                         timeout=REQUEST_TIMEOUT)
     base_species_list = taxonomy_response.json()
     base_species_list = [sp for sp in base_species_list if " " not in sp["comName"]]  # gets rid of non-Finnish names
     base_species_names = [(sp["sciName"], sp["comName"]) for sp in base_species_list]
     base_species_df = pd.DataFrame(base_species_names, columns=["sciName", "comName"])
 
-    atlas_df = pd.read_csv("data/atlasdata.csv")
+    atlas_df = pd.read_csv(atlas_path)
     species_df = atlas_df.merge(base_species_df, how="left", on="comName")  # results in a df with nesting species only
     species_df.loc[species_df["comName"] == "kesykyyhky", "sciName"] = "Columba livia"  # fix an exception in names
 
     return species_df
 
 
-def get_recordings(species_df: pd.DataFrame) -> pd.DataFrame:
+def species_digest(species_df: pd.DataFrame) -> str:
     """
-    Fetches all bird sound recordings from the Xeno-Canto API from 5 countries
-    and filters them to only include the species that nest in Finland.
-
     :param species_df: dataframe containing bird species that nest in Finland
-    :return recording_df: dataframe of bird sound recordings
+    :return digest: hash of the names and Atlas square counts of the species, changes whenever the species list does
+    """
+
+    species = sorted(zip(species_df["sciName"].astype(str), species_df["comName"].astype(str),
+                         species_df["atlasSquareCount"].astype(str)))
+    return hashlib.sha1(repr(species).encode()).hexdigest()
+
+
+def make_session(pool_size: int = 8) -> requests.Session:
+    """
+    Creates a requests session whose connection pool is large enough to keep one
+    keep-alive connection open per worker thread.
+
+    :param pool_size: maximum number of pooled connections per host
+    :return session: HTTP session shared by all page fetches
+    """
+
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def fetch_recording_page(session: requests.Session, endpoint: str, country: str, page: int,
+                         timeout=REQUEST_TIMEOUT, extra_query: str = "") -> dict:
+    """
+    Fetches a single page of quality A bird recordings of a country from the Xeno-Canto API.
+
+    :param session: HTTP session to send the request with
+    :param endpoint: Xeno-Canto recordings endpoint
+    :param country: country name used in the Xeno-Canto query
+    :param page: page number, starting from 1
+    :param timeout: connect and read timeouts passed to requests
+    :param extra_query: additional Xeno-Canto search terms, e.g. "since:2024-01-31"
+    :return response: decoded JSON response of the page
+    """
+
+    params = {"query": f'grp:birds cnt:{country} q:A {extra_query}'.strip(), "page": page}
+    with instrumentation.timer("xc.recording_page"):
+        response = session.get(url=endpoint, params=params, timeout=timeout)
+    instrumentation.count("xc.recording_page.bytes", len(response.content))
+    response.raise_for_status()
+    return response.json()
+
+
+def fetch_all_recordings(countries: list[str], endpoint: str = XC_ENDPOINT, max_workers: int = 8,
+                         timeout=REQUEST_TIMEOUT, session: requests.Session | None = None,
+                         extra_query: str = "") -> list[dict]:
+    """
+    Fetches every page of recordings of the given countries concurrently. The first page of each
+    country is fetched to learn numPages, after which the remaining pages of all countries are
+    fanned out over a bounded thread pool sharing one pooled session. Results are reassembled
+    in country and page order, so the output is identical to fetching the pages one by one.
+
+    :param countries: country names used in the Xeno-Canto query
+    :param endpoint: Xeno-Canto recordings endpoint
+    :param max_workers: maximum number of concurrent requests
+    :param timeout: connect and read timeouts passed to requests
+    :param session: HTTP session to reuse, a new pooled session is created if not given
+    :param extra_query: additional Xeno-Canto search terms added to every query
+    :return all_recordings: list of recording dictionaries, tagged with the queried country in "query_country"
     """
 
+    own_session = session is None
+    if own_session:
+        session = make_session(max_workers)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="xc-fetch") as executor:
+            first_pages = {country: executor.submit(fetch_recording_page, session, endpoint, country, 1, timeout,
+                                                    extra_query)
+                           for country in countries}
+            pages = {(country, 1): future.result() for country, future in first_pages.items()}
+
+            remaining_pages = {}
+            for country in countries:
+                total_pages = int(pages[(country, 1)].get("numPages") or 1)
+                for page in range(2, total_pages + 1):
+                    remaining_pages[(country, page)] = executor.submit(
+                        fetch_recording_page, session, endpoint, country, page, timeout, extra_query)
+            pages.update({key: future.result() for key, future in remaining_pages.items()})
+    finally:
+        if own_session:
+            session.close()
+
     all_recordings = []
+    for country in countries:
+        page = 1
+        while (country, page) in pages:
+            for recording in pages[(country, page)].get("recordings") or []:
+                recording["query_country"] = country
+                all_recordings.append(recording)
+            page += 1
+    return all_recordings
+
+
+def fetch_recording_counts(countries: list[str], endpoint: str = XC_ENDPOINT, max_workers: int = 8,
+                           timeout=REQUEST_TIMEOUT) -> dict:
+    """
+    Fetches the total number of quality A bird recordings of each country, one request per country.
 
-    endpoint = "https://xeno-canto.org/api/2/recordings"
+    :param countries: country names used in the Xeno-Canto query
+    :param endpoint: Xeno-Canto recordings endpoint
+    :param max_workers: maximum number of concurrent requests
+    :param timeout: connect and read timeouts passed to requests
+    :return counts: number of recordings by country
+    """
 
-    for country in ["finland", "sweden", "norway", "denmark", "estonia"]:
-        current_page = 1
-        more_pages = True
-        params = {"query": f'grp:birds cnt:{country} q:A', "page": current_page}
+    with make_session(max_workers) as session, \
+            ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="xc-fetch") as executor:
+        first_pages = {country: executor.submit(fetch_recording_page, session, endpoint, country, 1, timeout)
+                       for country in countries}
+        return {country: int(future.result().get("numRecordings") or 0) for country, future in first_pages.items()}
 
-        while more_pages:
-            r = requests.get(url=endpoint, params=params).json()
-            data = r.get("recordings")
-            all_recordings.extend(data)
 
-            total_pages = r.get("numPages")
-            if total_pages == current_page:
-                more_pages = False
-            else:
-                current_page += 1
-                params["page"] = current_page
+def recordings_to_dataframe(all_recordings: list[dict], species_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Filters raw Xeno-Canto recordings to the species that nest in Finland and to recordings with
+    all the information needed in the quiz, and merges the species information into them.
+
+    :param all_recordings: list of recording dictionaries from the Xeno-Canto API
+    :param species_df: dataframe containing bird species that nest in Finland
+    :return recording_df: dataframe of bird sound recordings
+    """
 
-    recording_df = pd.DataFrame(all_recordings)
+    if all_recordings:
+        recording_df = pd.DataFrame(all_recordings)
+    else:
+        recording_df = pd.DataFrame(columns=XC_RECORDING_FIELDS)
     recording_df["sciName"] = recording_df["gen"] + " " + recording_df["sp"]
     recording_df = recording_df.loc[recording_df["sciName"].isin(species_df["sciName"].unique())]
     recording_df = recording_df.dropna(subset=["id", "url", "file", "rec", "lic"])
@@ -83,6 +204,23 @@ def get_recordings(species_df: pd.DataFrame) -> pd.DataFrame:
     return recording_df
 
 
+def get_recordings(species_df: pd.DataFrame, endpoint: str = XC_ENDPOINT, max_workers: int = 8,
+                   countries: list[str] | None = None) -> pd.DataFrame:
+    """
+    Fetches all bird sound recordings from the Xeno-Canto API from the countries of the regional edition
+    and filters them to only include the species that nest in Finland.
+
+    :param species_df: dataframe containing bird species that nest in Finland
+    :param endpoint: Xeno-Canto recordings endpoint, can be pointed to a local stub server
+    :param max_workers: maximum number of concurrent page requests
+    :param countries: country names used in the Xeno-Canto query, selected_countries() if None
+    :return recording_df: dataframe of bird sound recordings
+    """
+
+    all_recordings = fetch_all_recordings(countries or selected_countries(), endpoint=endpoint, max_workers=max_workers)
+    return recordings_to_dataframe(all_recordings, species_df)
+
+
 def extract_license_type(license_url: str) -> str:
     """
     Reformats the Creative Commons license URL of a sound recording to the name of the license for display purposes.
@@ -99,26 +237,14 @@ def extract_license_type(license_url: str) -> str:
     return license_type
 
 
-def reformat_recordings(recording_df: pd.DataFrame) -> SpeciesList:
+def extract_license_types(license_urls: pd.Series) -> pd.Series:
     """
-    Reformats the dataframe of bird sound recordings to a SpeciesList that contains MysterySpecies objects.
+    Vectorized version of extract_license_type for a whole column of license URLs.
 
-    :param recording_df: dataframe of bird sound recordings
-    :return species_list: SpeciesList object containing all nesting species in Finland.
+    :param license_urls: series of URLs to CC license type pages
+    :return license_types: series of CC license type names, None where the URL isn't recognized
     """
 
-    recording_df["lic"] = recording_df["lic"].map(extract_license_type)
-    species_list = []
-    for species in recording_df["sciName"].unique():
-        subdf = recording_df.loc[recording_df["sciName"] == species]
-        species_sounds = [BirdSound(*values) for values in subdf[["id", "url", "file", "rec", "cnt", "loc", "type", "lic"]].values]
-        mystery_species = MysterySpecies(common_name_FI=subdf["comName"].values[0],
-                                         common_name_EN=subdf["en"].values[0],
-                                         scientific_name=species,
-                                         sounds=species_sounds,
-                                         square_count=subdf["atlasSquareCount"].values[0])
-        species_list.append(mystery_species)
-
-    species_list = SpeciesList(species_list)
-
-    return species_list
+    parts = license_urls.str.extract(r"^//creativecommons.org/licenses/([a-z-]+)/(\d\.\d)/")
+    license_types = "CC " + parts[0].str.upper() + " " + parts[1]
+    return license_types.astype(object).where(license_types.notna(), None)
@@ -0,0 +1,226 @@
+import re
+from collections import Counter
+from bisect import bisect_left, bisect_right
+from functools import lru_cache
+
+REGEX_METACHARACTERS = set(".^$+?{}[]\\|()")
+
+
+@lru_cache(maxsize=128)
+def compile_wildcard(pattern: str) -> re.Pattern:
+    """
+    Compiles a species filter pattern where "*" matches any sequence of characters.
+    Compiled patterns are cached, so repeating a filter doesn't compile it again.
+
+    :param pattern: wildcard pattern, e.g. "*tiainen"
+    :return regex_pattern: compiled regular expression matching whole names
+    """
+    return re.compile(rf'^{pattern.replace("*", ".*")}$')
+
+
+def literal_prefix(pattern: str) -> str:
+    """
+    :param pattern: wildcard pattern
+    :return prefix: the literal text every match of the pattern starts with, "" if there is none
+    """
+    prefix = pattern.split("*", 1)[0]
+    for i, char in enumerate(prefix):
+        if char in REGEX_METACHARACTERS:
+            return prefix[:i]
+    return prefix
+
+
+def edit_distance(a: str, b: str, max_distance: int | None = None) -> int:
+    """
+    Levenshtein distance between two strings, computed one row at a time.
+
+    :param a: first string
+    :param b: second string
+    :param max_distance: stop as soon as the distance is known to exceed this, returning max_distance + 1
+    :return distance: number of single character insertions, deletions and substitutions between a and b
+    """
+    if len(a) < len(b):
+        a, b = b, a
+    if max_distance is not None and len(a) - len(b) > max_distance:
+        return max_distance + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if max_distance is not None and min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    return previous[-1]
+
+
+def padded_bigrams(name: str) -> Counter:
+    """Two-character substrings of the name with start and end markers, with their counts."""
+    padded = f"\x02{name}\x03"
+    return Counter(padded[i:i + 2] for i in range(len(padded) - 1))
+
+
+class FuzzyNameIndex:
+    """
+    Inverted index from padded bigrams to the names containing them, for finding all names within
+    a small edit distance of a query. One edit changes at most two bigrams, so a name within
+    max_distance of the query shares at least max(len(query), len(name)) + 1 - 2 * max_distance
+    bigrams with it. Only the names passing that count filter are compared with edit_distance().
+    Queries short enough for the bound to be zero compare every name of a close enough length.
+    """
+
+    __slots__ = ("names", "postings", "by_length")
+
+    def __init__(self, names=()):
+        self.names = list(dict.fromkeys(names))
+        self.postings = {}
+        self.by_length = {}
+        for name_id, name in enumerate(self.names):
+            for bigram, count in padded_bigrams(name).items():
+                self.postings.setdefault(bigram, []).append((name_id, count))
+            self.by_length.setdefault(len(name), []).append(name_id)
+
+    def search(self, name: str, max_distance: int) -> list[tuple[int, str]]:
+        """
+        :param name: name to look up
+        :param max_distance: largest accepted edit distance
+        :return matches: sorted (distance, name) pairs of all names within max_distance
+        """
+        if len(name) + 1 - 2 * max_distance <= 0:
+            candidates = [name_id for length in range(len(name) - max_distance, len(name) + max_distance + 1)
+                          for name_id in self.by_length.get(length, ())]
+        else:
+            shared = {}
+            for bigram, query_count in padded_bigrams(name).items():
+                for name_id, count in self.postings.get(bigram, ()):
+                    shared[name_id] = shared.get(name_id, 0) + min(query_count, count)
+            candidates = [name_id for name_id, count in shared.items()
+                          if count >= max(len(name), len(self.names[name_id])) + 1 - 2 * max_distance]
+
+        matches = []
+        for name_id in candidates:
+            distance = edit_distance(name, self.names[name_id], max_distance)
+            if distance <= max_distance:
+                matches.append((distance, self.names[name_id]))
+        return sorted(matches)
+
+
+class SpeciesIndex:
+    """
+    Lookup structures built once over a list of MysterySpecies, so that quizzes can be set up
+    without re-sorting or scanning the whole list. Species are referred to by their position
+    in the indexed list.
+
+        rank order -> positions sorted by Atlas square count, a difficulty level is a slice of it
+        name index -> sorted (name, position) pairs of the Finnish, English and scientific names,
+                      prefix and wildcard queries only look at names sharing the literal prefix
+        fuzzy index -> bigram index of the same names, for finding misspelled answers
+        taxonomy    -> position of every scientific name and positions of the species of every genus
+    """
+
+    def __init__(self, species_list):
+        self.species = list(species_list)
+        positions = range(len(self.species))
+        self.most_common_first = sorted(positions, key=lambda i: self.species[i].square_count, reverse=True)
+        self.rarest_first = sorted(positions, key=lambda i: self.species[i].square_count)
+        self.name_keys = sorted({(name, i) for i, sp in enumerate(self.species) for name in sp.correct_answers.values()})
+        self.names = [name for name, _ in self.name_keys]
+        self.fuzzy_index = FuzzyNameIndex(self.names)
+        self.by_sci_name = {sp.correct_answers["sciName"]: i for i, sp in enumerate(self.species)}
+        self.by_genus = {}
+        for i, sp in enumerate(self.species):
+            self.by_genus.setdefault(sp.correct_answers["sciName"].split(" ")[0], []).append(i)
+
+    def __len__(self):
+        return len(self.species)
+
+    def species_at(self, positions) -> list:
+        return [self.species[i] for i in positions]
+
+    def difficulty_slice(self, level: int) -> list[int]:
+        """
+        Difficulty level determines how rare the species included in the quiz are.
+
+            Level 1 -> Top 33.3% most common species by Atlas square count are included
+            Level 2 -> Top 66.6% most common
+            Level 3 -> All species
+            Level 4 -> Top 66.6% rarest
+            Level 5 -> Top 33.3% rarest
+
+        :param level: difficulty level from 1 to 5
+        :return positions: positions of the species included on the level
+        """
+        total_species_count = len(self.species)
+        min_square_count_ranks = {
+            1: int(total_species_count / 3),
+            2: int(total_species_count / 3 * 2),
+            3: int(total_species_count),
+            4: int(total_species_count / 3 * 2),
+            5: int(total_species_count / 3),
+        }
+        no_of_species = min_square_count_ranks[level]
+        ranked = self.most_common_first if level <= 3 else self.rarest_first
+        return ranked[:no_of_species]
+
+    def _prefix_range(self, prefix: str) -> tuple[int, int]:
+        if not prefix:
+            return 0, len(self.names)
+        return bisect_left(self.names, prefix), bisect_right(self.names, prefix + "\U0010FFFF")
+
+    def prefix_matches(self, prefix: str) -> list[tuple[str, int]]:
+        """
+        :param prefix: start of a name
+        :return name_keys: sorted (name, position) pairs of all names starting with prefix
+        """
+        lo, hi = self._prefix_range(prefix.lower().strip())
+        return self.name_keys[lo:hi]
+
+    def suggest(self, prefix: str, limit: int = 8) -> list[str]:
+        """
+        Type-ahead suggestions. Only reads the first names of the prefix range, so the cost doesn't
+        grow with the number of species.
+
+        :param prefix: start of a name typed by the player
+        :param limit: maximum number of suggestions
+        :return names: up to limit distinct names starting with prefix, in alphabetical order
+        """
+        prefix = prefix.lower().strip()
+        if not prefix:
+            return []
+        lo, hi = self._prefix_range(prefix)
+        names = []
+        for name in self.names[lo:hi]:
+            if not names or names[-1] != name:
+                names.append(name)
+                if len(names) == limit:
+                    break
+        return names
+
+    def closest_species(self, name: str, max_distance: int) -> tuple[int, set[int]] | None:
+        """
+        :param name: possibly misspelled name
+        :param max_distance: largest accepted edit distance
+        :return match: the smallest edit distance to a known name and the positions of the species with a
+                       name at that distance, or None if no name is within max_distance
+        """
+        matches = self.fuzzy_index.search(name.lower().strip(), max_distance)
+        if not matches:
+            return None
+        best_distance = matches[0][0]
+        positions = set()
+        for distance, match in matches:
+            if distance != best_distance:
+                break
+            lo, hi = self._prefix_range(match)
+            positions.update(i for key, i in self.name_keys[lo:hi] if key == match)
+        return best_distance, positions
+
+    def wildcard_matches(self, pattern: str) -> set[int]:
+        """
+        :param pattern: wildcard pattern matched against the Finnish, English and scientific names
+        :return positions: positions of the species with at least one matching name
+        """
+        pattern = pattern.lower().strip()
+        regex_pattern = compile_wildcard(pattern)
+        lo, hi = self._prefix_range(literal_prefix(pattern))
+        return {i for name, i in self.name_keys[lo:hi] if regex_pattern.match(name)}
@@ -0,0 +1,114 @@
+"""
+Spectrogram images of quiz clips. The short-time Fourier transform runs over all frames at once
+with NumPy, the result is pooled into a fixed-size image, colored with a lookup table and encoded
+as a binary PPM, which Tk reads straight into a PhotoImage. Images are cached by Xeno-Canto id
+and computed on the thread that loads the clip, so the UI thread only turns cached bytes into a
+PhotoImage.
+"""
+import instrumentation
+from audio_cache import DecodedAudioCache
+
+WIDTH = 320
+HEIGHT = 120
+N_FFT = 512
+MAX_FREQUENCY = 11025  # Hz, birdsong is mostly below this
+DYNAMIC_RANGE_DB = 70.0
+CACHE_MAX_BYTES = 8 * 1024 * 1024  # about 70 images of WIDTH x HEIGHT
+
+# (level, red, green, blue) control points of the color map, from silence to the loudest bin
+COLOR_POINTS = [(0, 255, 255, 255), (90, 160, 190, 230), (170, 40, 60, 160), (255, 0, 0, 0)]
+
+spectrogram_cache = DecodedAudioCache(max_bytes=CACHE_MAX_BYTES, sizeof=len)
+_colormap = None
+
+
+def pcm_samples(clip):
+    """
+    :param clip: PcmClip of any sample width and channel count
+    :return samples: integer array of shape (frames, channels), a view of the clip's buffer except for
+                     24-bit clips; 8-bit samples are unsigned, centered on 128
+    """
+    import numpy as np
+
+    data = clip.raw_data[:len(clip.raw_data) - len(clip.raw_data) % clip.frame_size]
+    if clip.sample_width == 1:
+        samples = np.frombuffer(data, dtype=np.uint8)
+    elif clip.sample_width == 3:  # the two most significant bytes of every sample are enough for an image
+        samples = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3)[:, 1:].copy().view("<i2")
+    else:
+        samples = np.frombuffer(data, dtype=f"<i{clip.sample_width}")
+    return samples.reshape(-1, clip.channels)
+
+
+def compute_spectrogram(clip, width: int = WIDTH, height: int = HEIGHT, n_fft: int = N_FFT,
+                        max_frequency: float = MAX_FREQUENCY):
+    """
+    :param clip: PcmClip of the recording
+    :param width: number of time columns, one FFT frame each, spread evenly over the clip
+    :param height: number of frequency rows, up to max_frequency
+    :return levels: uint8 array of shape (rows, columns), low frequencies last, 0 for silence and 255
+                    for the loudest bin; smaller than width x height if the clip is too short or its
+                    sample rate too low to fill them
+    """
+    import numpy as np
+
+    samples = pcm_samples(clip)
+    if len(samples) < n_fft:
+        silence = 128 if clip.sample_width == 1 else 0
+        samples = np.pad(samples, ((0, n_fft - len(samples)), (0, 0)), constant_values=silence)
+    hop = max(1, (len(samples) - n_fft) // max(width - 1, 1))
+    # only the samples of the analysed frames are converted and mixed to mono, not the whole clip
+    windows = np.lib.stride_tricks.sliding_window_view(samples, n_fft, axis=0)[::hop][:width]
+    frames = windows.mean(axis=1, dtype=np.float32)
+    if clip.sample_width == 1:
+        frames -= 128
+    power = np.abs(np.fft.rfft(frames * np.hanning(n_fft).astype(np.float32), axis=1)) ** 2
+
+    n_bins = min(int(max_frequency * n_fft / clip.frame_rate) + 1, power.shape[1])
+    rows = min(height, n_bins)
+    edges = np.linspace(0, n_bins, rows + 1).astype(int)
+    bands = np.add.reduceat(power[:, :n_bins], edges[:-1], axis=1) / np.diff(edges)
+
+    decibels = 10 * np.log10(np.maximum(bands, 1e-10))  # -100 dB for digital silence
+    floor = max(decibels.max() - DYNAMIC_RANGE_DB, -100.0)  # so that a silent clip stays blank
+    levels = np.clip((decibels - floor) * (255 / DYNAMIC_RANGE_DB), 0, 255).astype(np.uint8)
+    return levels.T[::-1]
+
+
+def colormap():
+    """
+    :return colormap: uint8 array of shape (256, 3), the RGB color of every level
+    """
+    global _colormap
+    if _colormap is None:
+        import numpy as np
+
+        points = np.array(COLOR_POINTS, dtype=np.float32)
+        _colormap = np.stack([np.interp(np.arange(256), points[:, 0], points[:, channel])
+                              for channel in (1, 2, 3)], axis=1).astype(np.uint8)
+    return _colormap
+
+
+def render_ppm(levels) -> bytes:
+    """
+    :param levels: uint8 array of shape (rows, columns) returned by compute_spectrogram()
+    :return image: the levels colored with the color map, as a binary PPM file
+    """
+    height, width = levels.shape
+    return f"P6 {width} {height} 255\n".encode("ascii") + colormap()[levels].tobytes()
+
+
+@instrumentation.timed("spectrogram.compute")
+def spectrogram_ppm(clip) -> bytes:
+    return render_ppm(compute_spectrogram(clip))
+
+
+def sound_spectrogram(sound) -> bytes | None:
+    """
+    :param sound: BirdSound whose clip is drawn, downloaded if it isn't cached
+    :return image: cached spectrogram of the sound as a PPM file, None if NumPy isn't installed
+    """
+    try:
+        return spectrogram_cache.get_or_load(sound.xc_id, lambda: spectrogram_ppm(sound.download_sound_file()))
+    except ImportError:
+        return None
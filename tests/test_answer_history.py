@@ -0,0 +1,75 @@
+import random
+
+from answer_history import RECORD, AnswerHistory, HistorySampler, species_names_path
+from species_index import SpeciesIndex
+
+
+class FakeSpecies:
+    def __init__(self, i: int):
+        self.correct_answers = {"comNameFI": f"laji {i}", "comNameEN": f"bird {i}", "sciName": f"genus species{i}"}
+        self.square_count = i
+
+
+def make_index(species_count: int = 12) -> SpeciesIndex:
+    return SpeciesIndex([FakeSpecies(i) for i in range(species_count)])
+
+
+def test_answered_since(tmp_path):
+    history = AnswerHistory(str(tmp_path / "answers.bin"))
+    assert history.answered_since(0) == (set(), 0)
+    history.record("a b", "XC1", True, 1.0)
+    history.record("c d", "XC2", False, 2.0)
+    history.record("a b", "XC3", False, 2.0)
+    assert history.answered_since(0) == ({"a b", "c d"}, 3)
+    assert history.answered_since(2) == ({"a b"}, 3)
+    assert AnswerHistory(history.path).answered_since(1) == ({"a b", "c d"}, 3)  # read back from the files
+
+
+def test_sampler_reweights_only_answered_species(tmp_path):
+    history = AnswerHistory(str(tmp_path / "answers.bin"))
+    sampler = HistorySampler(make_index(), history)
+    sampler.sample(list(range(len(sampler.keys))), 3)
+    weights = list(sampler.weights)
+
+    history.record(sampler.keys[0], "XC1", False, 1.0)
+    sampler.sample(list(range(len(sampler.keys))), 3)
+    assert sampler.weights[0] != weights[0]
+    assert sampler.weights[1:] == weights[1:]
+
+
+def test_columns_aggregate_like_single_records(tmp_path):
+    rng = random.Random(1)
+    path = str(tmp_path / "answers.bin")
+    with open(species_names_path(path), "w", encoding="utf-8") as f:
+        f.write("".join(f"species {i}\n" for i in range(20)))
+    with open(path, "wb") as f:  # ids past the names file are skipped, like the tail of a cut record
+        f.write(b"".join(RECORD.pack(rng.uniform(0, 1e9), rng.randrange(22), 5, rng.random() < 0.5,
+                                     rng.uniform(0, 20)) for _ in range(2000)) + b"\0" * 7)
+
+    loaded = AnswerHistory(path)
+    len(loaded)
+    expected = AnswerHistory(str(tmp_path / "unused.bin"))
+    for i in range(20):
+        expected._add_species(f"species {i}")
+    with open(path, "rb") as f:
+        data = f.read()
+    for answered_at, species_id, _, correct, response_seconds in RECORD.iter_unpack(data[:-7]):
+        if species_id < 20:
+            expected._aggregate(answered_at, species_id, correct, response_seconds)
+    for name in ("attempts", "errors", "last_answered", "response_seconds", "answer_log"):
+        assert getattr(loaded, name) == getattr(expected, name), name
+
+
+def test_draws_follow_weights_lowered_since_the_table_was_built(tmp_path):
+    history = AnswerHistory(str(tmp_path / "answers.bin"))
+    sampler = HistorySampler(make_index(), history)
+    pool = list(range(len(sampler.keys)))
+    sampler.sample(pool, 1)
+    table = sampler.table
+
+    history.record(sampler.keys[0], "XC1", True, 1.0)
+    rng = random.Random(2)
+    draws = [sampler.sample(pool, 1, rng)[0] for _ in range(20000)]
+    assert sampler.table is table  # answering only lowered a weight
+    share = sampler.weights[0] / sum(sampler.weights)
+    assert draws.count(0) <= 20000 * share + 20
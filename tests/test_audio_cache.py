@@ -0,0 +1,62 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from audio_cache import DecodedAudioCache
+
+
+def test_least_recently_used_sounds_are_evicted_past_max_bytes():
+    cache = DecodedAudioCache(max_bytes=10, sizeof=len)
+    cache.put("XC1", b"1111")
+    cache.put("XC2", b"2222")
+    assert cache.get("XC1") == b"1111"  # XC2 is now the least recently used
+    cache.put("XC3", b"3333")
+
+    assert "XC2" not in cache
+    assert cache.get("XC1") == b"1111" and cache.get("XC3") == b"3333"
+    assert cache.get("XC2") is None
+    assert cache.stats() == {"entries": 2, "bytes": 8, "max_bytes": 10, "hits": 3, "misses": 1, "evictions": 1}
+
+
+def test_replacing_and_oversized_sounds_keep_the_byte_count():
+    cache = DecodedAudioCache(max_bytes=10, sizeof=len)
+    cache.put("XC1", b"1111")
+    cache.put("XC1", b"11")
+    assert cache.current_bytes == 2
+    cache.put("XC2", b"x" * 11)
+    assert "XC2" not in cache and cache.current_bytes == 2
+
+    cache.put("XC3", b"33333333")
+    cache.resize(8)
+    assert "XC1" not in cache and cache.current_bytes == 8
+
+
+def test_concurrent_requests_for_a_missing_sound_load_it_once():
+    cache = DecodedAudioCache(max_bytes=100, sizeof=len)
+    loads, started, release = [], threading.Event(), threading.Event()
+
+    def loader():
+        loads.append(threading.current_thread().name)
+        started.set()
+        release.wait(5)
+        return b"1111"
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        first = executor.submit(cache.get_or_load, "XC1", loader)
+        started.wait(5)
+        waiting = [executor.submit(cache.get_or_load, "XC1", loader) for _ in range(3)]
+        release.set()
+        assert [future.result() for future in [first, *waiting]] == [b"1111"] * 4
+    assert len(loads) == 1
+
+
+def test_failed_load_is_raised_to_the_caller_and_not_cached():
+    cache = DecodedAudioCache(max_bytes=100, sizeof=len)
+
+    def loader():
+        raise OSError("connection reset")
+
+    with pytest.raises(OSError):
+        cache.get_or_load("XC1", loader)
+    assert cache.get_or_load("XC1", lambda: b"11") == b"11"
@@ -0,0 +1,62 @@
+import threading
+import time
+
+from background import BackgroundWorker
+
+
+class FakeWidget:
+    """Collects after() callbacks, which the test runs on its own thread like the Tk main loop."""
+
+    def __init__(self):
+        self.pending = {}
+        self._next_id = 0
+
+    def after(self, ms, callback):
+        self._next_id += 1
+        self.pending[self._next_id] = callback
+        return self._next_id
+
+    def after_cancel(self, after_id):
+        del self.pending[after_id]
+
+    def run_until(self, condition, timeout: float = 5.0):
+        deadline = time.monotonic() + timeout
+        while not condition() and time.monotonic() < deadline:
+            callbacks, self.pending = list(self.pending.values()), {}
+            for callback in callbacks:
+                callback()
+            time.sleep(0.001)
+        assert condition()
+
+
+def test_results_and_errors_are_handed_back_on_the_polling_thread():
+    widget = FakeWidget()
+    worker = BackgroundWorker(widget)
+    results = {}
+
+    def double(x):
+        return x * 2, threading.current_thread().name
+
+    def fail():
+        raise ValueError("no sound")
+
+    worker.submit(double, 21, on_done=lambda value: results.update(done=(value, threading.current_thread())))
+    worker.submit(fail, on_error=lambda e: results.update(error=(e, threading.current_thread())))
+    widget.run_until(lambda: len(results) == 2)
+    worker.shutdown()
+
+    (value, job_thread), done_thread = results["done"]
+    assert value == 42 and job_thread.startswith("ui-worker")
+    assert isinstance(results["error"][0], ValueError)
+    assert done_thread is results["error"][1] is threading.current_thread()
+    assert not widget.pending
+
+
+def test_jobs_submitted_after_shutdown_are_dropped():
+    widget = FakeWidget()
+    worker = BackgroundWorker(widget)
+    worker.shutdown()
+    ran = []
+    worker.submit(ran.append, 1)
+    time.sleep(0.05)
+    assert not ran and not widget.pending
@@ -0,0 +1,183 @@
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+pytest.importorskip("pandas")
+requests = pytest.importorskip("requests")
+
+import catalog  # noqa: E402
+from benchmarks.stub_server import StubApiServer, StubData  # noqa: E402
+from catalog import (COUNTRIES_ENV_VAR, REFRESH_ENV_VAR, CatalogCache, load_species_list,  # noqa: E402
+                     refresh_catalog, sync_catalog, update_species_list)
+
+
+@pytest.fixture
+def stub(tmp_path, monkeypatch):
+    monkeypatch.delenv(REFRESH_ENV_VAR, raising=False)
+    monkeypatch.delenv(COUNTRIES_ENV_VAR, raising=False)
+    data = StubData(30, 4, audio_variants=0)
+    with StubApiServer(data) as server:
+        atlas_path = str(tmp_path / "atlasdata.csv")
+        data.write_atlas_csv(atlas_path)
+        options = {"species_options": {"ebird_base_url": server.ebird_base_url, "atlas_path": atlas_path,
+                                       "api_key": "stub"},
+                   "recording_options": {"endpoint": server.xc_endpoint}}
+        cache = CatalogCache(str(tmp_path / "cache"))
+        refresh_catalog(cache, **options)
+        yield data, server, cache, options
+
+
+def full_sync_times(cache: CatalogCache) -> dict:
+    return {country: cache.shard(country).read_meta()["full_sync_at"] for country in cache.countries}
+
+
+def sci_names(data: StubData, ids) -> set[str]:
+    return {f"{r['gen']} {r['sp']}".lower() for recordings in data.recordings.values()
+            for r in recordings if r["id"] in ids}
+
+
+def summary(species_list) -> list[tuple]:
+    return [(species.correct_answers["sciName"], len(species.recording_range)) for species in species_list]
+
+
+def test_fresh_catalog_is_loaded_without_fetching(stub):
+    data, server, cache, options = stub
+    requests_before = server.request_count
+    species_list = load_species_list(cache.cache_dir, **options)
+    assert server.request_count == requests_before
+    assert summary(species_list) == summary(cache.load())
+    assert len(species_list) == 30
+    assert species_list[0].sounds[0].license_type == "CC BY-NC-SA 4.0"
+
+
+def test_expired_catalog_is_synced_and_an_incompatible_one_refreshed(stub, monkeypatch):
+    data, server, cache, options = stub
+    before = full_sync_times(cache)
+    load_species_list(cache.cache_dir, ttl=0, **options)
+    assert full_sync_times(cache) == before
+
+    monkeypatch.setattr(catalog, "CATALOG_VERSION", catalog.CATALOG_VERSION + 1)
+    load_species_list(cache.cache_dir, **options)
+    after = full_sync_times(cache)
+    assert all(after[country] > before[country] for country in cache.countries)
+    assert cache.is_fresh()
+
+
+def test_only_missing_shards_are_refreshed(stub):
+    data, server, cache, options = stub
+    before = full_sync_times(cache)
+    os.remove(cache.shard("sweden").path)
+
+    species_list = load_species_list(cache.cache_dir, **options)
+    after = full_sync_times(cache)
+    assert after["sweden"] > before["sweden"]
+    assert {country: t for country, t in after.items() if country != "sweden"} == \
+           {country: t for country, t in before.items() if country != "sweden"}
+    assert summary(species_list) == summary(cache.load())
+
+
+def test_regional_edition_loads_only_its_shards(stub):
+    data, server, cache, options = stub
+    regional = CatalogCache(cache.cache_dir, countries=["finland", "sweden"])
+    species_list = regional.load()
+    recordings = data.recordings["finland"] + data.recordings["sweden"]
+    assert sorted(species.correct_answers["sciName"] for species in species_list) == \
+           sorted({f"{r['gen']} {r['sp']}".lower() for r in recordings})  # one MysterySpecies per species
+    assert sum(len(species.recording_range) for species in species_list) == len(recordings)
+
+
+def test_failed_refresh_falls_back_to_the_stale_catalog(stub, tmp_path):
+    data, server, cache, options = stub
+    offline = dict(options, species_options=dict(options["species_options"], ebird_base_url="http://127.0.0.1:9"))
+    assert summary(load_species_list(cache.cache_dir, ttl=0, **offline)) == summary(cache.load())
+    with pytest.raises(requests.exceptions.ConnectionError):
+        load_species_list(str(tmp_path / "empty"), **offline)
+
+
+@pytest.mark.parametrize("value, refreshed", [("1", True), ("yes", True), ("", False), ("0", False)])
+def test_refresh_env_var_forces_a_full_refresh(stub, monkeypatch, value, refreshed):
+    data, server, cache, options = stub
+    before = full_sync_times(cache)
+    monkeypatch.setenv(REFRESH_ENV_VAR, value)
+    load_species_list(cache.cache_dir, **options)
+    after = full_sync_times(cache)
+    assert all(after[country] > before[country] for country in cache.countries) == refreshed
+    assert (after == before) != refreshed
+
+
+def test_species_share_one_table_of_their_rows(stub):
+    species_list = stub[2].load()
+    assert len({id(species.recording_table) for species in species_list}) == 1
+    ranges = [species.recording_range for species in species_list]
+    assert ranges[0].start == 0 and [r.start for r in ranges[1:]] == [r.stop for r in ranges[:-1]]
+
+    species = species_list[1]
+    xc_ids = [sound.xc_id for sound in species.sounds]
+    species.failed_recordings.add(species.recording_range[0])
+    assert [sound.xc_id for sound in species.sounds] == xc_ids[1:]
+
+
+def test_warm_start_imports_only_the_standard_library(stub):
+    cache = stub[2]
+    script = ("import sys, catalog; catalog.load_species_list(sys.argv[1]); "
+              "print(sorted({'pandas', 'requests', 'pydub', 'simpleaudio', 'yaml'} & set(sys.modules)))")
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, "-c", script, cache.cache_dir], cwd=repo_root,
+                            capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "[]"
+
+
+def test_new_uploads_are_merged_without_a_full_crawl(stub):
+    data, server, cache, options = stub
+    species_list = cache.load()
+    before = full_sync_times(cache)
+    ids = data.add_recordings("finland", 5, time.strftime("%Y-%m-%d", time.gmtime()))
+
+    affected = sync_catalog(cache, **options)
+    assert full_sync_times(cache) == before
+    affected_names = {name.lower() for name in affected}
+    assert affected_names == sci_names(data, ids)
+
+    updated = update_species_list(species_list, cache, affected)
+    assert summary(updated) == summary(cache.load())
+    unchanged = [species for species in species_list if species.correct_answers["sciName"] not in affected_names]
+    assert unchanged and all(species in updated.full_species_list for species in unchanged)
+
+
+def test_removed_recording_falls_back_to_a_full_crawl_of_its_country(stub):
+    data, server, cache, options = stub
+    species_list = cache.load()
+    before = full_sync_times(cache)
+    removed = data.recordings["sweden"][0]["id"]
+    sweden_species = sci_names(data, {r["id"] for r in data.recordings["sweden"]})
+    data.remove_recordings([removed])
+
+    affected = sync_catalog(cache, **options)
+    after = full_sync_times(cache)
+    assert after["sweden"] > before["sweden"]
+    assert {country: t for country, t in after.items() if country != "sweden"} == \
+           {country: t for country, t in before.items() if country != "sweden"}
+    assert {name.lower() for name in affected} == sweden_species
+
+    updated = update_species_list(species_list, cache, affected)
+    assert summary(updated) == summary(cache.load())
+    assert f"XC{removed}" not in {sound.xc_id for species in updated for sound in species.sounds}
+
+
+def test_server_sync_replaces_the_species_list_of_new_sessions(stub):
+    from server import QuizServer
+
+    data, server, cache, options = stub
+    quiz_server = QuizServer(cache.load(), prefetch_depth=0, catalog_cache=cache, catalog_sync_options=options)
+    old_list = quiz_server.species_list
+    data.add_recordings("finland", 5, time.strftime("%Y-%m-%d", time.gmtime()))
+
+    affected = asyncio.run(quiz_server.sync_catalog())
+    assert affected
+    assert quiz_server.species_list is not old_list
+    assert summary(quiz_server.species_list) == summary(cache.load())
+    quiz_server._executor.shutdown()
@@ -0,0 +1,31 @@
+import pytest
+
+from clip_pack import ClipPack, ClipPackWriter, index_path, load_default_clip_pack
+
+
+def test_clips_are_read_back_as_views_of_the_pack(tmp_path):
+    path = str(tmp_path / "clips.pack")
+    with ClipPackWriter(path, sample_rate=8000) as writer:
+        writer.add_pcm("XC1", b"\1\0" * 8000, {"recordist": "A"})
+        writer.add_pcm("XC2", b"\2\0" * 4000)
+
+    pack = ClipPack(path)
+    assert len(pack) == 2 and "XC1" in pack and "XC3" not in pack
+    assert isinstance(pack.get_buffer("XC2"), memoryview)
+    assert bytes(pack.get_buffer("XC1")) == b"\1\0" * 8000
+    assert bytes(pack.get_buffer("XC2")) == b"\2\0" * 4000
+    assert pack.get_metadata("XC1") == {"recordist": "A"}
+    assert pack.clips["XC1"]["duration_ms"] == 1000
+    pack.close()
+
+
+def test_only_valid_packs_are_opened(tmp_path):
+    path = str(tmp_path / "clips.pack")
+    assert load_default_clip_pack(path) is None
+    with ClipPackWriter(path) as writer:
+        writer.add_pcm("XC1", b"\0\0")
+    with open(path, "r+b") as f:
+        f.write(b"NOTAPACK")
+    with pytest.raises(ValueError):
+        ClipPack(path)
+    assert index_path(path) == str(tmp_path / "clips.index.json")
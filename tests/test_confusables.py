@@ -0,0 +1,64 @@
+from array import array
+
+import pytest
+
+from confusables import NO_NEIGHBOR, ConfusableTable, build_table, clip_features, load_default_confusables
+from playback import PcmClip
+
+FRAME_RATE = 22050
+
+
+def test_table_is_read_back_as_written(tmp_path):
+    path = str(tmp_path / "confusables.bin")
+    table = ConfusableTable(["parus major", "parus minor", "turdus merula"],
+                            array("I", [1, 2, 0, NO_NEIGHBOR, 0, 1]), 2)
+    table.save(path)
+    loaded = load_default_confusables(path)
+    assert loaded.names == table.names and loaded.k == 2
+    assert loaded.neighbors("parus major") == ["parus minor", "turdus merula"]
+    assert loaded.neighbors("parus minor") == ["parus major"]  # padding is dropped
+    assert loaded.neighbors("pica pica") == [] and "pica pica" not in loaded
+
+
+def test_missing_table_is_none_and_broken_ones_are_rejected(tmp_path):
+    path = tmp_path / "confusables.bin"
+    assert load_default_confusables(str(path)) is None
+    ConfusableTable(["parus major", "parus minor"], array("I", [1, 0]), 1).save(str(path))
+    data = path.read_bytes()
+
+    path.write_bytes(data[:-2])
+    with pytest.raises(ValueError, match="truncated"):
+        ConfusableTable.load(str(path))
+    path.write_bytes(b"XXXXXXXX" + data[8:])
+    with pytest.raises(ValueError, match="not a confusable"):
+        ConfusableTable.load(str(path))
+
+
+def song(frequencies: list[float], seconds: float = 2.0, noise: float = 0.01, seed: int = 0) -> PcmClip:
+    np = pytest.importorskip("numpy")
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * FRAME_RATE)) / FRAME_RATE
+    note = (t * 4).astype(int) % len(frequencies)  # four notes a second
+    wave = np.sin(2 * np.pi * np.asarray(frequencies)[note] * t) * 0.5 + rng.normal(0, noise, len(t))
+    return PcmClip((np.clip(wave, -1, 1) * 32767).astype("<i2").tobytes(), 1, 2, FRAME_RATE)
+
+
+def test_similar_songs_are_nearest_neighbors():
+    features = {
+        "whistler a": [clip_features(song([3000], seed=1)), clip_features(song([3050], seed=2))],
+        "whistler b": [clip_features(song([3100], seed=3))],
+        "triller a": [clip_features(song([2000, 5000], seed=4))],
+        "triller b": [clip_features(song([2100, 5200], seed=5))],
+        "silent": [],
+    }
+    table = build_table(features, k=3)
+    assert "silent" not in table and len(table) == 4
+    assert table.neighbors("whistler a")[0] == "whistler b"
+    assert table.neighbors("triller a")[0] == "triller b"
+    assert len(table.neighbors("triller b")) == 3
+
+
+def test_short_clips_have_no_features():
+    pytest.importorskip("numpy")
+    with pytest.raises(ValueError):
+        clip_features(PcmClip(b"\0\0" * 600, 1, 2, FRAME_RATE))
@@ -0,0 +1,42 @@
+import shutil
+
+import pytest
+
+pytest.importorskip("pandas")
+pytest.importorskip("requests")
+pytest.importorskip("pydub")
+
+from audio_cache import decoded_audio_cache  # noqa: E402
+from benchmarks.stub_server import StubApiServer, StubData  # noqa: E402
+from catalog import load_species_list  # noqa: E402
+from headless import HeadlessQuizSession  # noqa: E402
+from quiz import Quiz  # noqa: E402
+
+
+@pytest.fixture
+def stub(tmp_path):
+    data = StubData(12, 3, audio_seconds=2.0, audio_variants=2)
+    with StubApiServer(data) as server:
+        atlas_path = str(tmp_path / "atlasdata.csv")
+        data.write_atlas_csv(atlas_path)
+        species_list = load_species_list(str(tmp_path / "cache"),
+                                         species_options={"ebird_base_url": server.ebird_base_url,
+                                                          "atlas_path": atlas_path, "api_key": "stub"},
+                                         recording_options={"endpoint": server.xc_endpoint})
+        yield data, species_list
+    decoded_audio_cache.clear()
+
+
+def test_catalog_is_loaded_from_the_stub_apis(stub):
+    data, species_list = stub
+    assert sorted(species.correct_answers["sciName"] for species in species_list) == \
+           sorted(species["sciName"].lower() for species in data.species)
+    assert sum(len(species.recording_range) for species in species_list) == 12 * 3
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="pydub decodes the stub audio with ffmpeg")
+def test_headless_session_plays_a_whole_quiz(stub):
+    _, species_list = stub
+    result = HeadlessQuizSession(Quiz(prefetch_depth=2), species_list, difficulty=3, length=5).run()
+    assert len(result["time_to_playable"]) == 5
+    assert (result["correct"], result["wrong"], result["score_percent"]) == (5, 0, 100)
@@ -0,0 +1,129 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+pytest.importorskip("requests")
+
+import ingest  # noqa: E402
+from clip_pack import ClipPack, ClipPackWriter, checkpoint_path, index_path  # noqa: E402
+
+
+def fake_process_recording(xc_id, url, sample_rate, clip_length_ms, target_dbfs):
+    return xc_id, int(xc_id[2:]).to_bytes(2, "little") * 100, None
+
+
+def make_jobs(ids, hosts=("a.example", "b.example")):
+    return [{"xc_id": f"XC{i}", "url": f"http://{hosts[i % len(hosts)]}/{i}.mp3", "metadata": {"n": i}} for i in ids]
+
+
+@pytest.fixture
+def fake_downloads(monkeypatch):
+    # the process pool forks, so the workers see the patched functions
+    monkeypatch.setattr(ingest, "process_recording", fake_process_recording)
+    monkeypatch.setattr(ingest, "_init_worker", lambda: None)
+
+
+def read_clips(path):
+    pack = ClipPack(path)
+    try:
+        return {xc_id: bytes(pack.get_buffer(xc_id)) for xc_id in pack.clips}
+    finally:
+        pack.close()
+
+
+def test_rerun_on_finished_pack_keeps_earlier_clips(tmp_path, fake_downloads):
+    path = str(tmp_path / "clips.pack")
+    first = ingest.ingest(make_jobs(range(1, 6)), path, processes=2, per_host=1)
+    assert first["added"] == 5
+    assert not os.path.exists(checkpoint_path(path))
+
+    second = ingest.ingest(make_jobs(range(1, 9)), path, processes=2, per_host=1)
+    assert second["already_packed"] == 5
+    assert second["added"] == 3
+
+    clips = read_clips(path)
+    assert sorted(clips) == [f"XC{i}" for i in range(1, 9)]
+    for xc_id, data in clips.items():
+        assert data == int(xc_id[2:]).to_bytes(2, "little") * 100
+
+
+def test_interrupted_run_resumes_from_checkpoint(tmp_path):
+    path = str(tmp_path / "clips.pack")
+    with pytest.raises(RuntimeError):
+        with ClipPackWriter(path, resume=True) as writer:
+            writer.add_pcm("XC1", b"\x01\x00" * 10)
+            raise RuntimeError("interrupted")
+    assert os.path.exists(checkpoint_path(path))
+
+    with ClipPackWriter(path, resume=True) as writer:
+        assert "XC1" in writer
+        writer.add_pcm("XC2", b"\x02\x00" * 10)
+    assert read_clips(path) == {"XC1": b"\x01\x00" * 10, "XC2": b"\x02\x00" * 10}
+
+
+def test_rewrite_replaces_pack_without_truncating_open_readers(tmp_path):
+    path = str(tmp_path / "clips.pack")
+    with ClipPackWriter(path) as writer:
+        writer.add_pcm("XC1", b"\x01\x00" * 10)
+    reader = ClipPack(path)
+
+    writer = ClipPackWriter(path)
+    assert bytes(reader.get_buffer("XC1")) == b"\x01\x00" * 10  # the old pack is untouched while writing
+    writer.add_pcm("XC2", b"\x02\x00" * 10)
+    writer.close()
+
+    assert bytes(reader.get_buffer("XC1")) == b"\x01\x00" * 10
+    reader.close()
+    with open(index_path(path)) as f:
+        assert list(json.load(f)["clips"]) == ["XC2"]
+
+
+class HostLoad:
+    """Stands in for process_recording() in a thread pool, recording the most downloads in flight per host."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = {}
+        self.max_in_flight = {}
+
+    def __call__(self, xc_id, url, sample_rate, clip_length_ms, target_dbfs):
+        host = url.split("/")[2]
+        with self.lock:
+            self.in_flight[host] = self.in_flight.get(host, 0) + 1
+            self.max_in_flight[host] = max(self.max_in_flight.get(host, 0), self.in_flight[host])
+        time.sleep(0.001)
+        with self.lock:
+            self.in_flight[host] -= 1
+        if xc_id == "XC13":
+            return xc_id, None, "HTTPError('404')"
+        return fake_process_recording(xc_id, url, sample_rate, clip_length_ms, target_dbfs)
+
+
+def test_downloads_per_host_are_capped(tmp_path, monkeypatch):
+    load = HostLoad()
+    monkeypatch.setattr(ingest, "ProcessPoolExecutor", ThreadPoolExecutor)
+    monkeypatch.setattr(ingest, "process_recording", load)
+    monkeypatch.setattr(ingest, "_init_worker", lambda: None)
+    hosts = ("a.example", "b.example", "c.example")
+
+    report = ingest.ingest(make_jobs(range(1, 301), hosts), str(tmp_path / "clips.pack"), processes=8, per_host=2)
+    assert report["added"] == 299
+    assert report["failed"] == 1
+    assert set(load.max_in_flight) == set(hosts)
+    assert max(load.max_in_flight.values()) <= 2
+
+
+def test_normalized_clip_reaches_the_target_loudness_without_clipping():
+    np = pytest.importorskip("numpy")
+    quiet = (np.sin(np.linspace(0, 200 * np.pi, 22050)) * 1000).astype(np.int16)
+    samples = np.frombuffer(ingest.normalize_loudness(quiet.tobytes(), -20.0), dtype=np.int16) / 32768
+    assert 20 * np.log10(np.sqrt(np.mean(np.square(samples)))) == pytest.approx(-20.0, abs=0.1)
+
+    spiky = np.zeros(22050, dtype=np.int16)
+    spiky[::1000] = 1000
+    samples = np.frombuffer(ingest.normalize_loudness(spiky.tobytes(), -20.0), dtype=np.int16) / 32768
+    assert np.max(np.abs(samples)) <= ingest.PEAK_LIMIT
@@ -0,0 +1,41 @@
+import json
+
+import pytest
+
+import instrumentation
+
+
+@pytest.fixture
+def metrics_path(tmp_path):
+    path = str(tmp_path / "metrics.jsonl")
+    instrumentation.enable(path)
+    yield path
+    instrumentation.disable()
+    instrumentation.reset()
+
+
+def test_nothing_is_recorded_while_disabled():
+    assert not instrumentation.is_enabled()
+    assert instrumentation.timer("download.decode") is instrumentation.NULL_TIMER
+    instrumentation.record("download.network", 1.0)
+    instrumentation.count("download.bytes", 100)
+    assert instrumentation.summary() == {"timers": {}, "counters": {}}
+
+
+def test_session_summaries_are_exported_as_json_lines(metrics_path):
+    for seconds in (0.1, 0.2, 0.3, 0.4, 0.5):
+        instrumentation.record("download.network", seconds)
+    instrumentation.count("download.bytes", 100)
+    instrumentation.count("download.bytes", 50)
+    instrumentation.timed("ui.callback")(lambda: None)()
+
+    instrumentation.export_session()
+    instrumentation.export_session()  # the second session only has its start and end times
+    with open(metrics_path) as f:
+        first, second = [json.loads(line) for line in f]
+    network = first["timers"]["download.network"]
+    assert (network["count"], network["p50"], network["max"]) == (5, 0.3, 0.5)
+    assert network["p95"] == pytest.approx(0.48)
+    assert first["timers"]["ui.callback"]["count"] == 1
+    assert first["counters"] == {"download.bytes": 150}
+    assert second["timers"] == {} and second["session_id"] != first["session_id"]
@@ -0,0 +1,38 @@
+import pytest
+
+from playback import AUDIO_BACKEND_ENV_VAR, AudioBackendConfigError, ClipFormatError, NullBackend, PcmClip, \
+    PlaybackEngine, backend_from_env
+
+
+@pytest.mark.parametrize("name, backend_class", [("null", NullBackend), ("wav:out.wav", NullBackend)])
+def test_backend_from_env(monkeypatch, name, backend_class):
+    monkeypatch.setenv(AUDIO_BACKEND_ENV_VAR, name)
+    assert isinstance(backend_from_env(), backend_class)
+
+
+def test_unknown_backend_is_a_configuration_error(monkeypatch):
+    monkeypatch.setenv(AUDIO_BACKEND_ENV_VAR, "simpleaudo")
+    with pytest.raises(AudioBackendConfigError) as error:
+        PlaybackEngine().play(PcmClip(b"\0\0" * 100, 1, 2, 22050))
+    assert not isinstance(error.value, ValueError)
+
+
+@pytest.mark.parametrize("channels, sample_width, frame_rate", [(0, 2, 22050), (1, 5, 22050), (1, 2, 0)])
+def test_unplayable_clip_format(channels, sample_width, frame_rate):
+    with pytest.raises(ClipFormatError):
+        PcmClip(b"\0" * 100, channels, sample_width, frame_rate)
+
+
+def test_pause_resume_and_seek():
+    backend = NullBackend()
+    playback = PlaybackEngine(backend).play(PcmClip(b"\0\0" * 22050, 1, 2, 22050))
+    assert playback.is_playing()
+    playback.pause()
+    assert playback.is_paused() and not playback.is_playing()
+    playback.resume()
+    assert playback.is_playing()
+    playback.seek(500)
+    assert 500 <= playback.position_ms() < 1000
+    playback.stop()
+    assert not playback.is_playing()
+    assert backend.started == 3
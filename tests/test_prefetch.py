@@ -0,0 +1,61 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from quiz import SoundPrefetcher
+
+
+class FakeSpecies:
+    def __init__(self, name: str, loads: list, release: threading.Event):
+        self.name = name
+        self.loads = loads
+        self.release = release
+
+    def pick_sound(self):
+        self.release.wait(5)
+        self.loads.append((self.name, threading.current_thread().name))
+        return f"{self.name} sound"
+
+
+def make_species(count: int):
+    loads, release = [], threading.Event()
+    return [FakeSpecies(f"s{i}", loads, release) for i in range(count)], loads, release
+
+
+def test_sounds_are_loaded_ahead_on_background_threads():
+    species_list, loads, release = make_species(5)
+    prefetcher = SoundPrefetcher(species_list, depth=2)
+    prefetcher.schedule(0)
+    assert set(prefetcher._futures) == {0, 1}
+    release.set()
+
+    assert prefetcher.get(0) == "s0 sound"
+    assert set(prefetcher._futures) == {1, 2}  # never more than depth species ahead
+    prefetcher._futures[2].result()
+    assert prefetcher.get(1) == "s1 sound"
+    prefetcher.cancel()
+    prefetcher._executor.shutdown(wait=True)
+    assert {"s0", "s1", "s2"} <= {name for name, _ in loads} <= {"s0", "s1", "s2", "s3"}
+    assert all(thread.startswith("prefetch") for _, thread in loads)
+
+
+def test_cancel_drops_loads_that_have_not_started():
+    species_list, loads, release = make_species(5)
+    prefetcher = SoundPrefetcher(species_list, depth=4, max_workers=1)
+    prefetcher.schedule(0)
+    prefetcher.cancel()
+    release.set()
+    prefetcher._executor.shutdown(wait=True)
+    prefetcher.schedule(0)
+
+    assert len(loads) <= 1  # only the load already running when the prefetcher was cancelled
+
+
+def test_shared_executor_outlives_the_prefetcher():
+    species_list, loads, release = make_species(3)
+    release.set()
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch") as executor:
+        prefetcher = SoundPrefetcher(species_list, depth=1, executor=executor)
+        prefetcher.schedule(0)
+        assert prefetcher.get(0) == "s0 sound"
+        prefetcher.cancel()
+        assert executor.submit(species_list[2].pick_sound).result() == "s2 sound"
@@ -0,0 +1,210 @@
+import threading
+
+import pytest
+
+from array import array
+
+from answer_history import AnswerHistory
+from audio_cache import decoded_audio_cache
+from confusables import NO_NEIGHBOR, ConfusableTable
+from playback import AudioBackendConfigError, ClipFormatError, PcmClip, playback_engine
+from quiz import MysterySpecies, Quiz
+from recording_health import NegativeCache, RecordingUnavailable, recording_health
+from recording_table import RecordingTable
+
+
+@pytest.fixture
+def species_list(tmp_path, monkeypatch):
+    monkeypatch.setattr(recording_health, "negative_cache", NegativeCache(str(tmp_path / "bad.json")))
+    rows = [(s * 10 + r, f"//xeno-canto.org/{s}{r}", f"https://stub/{s}{r}.mp3", "Recordist", "Finland",
+             "Helsinki", "song", "CC BY") for s in range(12) for r in range(3)]
+    recording_table = RecordingTable.from_rows(rows)
+    species_list = [MysterySpecies(f"laji {s}", f"species {s}", f"species {s:02}", recording_table,
+                                   range(s * 3, s * 3 + 3), square_count=s) for s in range(12)]
+    for idx in range(len(recording_table)):  # every clip is cached, so nothing is downloaded
+        decoded_audio_cache.put(recording_table.xc_id(idx), PcmClip(b"\0\0" * 100, 1, 2, 22050))
+    yield species_list
+    decoded_audio_cache.clear()
+
+
+def make_quiz(species_list, prefetch_depth: int, length: int = 4, history=None, prepare_sound=None) -> Quiz:
+    quiz = Quiz(prefetch_depth=prefetch_depth, history=history, prepare_sound=prepare_sound)
+    quiz.set_species_list(species_list)
+    quiz.set_difficulty_level(3)
+    quiz.set_quiz_length(length)
+    quiz.difficulty_filter()
+    quiz.length_filter()
+    return quiz
+
+
+def make_unplayable(species):
+    species.failed_recordings.update(species.recording_range)
+
+
+@pytest.mark.parametrize("prefetch_depth", [0, 2])
+def test_unplayable_species_is_swapped_for_a_spare(species_list, prefetch_depth):
+    quiz = make_quiz(species_list, prefetch_depth)
+    unplayable = quiz.mystery_species_list[0]
+    make_unplayable(unplayable)
+    quiz.start_prefetch()
+
+    sound = quiz.next_species()
+    assert quiz.species_no == 1
+    assert quiz.current_species is not unplayable
+    assert quiz.current_species.current_sound is sound
+    assert len(quiz.mystery_species_list) == 4
+    quiz.stop_prefetch()
+
+
+def test_gives_up_after_max_swaps(species_list):
+    for species in species_list:
+        make_unplayable(species)
+    quiz = make_quiz(species_list, prefetch_depth=0)
+    with pytest.raises(RecordingUnavailable):
+        quiz.next_species()
+    assert quiz.species_no == 0
+
+
+class FakePlayback:
+    def is_paused(self):
+        return False
+
+    def stop(self):
+        pass
+
+
+def test_unplayable_clip_is_replaced_on_the_quiz(species_list, monkeypatch):
+    plays = []
+
+    def play(clip):
+        plays.append(clip)
+        if len(plays) == 1:
+            raise ClipFormatError("Unsupported sample format")
+        return FakePlayback()
+
+    monkeypatch.setattr(playback_engine, "play", play)
+    quiz = make_quiz(species_list, prefetch_depth=0)
+    broken = quiz.next_species()
+
+    sound = quiz.play_current_sound()
+    assert sound is not broken
+    assert len(plays) == 2
+    assert quiz.current_species.current_sound is sound
+    assert recording_health.is_known_bad(broken.xc_id)
+
+
+def test_play_gives_up_after_max_play_attempts(species_list, monkeypatch):
+    def play(clip):
+        raise ClipFormatError("Unsupported sample format")
+
+    monkeypatch.setattr(playback_engine, "play", play)
+    quiz = make_quiz(species_list, prefetch_depth=0)
+    quiz.next_species()
+    with pytest.raises(RecordingUnavailable):
+        quiz.play_current_sound()
+
+
+@pytest.mark.parametrize("error", [ValueError("Output device busy"), AudioBackendConfigError("Unknown audio backend")])
+def test_other_playback_errors_are_not_persisted(species_list, monkeypatch, error):
+    def play(clip):
+        raise error
+
+    monkeypatch.setattr(playback_engine, "play", play)
+    quiz = make_quiz(species_list, prefetch_depth=0)
+    sound = quiz.next_species()
+    with pytest.raises(type(error)):
+        quiz.play_current_sound()
+    assert quiz.current_species.current_sound is sound
+    assert len(recording_health.negative_cache) == 0
+
+
+
+@pytest.mark.parametrize("prefetch_depth, loading_thread", [(0, "MainThread"), (2, "prefetch")])
+def test_every_question_is_prepared_on_the_thread_loading_it(species_list, prefetch_depth, loading_thread):
+    prepared = []
+    quiz = make_quiz(species_list, prefetch_depth, prepare_sound=lambda sound: prepared.append(
+        (sound, threading.current_thread().name)))
+    quiz.start_prefetch()
+    sounds = [quiz.next_species() for _ in range(3)]
+    quiz.stop_prefetch()
+    assert set(sounds) <= {sound for sound, _ in prepared}  # prefetched clips may finish in any order
+    assert all(thread.startswith(loading_thread) for _, thread in prepared)
+
+def test_misspelled_answer_is_accepted_only_for_the_current_species(species_list):
+    quiz = make_quiz(species_list, prefetch_depth=0)
+    quiz.set_answer_tolerance(1)
+    quiz.next_species()
+    name = quiz.current_species.correct_answers["comNameFI"]
+    other = next(species for species in species_list if species is not quiz.current_species)
+
+    assert quiz.check_answer("x" + name)
+    assert not quiz.check_answer(other.correct_answers["comNameFI"])
+    quiz.set_answer_tolerance(2)
+    assert not quiz.check_answer("laji")  # two edits from the names of nine species
+    quiz.set_answer_tolerance(0)
+    assert not quiz.check_answer("x" + name)
+    assert [answer["answered_correctly"] for answer in quiz.answers] == [True, False, False, False]
+
+
+def test_suggestions_come_from_the_whole_catalog(species_list):
+    quiz = make_quiz(species_list, prefetch_depth=0, length=2)
+    assert len(quiz.suggest_answers("laji 1", limit=8)) == 3  # laji 1, laji 10 and laji 11
+
+
+def test_answers_are_logged_and_weight_the_next_quiz(species_list, tmp_path):
+    history = AnswerHistory(str(tmp_path / "answers.bin"))
+    quiz = make_quiz(species_list, prefetch_depth=0, length=1, history=history)
+    quiz.next_species()
+    missed = quiz.current_species.correct_answers["sciName"]
+    quiz.check_answer("wrong")
+    stats = AnswerHistory(history.path).stats(missed)  # read back from the files
+    assert stats["attempts"] == 1 and stats["errors"] == 1
+    assert AnswerHistory(history.path).stats(species_list[0].correct_answers["sciName"] + "x") is None
+
+    hard = next(species.correct_answers["sciName"] for species in species_list
+                if species.correct_answers["sciName"] != missed)
+    for _ in range(5):  # answered long ago: every species right five times, one of them wrong ten times
+        for species in species_list:
+            history.record(species.correct_answers["sciName"], "XC1", True, 1.0, answered_at=0.0)
+    for _ in range(10):
+        history.record(hard, "XC1", False, 1.0, answered_at=0.0)
+    draws = [make_quiz(species_list, prefetch_depth=0, length=1, history=history).mystery_species_list[0]
+             for _ in range(200)]
+    assert sum(species.correct_answers["sciName"] == hard for species in draws) > 200 / len(species_list) * 2
+    assert sum(species.correct_answers["sciName"] == missed for species in draws) < 200 / len(species_list) / 2
+
+
+def two_genera(species_list) -> list[MysterySpecies]:
+    """The fixture's recordings as three species of genus alpha and nine of genus beta."""
+    return [MysterySpecies(f"lintu {s}", f"bird {s}", f"{'alpha' if s < 3 else 'beta'} {s}", species.recording_table,
+                           species.recording_range, square_count=s) for s, species in enumerate(species_list)]
+
+
+def test_options_are_confusable_species_then_the_same_genus_then_random(species_list):
+    species_list = two_genera(species_list)
+    names = [species.correct_answers["sciName"] for species in species_list]
+    table = ConfusableTable(names[:2], array("I", [1, NO_NEIGHBOR, 0, NO_NEIGHBOR]), 2)
+    quiz = Quiz(prefetch_depth=0, confusables=table)
+    quiz.set_species_list(species_list)
+    quiz.current_species = species_list[0]
+
+    options = [species.correct_answers["sciName"] for species in quiz.answer_options(4)]
+    assert len(set(options)) == 4 and "alpha 0" in options
+    assert {"alpha 1", "alpha 2"} <= set(options)  # the table neighbor and the rest of the genus
+    assert len([name for name in options if name.startswith("beta")]) == 1
+
+    quiz.current_species = species_list[5]
+    options = [species.correct_answers["sciName"] for species in quiz.answer_options(3)]
+    assert "beta 5" in options and all(name.startswith("beta") for name in options)
+
+
+def test_table_neighbors_come_before_the_genus(species_list):
+    species_list = two_genera(species_list)
+    names = [species.correct_answers["sciName"] for species in species_list]
+    table = ConfusableTable(names, array("I", [8, 9] + [NO_NEIGHBOR] * 22), 2)  # alpha 0: beta 8, beta 9
+    quiz = Quiz(prefetch_depth=0, confusables=table)
+    quiz.set_species_list(species_list)
+    quiz.current_species = species_list[0]
+    for _ in range(10):
+        options = {species.correct_answers["sciName"] for species in quiz.answer_options(3)}
+        assert options == {"alpha 0", "beta 8", "beta 9"}
@@ -0,0 +1,38 @@
+from array import array
+
+import pytest
+
+from recording_table import RecordingTable
+
+
+def make_row(xc_id) -> tuple:
+    return (xc_id, f"//xeno-canto.org/{xc_id}", f"https://stub/{xc_id}.mp3", "rec", "Finland", "Oulu", "call",
+            "CC BY 4.0")
+
+
+def test_numeric_ids_are_packed():
+    table = RecordingTable.from_rows([make_row("12"), make_row("345")])
+    assert len(table) == 2
+    assert table.columns["id"] == array("q", [12, 345])
+    assert table.row(1) == (345,) + make_row("345")[1:]
+
+
+def test_other_ids_are_kept_as_given():
+    table = RecordingTable.from_rows([make_row("12"), make_row("x9")])
+    assert table.columns["id"] == ["12", "x9"]
+    assert len(RecordingTable.from_rows([])) == 0
+
+
+def test_columns_must_have_the_same_length():
+    columns = dict(zip(("id", "url", "file", "rec", "cnt", "loc", "type", "lic"), zip(*[make_row("1")])))
+    columns["loc"] = ()
+    with pytest.raises(ValueError):
+        RecordingTable(columns)
+
+
+def test_repeated_values_are_stored_once():
+    rows = [make_row("1"), make_row("2")]
+    rows[1] = rows[1][:4] + ("".join(["Fin", "land"]),) + rows[1][5:]  # equal to rows[0]'s country, another object
+    table = RecordingTable.from_rows(rows)
+    assert table.row(1)[4] == "Finland"
+    assert table.row(0)[4] is table.row(1)[4]
@@ -0,0 +1,104 @@
+import asyncio
+import json
+
+import pytest
+
+from audio_cache import decoded_audio_cache
+from benchmarks.stub_server import StubData
+from catalog import species_list_from_rows
+from playback import PcmClip
+from recording_health import NegativeCache, recording_health
+from server import HttpError, QuizServer
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    monkeypatch.setattr(recording_health, "negative_cache", NegativeCache(str(tmp_path / "bad.json")))
+    species_list = species_list_from_rows(StubData(12, 3, audio_variants=0).catalog_rows("http://stub"))
+    for species in species_list:  # every clip is cached, so nothing is downloaded
+        for sound in species.sounds:
+            decoded_audio_cache.put(sound.xc_id, PcmClip(b"\1\0" * 100, 1, 2, 22050))
+    server = QuizServer(species_list, prefetch_depth=0)
+    yield server
+    server._executor.shutdown()
+    decoded_audio_cache.clear()
+
+
+async def request(port: int, method: str, path: str, content: dict | None = None) -> tuple[int, bytes]:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    body = json.dumps(content).encode() if content is not None else b""
+    writer.write(f"{method} {path} HTTP/1.1\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+                 + body)
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while (line := await reader.readline()) not in (b"\r\n", b""):
+        name, _, value = line.decode().partition(":")
+        headers[name.strip().lower()] = value.strip()
+    data = await reader.readexactly(int(headers["content-length"]))
+    writer.close()
+    return status, data
+
+
+@pytest.mark.parametrize("options", [{"difficulty": "hard"}, {"difficulty": 6}, {"difficulty": None},
+                                     {"length": "ten"}, {"length": 0}, {"length": [10]},
+                                     {"tolerance": "1.5"}, {"tolerance": -1}, {"tolerance": True},
+                                     {"wildcard": 3}, {"multiple_choice": "false"},
+                                     {"multiple_choice": 0}, {"multiple_choice": "0"}])
+def test_invalid_session_options_are_rejected(server, options):
+    with pytest.raises(HttpError) as error:
+        asyncio.run(server.create_session(options))
+    assert error.value.status == 400
+    assert not server.sessions
+
+
+def test_session_options_are_applied(server):
+    session = asyncio.run(server.create_session({"difficulty": "2", "length": 3, "tolerance": 0,
+                                                 "multiple_choice": True}))
+    quiz = server.sessions[session["session_id"]].quiz
+    assert (quiz.difficulty_level, quiz.quiz_length, quiz.answer_tolerance) == (2, 3, 0)
+    assert quiz.multiple_choice
+    assert session["questions"] == 3
+
+
+@pytest.mark.parametrize("multiple_choice", [True, False])
+def test_only_multiple_choice_questions_have_options(server, multiple_choice):
+    async def ask():
+        session = server.sessions[(await server.create_session({"multiple_choice": multiple_choice}))["session_id"]]
+        return session, await server.next_question(session)
+
+    session, question = asyncio.run(ask())
+    if multiple_choice:
+        assert len(question["options"]) == 4
+        assert session.quiz.current_species.correct_answers["comNameFI"] in question["options"]
+    else:
+        assert "options" not in question
+
+
+def test_sessions_share_species_but_keep_their_own_question(server):
+    async def play():
+        await server.start("127.0.0.1", 0)
+        try:
+            sessions = []
+            for _ in range(2):
+                status, data = await request(server.port, "POST", "/sessions", {"length": 12})
+                assert status == 200
+                sessions.append(json.loads(data)["session_id"])
+            questions = [json.loads((await request(server.port, "POST", f"/sessions/{session_id}/next"))[1])
+                         for session_id in sessions]
+            status, clip = await request(server.port, "GET", f"/sessions/{sessions[0]}/clip")
+            assert status == 200 and clip[:4] == b"RIFF" and clip[44:] == b"\1\0" * 100
+
+            quiz = server.sessions[sessions[0]].quiz
+            name = quiz.current_species.correct_answers["comNameFI"]
+            status, data = await request(server.port, "POST", f"/sessions/{sessions[0]}/answer", {"answer": name})
+            assert json.loads(data)["correct"] and json.loads(data)["answered"] == 1
+            status, data = await request(server.port, "POST", f"/sessions/{sessions[0]}/answer", {"answer": name})
+            assert status == 409  # one answer per question
+            status, data = await request(server.port, "GET", f"/sessions/{sessions[1]}")
+            assert json.loads(data)["answered"] == 0
+            assert [server.sessions[s].quiz.current_sound.xc_id for s in sessions] == [q["xc_id"] for q in questions]
+            assert (await request(server.port, "GET", "/sessions/unknown"))[0] == 404
+        finally:
+            await server.close()
+
+    asyncio.run(play())
@@ -0,0 +1,123 @@
+import time
+
+import pytest
+
+requests = pytest.importorskip("requests")
+pytest.importorskip("pydub")
+
+import sound_download  # noqa: E402
+from pydub.exceptions import CouldntDecodeError  # noqa: E402
+from recording_health import NegativeCache, RecordingHealth, RecordingUnavailable, RetryPolicy  # noqa: E402
+
+
+class FakeResponse:
+    def __init__(self, chunks: list[bytes], delay: float):
+        self.chunks = chunks
+        self.delay = delay
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        for chunk in self.chunks:
+            time.sleep(self.delay)
+            yield chunk
+
+
+class FakeSession:
+    """Serves the same chunks to every request, sleeping delays[n] before each chunk of the n-th request."""
+
+    def __init__(self, chunks: list[bytes], delays: list[float]):
+        self.chunks = chunks
+        self.delays = delays
+        self.requests = 0
+
+    def get(self, url, stream=False, timeout=None):
+        delay = self.delays[min(self.requests, len(self.delays) - 1)]
+        self.requests += 1
+        return FakeResponse(self.chunks, delay)
+
+
+def test_trickling_download_stops_at_the_deadline():
+    session = FakeSession([b"\0" * 1024] * 1000, [0.01])
+    start = time.monotonic()
+    with pytest.raises(requests.exceptions.Timeout):
+        sound_download.download_clip("http://stub/slow.mp3", session=session, max_seconds=0.2)
+    assert time.monotonic() - start < 1.0
+
+
+def test_full_download_fallback_shares_the_deadline(monkeypatch):
+    def decode_sound(data):
+        raise CouldntDecodeError("not audio")
+
+    monkeypatch.setattr(sound_download, "decode_sound", decode_sound)
+    session = FakeSession([b"\0" * 1024] * 40, [0.0, 0.05])
+    with pytest.raises(requests.exceptions.Timeout):
+        sound_download.download_clip("http://stub/slow.mp3", session=session, max_seconds=0.3)
+    assert session.requests == 2
+
+
+def test_deadline_is_retried_as_a_transient_failure(tmp_path, monkeypatch):
+    session = FakeSession([b"\0" * 1024] * 1000, [0.01])
+    monkeypatch.setattr(requests, "get", session.get)
+    health = RecordingHealth(retry_policy=RetryPolicy(max_attempts=2, base_delay=0), deadline=0.1,
+                             negative_cache=NegativeCache(str(tmp_path / "bad.json")))
+    with pytest.raises(RecordingUnavailable):
+        health.download("XC1", "http://stub/slow.mp3")
+    assert session.requests == 2
+    assert not health.is_known_bad("XC1")
+
+
+class FakeSound:
+    def __init__(self, length_ms: int):
+        self.length_ms = length_ms
+
+    def __len__(self):
+        return self.length_ms
+
+    def __getitem__(self, item):
+        return FakeSound(len(range(self.length_ms)[item]))
+
+
+class FakeDecoder:
+    """Decodes data to a FakeSound as long as the data lasts at bitrate_kbps, recording the decoded sizes."""
+
+    def __init__(self, bitrate_kbps: int = 128):
+        self.bitrate_kbps = bitrate_kbps
+        self.sizes = []
+
+    def __call__(self, data: bytes) -> FakeSound:
+        self.sizes.append(len(data))
+        return FakeSound(len(data) * 8 // self.bitrate_kbps)
+
+
+@pytest.fixture
+def decoder(monkeypatch):
+    decoder = FakeDecoder()
+    monkeypatch.setattr(sound_download, "decode_sound", decoder)
+    return decoder
+
+
+@pytest.mark.parametrize("bitrate_kbps, max_fetches", [(128, 1), (192, 2), (320, 2)])
+def test_stream_stops_soon_after_the_clip(decoder, bitrate_kbps, max_fetches):
+    decoder.bitrate_kbps = bitrate_kbps
+    chunk = b"\0" * sound_download.CHUNK_SIZE
+    session = FakeSession([chunk] * 100, [0.0])  # a 6.5 MB recording, minutes long
+    sound = sound_download.stream_clip("http://stub/song.mp3", 15000, session=session)
+    assert len(sound) == 15000
+    assert len(decoder.sizes) <= max_fetches
+    assert decoder.sizes[-1] < 15000 * bitrate_kbps / 8 * 2 + 2 * sound_download.CHUNK_SIZE
+
+
+def test_recording_shorter_than_the_clip_is_decoded_whole(decoder):
+    session = FakeSession([b"\0" * sound_download.CHUNK_SIZE] * 2, [0.0])
+    sound = sound_download.download_clip("http://stub/call.mp3", 15000, session=session)
+    assert len(sound) == 2 * sound_download.CHUNK_SIZE * 8 // 128
+    assert decoder.sizes == [2 * sound_download.CHUNK_SIZE]
+    assert session.requests == 1
@@ -0,0 +1,57 @@
+import random
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("pandas")
+pytest.importorskip("requests")
+
+from species_data import fetch_all_recordings  # noqa: E402
+
+
+class FakePage:
+    def __init__(self, body: dict):
+        self.body = body
+        self.content = b"{}"
+
+    def raise_for_status(self):
+        pass
+
+    def json(self) -> dict:
+        return self.body
+
+
+class FakeSession:
+    """Serves page_counts[country] pages of two recordings each, answering in random order."""
+
+    def __init__(self, page_counts: dict):
+        self.page_counts = page_counts
+        self.requests = []
+        self.in_flight = self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def get(self, url, params, timeout):
+        country = params["query"].split("cnt:")[1].split()[0]
+        with self._lock:
+            self.requests.append((country, params["page"], timeout))
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(0.002 + random.uniform(0, 0.01))
+        with self._lock:
+            self.in_flight -= 1
+        recordings = [{"id": f"{country}-{params['page']}-{i}"} for i in range(2)]
+        return FakePage({"numPages": self.page_counts[country], "recordings": recordings})
+
+
+def test_pages_are_fetched_concurrently_and_kept_in_order():
+    session = FakeSession({"finland": 5, "sweden": 1, "norway": 3})
+    recordings = fetch_all_recordings(list(session.page_counts), "http://stub", max_workers=4, timeout=(1, 2),
+                                      session=session)
+
+    assert [r["id"] for r in recordings] == [f"{country}-{page}-{i}" for country, pages in session.page_counts.items()
+                                             for page in range(1, pages + 1) for i in range(2)]
+    assert sorted(request[:2] for request in session.requests) == \
+           sorted((country, page) for country, pages in session.page_counts.items() for page in range(1, pages + 1))
+    assert all(request[2] == (1, 2) for request in session.requests)
+    assert 1 < session.max_in_flight <= 4
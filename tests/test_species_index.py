@@ -0,0 +1,77 @@
+import random
+
+import pytest
+
+from species_index import FuzzyNameIndex, SpeciesIndex, edit_distance, literal_prefix
+
+
+class FakeSpecies:
+    def __init__(self, fi: str, en: str, sci: str, square_count: int):
+        self.correct_answers = {"comNameFI": fi, "comNameEN": en, "sciName": sci}
+        self.square_count = square_count
+
+
+SPECIES = [FakeSpecies("talitiainen", "great tit", "parus major", 3000),
+           FakeSpecies("sinitiainen", "blue tit", "cyanistes caeruleus", 2000),
+           FakeSpecies("kuusitiainen", "coal tit", "periparus ater", 1500),
+           FakeSpecies("varis", "hooded crow", "corvus cornix", 3500),
+           FakeSpecies("kuukkeli", "siberian jay", "perisoreus infaustus", 600),
+           FakeSpecies("lapintiira", "arctic tern", "sterna paradisaea", 900)]
+
+
+def test_difficulty_levels_are_slices_of_the_rank_order():
+    index = SpeciesIndex(SPECIES)
+    assert index.difficulty_slice(1) == [3, 0]
+    assert index.difficulty_slice(3) == [3, 0, 1, 2, 5, 4]
+    assert index.difficulty_slice(4) == [4, 5, 2, 1]
+    assert index.difficulty_slice(5) == [4, 5]
+
+
+def test_wildcards_match_any_name():
+    index = SpeciesIndex(SPECIES)
+    assert index.wildcard_matches("*tiainen") == {0, 1, 2}
+    assert index.wildcard_matches("*TIT") == {0, 1, 2}
+    assert index.wildcard_matches("peri*") == {2, 4}
+    assert index.wildcard_matches("kuu*") == {2, 4}
+    assert index.wildcard_matches("*") == set(range(len(SPECIES)))
+    assert index.wildcard_matches("korppi") == set()
+
+
+def test_prefix_queries_only_look_at_the_literal_prefix():
+    index = SpeciesIndex(SPECIES)
+    assert index.prefix_matches("Si") == [("siberian jay", 4), ("sinitiainen", 1)]
+    assert literal_prefix("par.s*") == "par"
+    assert literal_prefix("*tiainen") == ""
+
+
+def test_suggestions_are_distinct_names_in_order():
+    index = SpeciesIndex(SPECIES)
+    assert index.suggest("Ku") == ["kuukkeli", "kuusitiainen"]
+    assert index.suggest("c", limit=2) == ["coal tit", "corvus cornix"]
+    assert index.suggest("  ") == []
+    assert index.suggest("x") == []
+
+
+@pytest.mark.parametrize("a, b, distance", [("varis", "varis", 0), ("varis", "vares", 1), ("varis", "vris", 1),
+                                            ("talitiainen", "talitaiinen", 2), ("", "tit", 3)])
+def test_edit_distance(a, b, distance):
+    assert edit_distance(a, b) == distance
+    assert edit_distance(b, a, max_distance=1) == min(distance, 2)
+
+
+def test_fuzzy_search_finds_every_name_a_full_scan_finds():
+    rng = random.Random(0)
+    names = ["".join(rng.choice("aeiklnrst ") for _ in range(rng.randint(2, 12))) for _ in range(300)]
+    fuzzy_index = FuzzyNameIndex(names)
+    for query in names[:50] + ["", "a", "kirsi"]:
+        for max_distance in (1, 2):
+            expected = sorted({(edit_distance(query, name), name) for name in names
+                               if edit_distance(query, name) <= max_distance})
+            assert fuzzy_index.search(query, max_distance) == expected
+
+
+def test_closest_species_is_found_by_its_nearest_name():
+    index = SpeciesIndex(SPECIES)
+    assert index.closest_species("Talitiaien", 1) == (1, {0})
+    assert index.closest_species("kuukeli", 2) == (1, {4})
+    assert index.closest_species("tit", 1) is None
@@ -0,0 +1,70 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from playback import PcmClip  # noqa: E402
+from spectrogram import HEIGHT, MAX_FREQUENCY, WIDTH, compute_spectrogram, render_ppm, sound_spectrogram  # noqa: E402
+
+FRAME_RATE = 22050
+
+
+def tone_clip(frequency: float, sample_width: int = 2, channels: int = 1, seconds: float = 2.0) -> PcmClip:
+    t = np.arange(int(seconds * FRAME_RATE)) / FRAME_RATE
+    wave = np.sin(2 * np.pi * frequency * t) * 0.5
+    if sample_width == 1:
+        samples = (wave * 127 + 128).astype(np.uint8)
+    else:
+        samples = (wave * (2 ** (8 * sample_width - 1) - 1)).astype(np.int64)
+    frames = np.repeat(samples[:, None], channels, axis=1).reshape(-1)
+    if sample_width == 1:
+        data = frames.tobytes()
+    else:  # little-endian, the low sample_width bytes of every int64
+        data = frames.astype("<i8").view(np.uint8).reshape(-1, 8)[:, :sample_width].tobytes()
+    return PcmClip(data, channels, sample_width, FRAME_RATE)
+
+
+def loudest_row(levels) -> int:
+    return int(np.argmax(levels.sum(axis=1)))
+
+
+@pytest.mark.parametrize("sample_width, channels", [(1, 1), (2, 1), (2, 2), (3, 1), (4, 2)])
+def test_a_tone_is_drawn_at_its_frequency_in_every_sample_format(sample_width, channels):
+    levels = compute_spectrogram(tone_clip(4000, sample_width, channels))
+    assert levels.shape == (HEIGHT, WIDTH) and levels.dtype == np.uint8
+    expected_row = HEIGHT - 1 - int(4000 / MAX_FREQUENCY * HEIGHT)  # low frequencies last
+    assert abs(loudest_row(levels) - expected_row) <= 1
+
+
+def test_silence_and_short_clips_are_blank():
+    silent = PcmClip(b"\0\0" * FRAME_RATE, 1, 2, FRAME_RATE)
+    assert compute_spectrogram(silent).max() == 0
+    short = PcmClip(b"\x80" * 100, 1, 1, FRAME_RATE)
+    assert compute_spectrogram(short).max() == 0
+
+
+def test_ppm_is_colored_from_white_to_black():
+    levels = np.array([[0, 255]], dtype=np.uint8)
+    assert render_ppm(levels) == b"P6 2 1 255\n" + bytes([255, 255, 255, 0, 0, 0])
+
+
+class FakeSound:
+    xc_id = "XC1"
+
+    def __init__(self):
+        self.downloads = 0
+
+    def download_sound_file(self):
+        self.downloads += 1
+        return tone_clip(2000)
+
+
+def test_spectrogram_of_a_sound_is_rendered_once(monkeypatch):
+    import spectrogram
+    from audio_cache import DecodedAudioCache
+
+    monkeypatch.setattr(spectrogram, "spectrogram_cache", DecodedAudioCache(max_bytes=1 << 20, sizeof=len))
+    sound = FakeSound()
+    image = sound_spectrogram(sound)
+    assert image.startswith(f"P6 {WIDTH} {HEIGHT} 255\n".encode())
+    assert sound_spectrogram(sound) is image
+    assert sound.downloads == 1
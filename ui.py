@@ -1,17 +1,29 @@
 import tkinter as tk
-from tkinter import messagebox
+from tkinter import messagebox, ttk
+import instrumentation
+from background import BackgroundWorker
+from spectrogram import spectrogram_cache
 
 window_width = 850
 window_height = 530
+CHOICE_COUNT = 4  # options of a multiple-choice question
+MAX_CLIP_RETRIES = 3  # automatic retries of a failed clip before the error is shown
 
 
 class QuizApp(tk.Tk):
-    def __init__(self, quiz, quiz_species):
+    def __init__(self, quiz, quiz_species=None, catalog_loader=None):
+        """
+        :param quiz: Quiz object holding the quiz state
+        :param quiz_species: SpeciesList of the quiz, if it has been loaded already
+        :param catalog_loader: function returning the SpeciesList, run in the background if quiz_species isn't given
+        """
         tk.Tk.__init__(self)
         self.title("Laillinen Lintupeli")
         self.geometry(f"{window_width}x{window_height}")
         self.quiz = quiz
         self.quiz_species = quiz_species
+        self.catalog_loader = catalog_loader
+        self.worker = BackgroundWorker(self)
 
         self.grid_columnconfigure(0, weight=29)
         self.grid_columnconfigure(1, weight=1)
@@ -21,8 +33,23 @@ class QuizApp(tk.Tk):
         self.display_title()
         self.display_quit_button()
         self._frame = None
+        if self.quiz_species is None:
+            self.load_catalog()
+        else:
+            self.switch_frame(StartPage)
+
+    def load_catalog(self):
+        self.switch_frame(LoadingPage)
+        self.worker.submit(self.catalog_loader, on_done=self.catalog_loaded, on_error=self.catalog_failed)
+
+    def catalog_loaded(self, quiz_species):
+        self.quiz_species = quiz_species
         self.switch_frame(StartPage)
 
+    def catalog_failed(self, error):
+        if isinstance(self._frame, LoadingPage):
+            self._frame.show_error(error)
+
     def display_title(self):
         title = tk.Label(self, text="Bird Quiz", bg="green", fg="white", font=("ariel", 20, "bold"))
         title.grid(row=0, column=0, columnspan=2, sticky="new")
@@ -34,6 +61,12 @@ class QuizApp(tk.Tk):
             text="Quit", font=("ariel", 16, " bold"))
         quit_button.grid(row=1, column=1, sticky="ne", pady=10, padx=10)
 
+    def destroy(self):
+        self.worker.shutdown()
+        self.quiz.stop_prefetch()
+        instrumentation.export_session()
+        tk.Tk.destroy(self)
+
     def switch_frame(self, frame_class):
         """Destroys current frame and replaces it with a new one."""
         new_frame = frame_class(self)
@@ -43,6 +76,27 @@ class QuizApp(tk.Tk):
         self._frame.grid(row=2, column=0, columnspan=2, sticky="nsew")
 
 
+class LoadingPage(tk.Frame):
+    def __init__(self, master):
+        tk.Frame.__init__(self, master)
+        self.grid_columnconfigure(0, weight=1)
+        self.grid_rowconfigure((0, 1, 2), weight=1)
+
+        self.message = tk.Label(self, text="Loading bird catalog...", font=("ariel", 20, "bold"))
+        self.message.grid(row=0, column=0, sticky="s")
+
+        self.progress = ttk.Progressbar(self, mode="indeterminate", length=300)
+        self.progress.grid(row=1, column=0)
+        self.progress.start(15)
+
+    def show_error(self, error):
+        self.progress.stop()
+        self.message.configure(text=f"Loading the bird catalog failed:\n{error}", fg="red")
+        retry_button = tk.Button(self, command=self.master.load_catalog, width=8,
+                                 text="Retry", font=("ariel", 16, "bold"))
+        retry_button.grid(row=2, column=0, sticky="n")
+
+
 class StartPage(tk.Frame):
     def __init__(self, master):
         tk.Frame.__init__(self, master)
@@ -55,6 +109,8 @@ class StartPage(tk.Frame):
         self.selected_difficulty = tk.IntVar()
         self.selected_quiz_length = tk.IntVar()
         self.wildcard_entry = tk.StringVar()
+        self.selected_tolerance = tk.IntVar(value=1)
+        self.multiple_choice = tk.BooleanVar(value=False)
 
         self.options = self.options_box()
         self.options.grid(row=1, column=0, sticky="nsew")
@@ -69,7 +125,7 @@ class StartPage(tk.Frame):
     def options_box(self):
         options_box = tk.Frame(self)
         options_box.grid_columnconfigure((0, 1), weight=1)
-        options_box.grid_rowconfigure((0, 1, 2), weight=1)
+        options_box.grid_rowconfigure((0, 1, 2, 3, 4), weight=1)
 
         diff_text = tk.Label(options_box, text="Difficulty:", font=("ariel", 15))
         diff_text.grid(row=0, column=0, sticky="nse")
@@ -94,12 +150,24 @@ class StartPage(tk.Frame):
         filter_bar = tk.Entry(options_box, textvariable=self.wildcard_entry)
         filter_bar.grid(row=2, column=1, sticky="w")
 
+        tolerance_text = tk.Label(options_box, text="Accepted typos:", font=("ariel", 15))
+        tolerance_text.grid(row=3, column=0, sticky="nse")
+        tolerance_slider = tk.Scale(options_box, variable=self.selected_tolerance, from_=0, to=2, orient=tk.HORIZONTAL)
+        tolerance_slider.grid(row=3, column=1, sticky="nsw")
+
+        choice_text = tk.Label(options_box, text="Multiple choice:", font=("ariel", 15))
+        choice_text.grid(row=4, column=0, sticky="nse")
+        choice_check = tk.Checkbutton(options_box, variable=self.multiple_choice)
+        choice_check.grid(row=4, column=1, sticky="nsw")
+
         return options_box
 
     def start_quiz(self):
         self.master.quiz.difficulty_level = self.selected_difficulty.get()
         self.master.quiz.quiz_length = self.selected_quiz_length.get()
         self.master.quiz.wildcard_pattern = self.wildcard_entry.get()
+        self.master.quiz.set_answer_tolerance(self.selected_tolerance.get())
+        self.master.quiz.set_multiple_choice(self.multiple_choice.get())
         print("Starting new quiz")
         print("Difficulty:", self.master.quiz.difficulty_level)
         print("Length:", self.master.quiz.quiz_length)
@@ -109,6 +177,7 @@ class StartPage(tk.Frame):
 
 
 class QuizPage(tk.Frame):
+    @instrumentation.timed("ui.blocked.quiz_page_init")
     def __init__(self, master):
         tk.Frame.__init__(self, master)
         self.quiz = self.master.quiz
@@ -120,37 +189,58 @@ class QuizPage(tk.Frame):
         self.grid_rowconfigure(1, weight=2)
 
         self.quiz_species = self.master.quiz_species
-        self.quiz.set_species_list(self.quiz_species)
+        self.worker = self.master.worker
+        self.clip_loading = False
+        self.clip_retries = 0
+        self.retry_button = None
 
-        self.quiz.difficulty_filter()
-        self.quiz.wildcard_filter()
-        self.quiz.length_filter()
-
-        self.quiz.next_species()
         self.button_frame = tk.Frame(self, background="lightgrey")
-        self.button_frame.grid_rowconfigure(0, weight=1)
+        self.button_frame.grid_rowconfigure((0, 1), weight=1)
         self.button_frame.grid_columnconfigure(0, weight=1, minsize=window_width / 2 / 4)
         self.button_frame.grid_columnconfigure(1, weight=4, minsize=window_width / 2 / 4 * 3)
         self.button_frame.grid(row=0, column=1, sticky="nsew")
 
-        self.sound_info = tk.Label(self.button_frame, background="lightgrey", text=self.get_recording_info_str(),
+        self.spectrogram = tk.Label(self.button_frame, background="lightgrey")
+        self.spectrogram.grid(row=0, column=1, sticky="w")
+        self.spectrogram_image = None  # Tk drops the image once no Python reference is left
+        self.shown_sound = None
+
+        self.sound_info = tk.Label(self.button_frame, background="lightgrey", text="",
                                    justify="left", anchor="w")
-        self.sound_info.grid(row=0, column=1, sticky="nsew")
+        self.sound_info.grid(row=1, column=0, columnspan=2, sticky="nsew", padx=10)
 
         self.play_pause_button = tk.Button(self.button_frame, text="\u25BA", width=3, height=3,
                                            font=("ariel", 20, "bold"),
                                            command=self.play_pause, pady=0, padx=0, background="lightgrey")
         self.play_pause_button.grid(row=0, column=0)
 
-        self.user_answer = tk.StringVar()
-        self.bar = tk.Entry(self, textvariable=self.user_answer, highlightbackground="white")
-        self.bar.grid(row=1, column=1, sticky="n")
-        self.bar.bind("<Return>", lambda event: self.submit_button())
-        self.bar.focus_set()
-
-        self.next_button = tk.Button(self, text="submit", command=self.submit_button,
-                                     width=8, bg="green", fg="green", font=("ariel", 16, "bold"))
-        self.next_button.grid(row=1, column=1, sticky="n", pady=40)
+        if self.quiz.multiple_choice:
+            self.choice_frame = tk.Frame(self)
+            self.choice_frame.grid(row=1, column=1, sticky="n")
+            self.choice_buttons = [tk.Button(self.choice_frame, width=22, font=("ariel", 14))
+                                   for _ in range(CHOICE_COUNT)]
+            for i, button in enumerate(self.choice_buttons):
+                button.grid(row=i // 2, column=i % 2, padx=5, pady=5)
+            self.answer_controls = self.choice_buttons
+            self.answer_widgets = [self.choice_frame]
+        else:
+            self.user_answer = tk.StringVar()
+            self.bar = tk.Entry(self, textvariable=self.user_answer, highlightbackground="white")
+            self.bar.grid(row=1, column=1, sticky="n")
+            self.bar.bind("<Return>", lambda event: self.submit_button())
+            self.bar.bind("<Tab>", self.accept_suggestion)
+            self.bar.focus_set()
+
+            self.suggestions = tk.Listbox(self, height=4, activestyle="none", takefocus=0)
+            self.suggestions.grid(row=1, column=1, sticky="n", pady=(100, 0))
+            self.suggestions.bind("<<ListboxSelect>>", self.accept_suggestion)
+            self.user_answer.trace_add("write", self.update_suggestions)
+
+            self.next_button = tk.Button(self, text="submit", command=self.submit_button,
+                                         width=8, bg="green", fg="green", font=("ariel", 16, "bold"))
+            self.next_button.grid(row=1, column=1, sticky="n", pady=40)
+            self.answer_controls = [self.next_button]
+            self.answer_widgets = [self.bar, self.suggestions, self.next_button]
 
         self.feedback = tk.Label(self, font=("ariel", 15, "bold"))
         self.feedback.grid(row=1, column=2, sticky="nw")
@@ -160,11 +250,79 @@ class QuizPage(tk.Frame):
         self.past_answer_symbols = tk.Label(self, text="", anchor="ne", justify="left", font=("ariel", 14))
         self.past_answer_symbols.grid(row=0, column=0, rowspan=2, sticky="nse", padx=50)
 
+        self.load_clip(self.prepare_quiz)
+
+    def prepare_quiz(self):
+        """Applies the quiz filters and loads the first clip. Runs on a worker thread."""
+        self.quiz.set_species_list(self.quiz_species)
+
+        self.quiz.difficulty_filter()
+        self.quiz.wildcard_filter()
+        self.quiz.length_filter()
+        self.quiz.start_prefetch()
+
+        return self.quiz.next_species()
+
+    def load_clip(self, load_func):
+        """Runs load_func on a worker thread and keeps the clip controls disabled until it has finished."""
+        self.set_clip_loading(True)
+        self.worker.submit(load_func, on_done=self.clip_ready, on_error=lambda e: self.clip_failed(e, load_func))
+
+    def set_clip_loading(self, loading: bool):
+        self.clip_loading = loading
+        state = tk.DISABLED if loading else tk.NORMAL
+        for control in [self.play_pause_button, *self.answer_controls]:
+            control.configure(state=state)
+        if loading:
+            self.sound_info.configure(text="Loading clip...")
+
+    def clip_ready(self, species_sound):
+        if not self.winfo_exists():
+            return
+        print(species_sound.xc_id)
+        self.clip_retries = 0
+        self.set_clip_loading(False)
+        self.show_sound(species_sound)
+        if self.quiz.multiple_choice:
+            self.update_choices()
+
+    def show_sound(self, species_sound):
+        self.shown_sound = species_sound
+        self.update_sound_info()
+        self.update_spectrogram(species_sound)
+
+    def clip_failed(self, error, load_func):
+        if not self.winfo_exists():
+            return
+        print(f"Loading clip failed: {error!r}")
+        if self.clip_retries < MAX_CLIP_RETRIES:
+            self.clip_retries += 1
+            self.sound_info.configure(text="Loading clip failed, retrying...")
+            self.after(2000, lambda: self.load_clip(load_func))
+            return
+        self.sound_info.configure(text=f"Loading clip failed:\n{error}", fg="red")
+        self.retry_button = tk.Button(self.button_frame, text="Retry", font=("ariel", 14, "bold"),
+                                      command=lambda: self.retry_clip(load_func))
+        self.retry_button.grid(row=1, column=1, sticky="e", padx=10)
+
+    def retry_clip(self, load_func):
+        self.retry_button.destroy()
+        self.retry_button = None
+        self.clip_retries = 0
+        self.sound_info.configure(fg="black")
+        self.load_clip(load_func)
+
     def submit_button(self):
+        self.submit_answer(self.user_answer.get())
+
+    @instrumentation.timed("ui.blocked.submit_button")
+    def submit_answer(self, user_answer: str):
+        if self.clip_loading:
+            return
         self.quiz.current_species.stop_current_sound()
         self.play_pause_button.configure(text="\u25BA")
 
-        normalized_answer = self.user_answer.get().lower().strip()
+        normalized_answer = user_answer.lower().strip()
         if self.quiz.check_answer(normalized_answer):
             self.feedback["fg"] = "green"
             self.feedback["text"] = ('\U0001F44D Yay! \n'
@@ -175,23 +333,43 @@ class QuizPage(tk.Frame):
                                      f'The right answer is:\n{self.quiz.current_species.correct_answers["comNameFI"]}')
 
         self.update_past_answers()
-        self.clear_text()
+        if not self.quiz.multiple_choice:
+            self.clear_text()
         if self.quiz.has_more_species():
-            self.quiz.next_species()
-            self.update_sound_info()
+            self.load_clip(self.quiz.next_species)
         else:
-            self.bar.destroy()
-            self.next_button.destroy()
+            self.quiz.stop_prefetch()
+            for widget in self.answer_widgets:
+                widget.destroy()
             self.display_results_button()
 
+    @instrumentation.timed("ui.blocked.play_pause")
     def play_pause(self):
+        if self.clip_loading:
+            return
         if self.quiz.current_species.current_sound.is_playing():
-            self.quiz.current_species.stop_current_sound()
+            self.quiz.current_species.pause_current_sound()
             self.play_pause_button.configure(text="\u25BA")
 
         else:
-            self.quiz.current_species.play_current_sound()
-            self.play_pause_button.configure(text="\u25FE")
+            species = self.quiz.current_species
+            self.play_pause_button.configure(text="\u23F8")
+            self.worker.submit(self.quiz.play_current_sound,
+                               on_done=lambda sound: self.playback_started(species, sound),
+                               on_error=lambda e: self.playback_failed(species, e))
+
+    def playback_started(self, species, species_sound):
+        if species is not self.quiz.current_species:  # the question changed while the clip was starting
+            species_sound.stop_sound()
+        elif species_sound is not self.shown_sound and self.winfo_exists():  # the clip couldn't be played
+            self.show_sound(species_sound)
+
+    def playback_failed(self, species, error):
+        print(f"Playing clip failed: {error!r}")
+        if species is not self.quiz.current_species or not self.winfo_exists():
+            return
+        self.play_pause_button.configure(text="\u25BA")
+        self.feedback.configure(fg="red", text="Playing the clip failed")
 
     def display_result(self):
         correct, wrong, score_percent = self.quiz.get_score()
@@ -211,6 +389,29 @@ class QuizPage(tk.Frame):
     def clear_text(self):
         self.bar.delete(0, 'end')
 
+    @instrumentation.timed("ui.blocked.suggestions")
+    def update_suggestions(self, *args):
+        """Refreshes the type-ahead list on every change of the answer, from the precomputed name index."""
+        self.suggestions.delete(0, tk.END)
+        for name in self.quiz.suggest_answers(self.user_answer.get(), limit=4):
+            self.suggestions.insert(tk.END, name)
+
+    def accept_suggestion(self, event=None):
+        selection = self.suggestions.curselection()
+        index = selection[0] if selection else 0
+        if self.suggestions.size() > index:
+            self.user_answer.set(self.suggestions.get(index))
+            self.bar.icursor(tk.END)
+            self.bar.focus_set()
+        return "break"
+
+    @instrumentation.timed("ui.blocked.answer_options")
+    def update_choices(self):
+        """Labels the option buttons with the current question's options, a lookup in the confusable species table."""
+        for button, species in zip(self.choice_buttons, self.quiz.answer_options(len(self.choice_buttons))):
+            name = species.correct_answers["comNameFI"]
+            button.configure(text=name.capitalize(), command=lambda answer=name: self.submit_answer(answer))
+
     def update_past_answers(self):
         past_answers = self.quiz.answers
         user_answers = [ans["correct_answers"][0] for ans in past_answers]
@@ -218,6 +419,13 @@ class QuizPage(tk.Frame):
         self.past_answer_symbols.config(text="\n".join(symbols))
         self.past_answers.config(text="\n".join(user_answers))
 
+    @instrumentation.timed("ui.blocked.spectrogram")
+    def update_spectrogram(self, species_sound):
+        """Shows the spectrogram the quiz rendered on the loading thread, nothing if there is none."""
+        image_data = spectrogram_cache.get(species_sound.xc_id)
+        self.spectrogram_image = tk.PhotoImage(data=image_data, format="PPM") if image_data else None
+        self.spectrogram.configure(image=self.spectrogram_image or "")
+
     def update_sound_info(self):
         self.sound_info.configure(text=self.get_recording_info_str())
 